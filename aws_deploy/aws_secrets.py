@@ -39,4 +39,10 @@ def get_secrets(key):
             print(f"Failed to retrieve secrets: {str(e)}")
             raise e
 
-    return get_secrets._cached_secrets.get(key)
\ No newline at end of file
+    return get_secrets._cached_secrets.get(key)
+
+
+def clear_secrets_cache():
+    """Forget secrets cached from AWS Secrets Manager so the next lookup fetches them again"""
+    if hasattr(get_secrets, '_cached_secrets'):
+        del get_secrets._cached_secrets
@@ -5,14 +5,21 @@ import time
 from datetime import datetime
 from dotenv import load_dotenv
 from src.agent import chat_with_memory
+from src.cancellation import TurnCancelled, cancellation_enabled, carried_over_text, get_turn_registry
+from src.circuit_breaker import get_circuit_breaker, langfuse_listener
+from src.coalesce import MessageCoalescer
+from src.dedup import get_event_deduplicator
+from src.dispatch import get_dispatcher
+from src.lanes import choose_lane
+from src.rate_limit import get_admission_controller
+from src.response_cache import get_response_cache, replay
+from src.runtime import get_agent_runtime
+from src.slack_streaming import SlackStreamer, streaming_enabled
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from aws_deploy.aws_secrets import get_secrets
 from langfuse import Langfuse
 
-# Set to track recently processed messages to avoid duplicates
-processed_messages = set()
-
 # Load environment variables
 #load_dotenv()
 
@@ -28,6 +35,241 @@ langfuse = Langfuse(
     public_key=get_secrets("LANGFUSE_PUBLIC_KEY"),
     host=get_secrets("LANGFUSE_HOST")
 )
+# Model backend outages (circuit breaker state changes) show up in Langfuse
+get_circuit_breaker().add_listener(langfuse_listener(langfuse))
+
+def respond(event, say, trace, entries=(), handle=None, superseded=()):
+    """
+    Answer a DM or App Home message in its thread, streaming the reply as it is written.
+
+    event may stand for several coalesced messages (their timestamps in coalesced_ts).
+    entries (from the response cache, one per message) receive the reply and whether it
+    was delivered, so a redelivery of any of the messages can reuse it.
+    handle (from the turn registry) is cancelled if a newer message arrives in the thread
+    first; superseded are the older turns this message cancelled, whose text is answered
+    here instead.
+    """
+    if handle is None:
+        return _respond(event, say, trace, entries)
+    try:
+        if handle.cancel.is_set():
+            # Superseded while still queued: the newer turn answers this message too
+            handle.cancelled = True
+            trace.event(name="turn_cancelled", level="WARNING", message="superseded_before_start")
+            fail_entries(entries, TurnCancelled("superseded before start"))
+            return
+        handle.text = carried_over_text(superseded, event.get("text", ""))
+        if handle.text != event.get("text", ""):
+            event = dict(event, text=handle.text)
+        _respond(event, say, trace, entries, handle)
+    finally:
+        get_turn_registry().finish(handle)
+
+
+def _respond(event, say, trace, entries=(), handle=None):
+    channel_id = event.get("channel")
+    message_ts = event.get("ts")
+    
+    # Add eyes emoji reaction to show we're processing
+    for ts in event.get("coalesced_ts") or [message_ts]:
+        try:
+            client.reactions_add(
+                channel=channel_id,
+                name="eyes",
+                timestamp=ts
+            )
+        except SlackApiError as e:
+            print(f"Error adding reaction: {e}")
+    
+    # Always respond in a thread
+    # If message is already in a thread, use that thread_ts
+    # If not, create a new thread using the message's ts
+    thread_ts_to_use = event.get("thread_ts") or message_ts
+    
+    # Generate a response using the agent
+    # Use thread_ts_to_use to ensure each thread has its own conversation memory
+    thread_id = f"slack-{channel_id}-{thread_ts_to_use}"
+    streamer = None
+    cancel = handle.cancel if handle is not None else None
+    try:
+        if streaming_enabled():
+            # Post a placeholder now and edit it as tokens arrive
+            streamer = SlackStreamer(client, channel_id, thread_ts_to_use).start()
+            response = chat_with_memory(
+                event.get("text", ""), thread_id=thread_id, on_partial=streamer.update, cancel=cancel
+            )
+        else:
+            response = chat_with_memory(event.get("text", ""), thread_id=thread_id, cancel=cancel)
+    except TurnCancelled as e:
+        # A newer message in the thread took over; nothing of this turn was saved
+        handle.cancelled = True
+        remove_reactions(event)
+        if streamer is not None:
+            streamer.cancel()
+        print(f"Cancelled superseded turn in thread {thread_id}")
+        trace.event(
+            name="turn_cancelled",
+            level="WARNING",
+            message="superseded_by_newer_message",
+            metadata={"thread_id": thread_id, "elapsed_seconds": time.monotonic() - handle.started_at}
+        )
+        fail_entries(entries, e)
+        return
+    
+    # Remove eyes emoji reaction before sending response
+    remove_reactions(event)
+    
+    try:
+        if streamer is not None:
+            total_seconds = streamer.finish(response)
+            trace.event(
+                name="first_token_visible",
+                level="DEFAULT",
+                message="time_to_first_token",
+                metadata={"ttft_seconds": streamer.ttft, "total_seconds": total_seconds, "updates": streamer.updates}
+            )
+            delivered = streamer.delivered
+        else:
+            say(text=response, channel=channel_id, thread_ts=thread_ts_to_use)
+            delivered = True
+        for entry in entries:
+            if delivered:
+                entry.mark_delivered()
+    finally:
+        # Only now may redeliveries look at the entries, so they never post a reply twice
+        for entry in entries:
+            entry.complete(response)
+    
+    print(f"Response sent to channel {channel_id}")
+    
+    trace.event(
+        name="response_sent",
+        level="DEFAULT",
+        message="agent_response"
+    )
+
+
+def remove_reactions(event):
+    for ts in event.get("coalesced_ts") or [event.get("ts")]:
+        try:
+            client.reactions_remove(
+                channel=event.get("channel"),
+                name="eyes",
+                timestamp=ts
+            )
+        except SlackApiError as e:
+            print(f"Error removing reaction: {e}")
+
+
+def thread_key(event):
+    """The Slack thread a message is answered in; its turns run one at a time, in order"""
+    return f"{event.get('channel')}:{event.get('thread_ts') or event.get('ts')}"
+
+
+def conversation_key(event):
+    """Messages with the same key are coalesced: a Slack thread, or one user's top-level DMs"""
+    if event.get("thread_ts"):
+        return f"{event.get('channel')}:{event.get('thread_ts')}"
+    return f"{event.get('channel')}:top-level:{event.get('user')}"
+
+
+def coalesce(event, say, trace):
+    """Hold the message for the debounce window so a burst is answered by one agent run"""
+    # Created now so a redelivery during the window attaches to the coming reply
+    entry = get_response_cache().start(f"{event.get('channel')}:{event.get('ts')}")
+    superseded = []
+    if event.get("thread_ts") and cancellation_enabled():
+        # A newer message in the thread makes any answer still being written stale
+        superseded = get_turn_registry().supersede(thread_key(event))
+        for handle in superseded:
+            trace.event(name="superseded_turn", level="DEFAULT", message=f"cancelled turn in {handle.key}")
+    coalescer.add(conversation_key(event), (event, say, trace, entry, superseded))
+
+
+def dispatch(batch):
+    """Queue the reply to a batch of messages on a worker; the listener has already returned"""
+    event, say, trace, _, _ = batch[0]
+    entries = [entry for _, _, _, entry, _ in batch]
+    superseded = [handle for *_, handles in batch for handle in handles]
+    if len(batch) > 1:
+        # One human turn for the whole burst, answered in the first message's thread
+        event = dict(
+            event,
+            text="\n\n".join(e.get("text", "") for e, *_ in batch),
+            coalesced_ts=[e.get("ts") for e, *_ in batch]
+        )
+        for _, _, other_trace, _, _ in batch[1:]:
+            other_trace.event(name="coalesced", level="DEFAULT", message=f"merged into {event.get('ts')}")
+        print(f"Coalesced {len(batch)} messages into one turn in channel {event.get('channel')}")
+    
+    # Messages in the same Slack thread are answered one at a time, in order
+    key = thread_key(event)
+    handle = get_turn_registry().start(key, event.get("text", ""))
+    
+    # Each user, and the bot as a whole, may only start so many turns a minute
+    delay = get_admission_controller().admit(
+        event.get("user"), lambda: submit_turn(batch, event, say, trace, entries, handle, superseded)
+    )
+    if delay is None:
+        get_turn_registry().finish(handle)
+        print(f"Rate limit queue full, rejecting message {event.get('channel')}:{event.get('ts')}")
+        trace.event(name="rate_limited", level="WARNING", message="admission_queue_full")
+        reject(batch, "You're sending messages faster than I can answer. Please try again in a few minutes.")
+    elif delay > 0:
+        # Over the limit: the turn waits its turn instead of failing
+        print(f"Rate limited, queueing message {event.get('channel')}:{event.get('ts')} for {delay:.1f}s")
+        trace.event(name="rate_limit_queued", level="DEFAULT", message="admission_queued", metadata={"delay_seconds": delay})
+        try:
+            client.chat_postMessage(
+                channel=event.get("channel"),
+                thread_ts=event.get("thread_ts") or event.get("ts"),
+                text=f":hourglass: You're in the queue. I'll start on this in about {max(1, round(delay))} seconds."
+            )
+        except SlackApiError as e:
+            print(f"Error sending queued notice: {e}")
+
+
+def submit_turn(batch, event, say, trace, entries, handle, superseded):
+    key = thread_key(event)
+    # Likely PIP document generation runs in the bulk lane, away from quick turns
+    lane = choose_lane(f"slack-{event.get('channel')}-{event.get('thread_ts') or event.get('ts')}", event.get("text", ""))
+    trace.event(name="lane_assigned", level="DEFAULT", message=lane)
+    job = get_dispatcher().submit(key, respond, event, say, trace, entries, handle, superseded, lane=lane)
+    if job is not None:
+        job.add_done_callback(lambda f: fail_entries(entries, f.exception()))
+    else:
+        get_turn_registry().finish(handle)
+        # The queue stayed full: say so rather than leave the message unanswered
+        print(f"Job queue full, rejecting message {event.get('channel')}:{event.get('ts')}")
+        trace.event(name="queue_full", level="WARNING", message="job_queue_full")
+        reject(batch, "I'm handling a lot of requests right now. Please try again in a minute.")
+
+
+def reject(batch, text):
+    """Tell the user a turn was not taken on, and let redeliveries of it try again"""
+    event = batch[0][0]
+    for e, *_ in batch:
+        get_response_cache().discard(f"{e.get('channel')}:{e.get('ts')}")
+    try:
+        client.chat_postMessage(
+            channel=event.get("channel"),
+            thread_ts=event.get("thread_ts") or event.get("ts"),
+            text=text
+        )
+    except SlackApiError as e:
+        print(f"Error sending busy notice: {e}")
+
+
+def fail_entries(entries, exception):
+    """A job that dies before producing a reply must not leave redeliveries waiting"""
+    if exception is not None:
+        for entry in entries:
+            entry.fail(exception)
+
+
+# Rapid-fire messages in a conversation are merged into one turn (SLACK_DEBOUNCE_SECONDS)
+coalescer = MessageCoalescer(lambda key, batch: dispatch(batch))
+
 
 @app.event("app_mention")
 def handle_app_mention_events(body, say):
@@ -42,14 +284,15 @@ def handle_app_mention_events(body, say):
     # Create a unique identifier for this message
     message_id = f"{channel_id}:{message_ts}"
     
-    # Skip if we've already processed this message
-    if message_id in processed_messages:
+    # Skip if we've already processed this message (here, before a restart, or on another replica)
+    if not get_event_deduplicator().claim(message_id):
+        # A redelivery of a message answered by this process reuses that answer
+        entry = get_response_cache().get(message_id)
+        if entry is not None:
+            replay(entry, lambda text: say(text=text, channel=channel_id, thread_ts=event.get("thread_ts") or message_ts))
         print(f"Skipping already processed message: {message_id}")
         return
     
-    # Add to processed messages
-    processed_messages.add(message_id)
-    
     # Get thread_ts if the message is part of a thread
     thread_ts = event.get("thread_ts")
     
@@ -70,45 +313,7 @@ def handle_app_mention_events(body, say):
     # Only respond to DMs (im) or App Home
     channel_type = event.get("channel_type")
     if channel_type == "im" or channel_type == "app_home":
-        # Add eyes emoji reaction to show we're processing
-        message_ts = event.get("ts")
-        try:
-            client.reactions_add(
-                channel=channel_id,
-                name="eyes",
-                timestamp=message_ts
-            )
-        except SlackApiError as e:
-            print(f"Error adding reaction: {e}")
-        # Always respond in a thread
-        # If message is already in a thread, use that thread_ts
-        # If not, create a new thread using the message's ts
-        thread_ts_to_use = thread_ts if thread_ts else event.get("ts")
-        
-        # Generate a response using the agent
-        # Use thread_ts_to_use to ensure each thread has its own conversation memory
-        thread_id = f"slack-{channel_id}-{thread_ts_to_use}"
-        response = chat_with_memory(message_text, thread_id=thread_id)
-        
-        # Remove eyes emoji reaction before sending response
-        try:
-            client.reactions_remove(
-                channel=channel_id,
-                name="eyes",
-                timestamp=message_ts
-            )
-        except SlackApiError as e:
-            print(f"Error removing reaction: {e}")
-            
-        say(text=response, channel=channel_id, thread_ts=thread_ts_to_use)
-        
-        print(f"Response sent to channel {channel_id}")
-        
-        trace.event(
-            name="response_sent",
-            level="DEFAULT",
-            message="agent_response"
-        )
+        coalesce(event, say, trace)
     else:
         # Log that we're not responding to this channel type
         print(f"Not responding to mention in channel type: {channel_type}")
@@ -131,14 +336,15 @@ def handle_message_events(body, say):
     # Create a unique identifier for this message
     message_id = f"{channel_id}:{message_ts}"
     
-    # Skip if we've already processed this message
-    if message_id in processed_messages:
+    # Skip if we've already processed this message (here, before a restart, or on another replica)
+    if not get_event_deduplicator().claim(message_id):
+        # A redelivery of a message answered by this process reuses that answer
+        entry = get_response_cache().get(message_id)
+        if entry is not None:
+            replay(entry, lambda text: say(text=text, channel=channel_id, thread_ts=event.get("thread_ts") or message_ts))
         print(f"Skipping already processed message: {message_id}")
         return
     
-    # Add to processed messages
-    processed_messages.add(message_id)
-    
     # Get thread_ts if the message is part of a thread
     thread_ts = event.get("thread_ts")
     
@@ -163,46 +369,7 @@ def handle_message_events(body, say):
         if event.get("bot_id"):
             return
             
-        # Add eyes emoji reaction to show we're processing
-        message_ts = event.get("ts")
-        try:
-            client.reactions_add(
-                channel=channel_id,
-                name="eyes",
-                timestamp=message_ts
-            )
-        except SlackApiError as e:
-            print(f"Error adding reaction: {e}")
-            
-        # Always respond in a thread
-        # If message is already in a thread, use that thread_ts
-        # If not, create a new thread using the message's ts
-        thread_ts_to_use = thread_ts if thread_ts else event.get("ts")
-        
-        # Generate a response using the agent
-        # Use thread_ts_to_use to ensure each thread has its own conversation memory
-        thread_id = f"slack-{channel_id}-{thread_ts_to_use}"
-        response = chat_with_memory(message_text, thread_id=thread_id)
-        
-        # Remove eyes emoji reaction before sending response
-        try:
-            client.reactions_remove(
-                channel=channel_id,
-                name="eyes",
-                timestamp=message_ts
-            )
-        except SlackApiError as e:
-            print(f"Error removing reaction: {e}")
-            
-        say(text=response, channel=channel_id, thread_ts=thread_ts_to_use)
-        
-        print(f"Response sent to channel {channel_id}")
-        
-        trace.event(
-            name="response_sent",
-            level="DEFAULT",
-            message="agent_response"
-        )
+        coalesce(event, say, trace)
     else:
         # Log that we're not responding to this channel type
         print(f"Not responding to message in channel type: {channel_type}")
@@ -218,9 +385,11 @@ if __name__ == "__main__":
     print("Starting Leo PIP Agent bot...")
     print("Bot will only respond to DMs and App Home, not in channels")
     
-    # Limit the size of the processed_messages set to avoid memory issues
-    # This will be enough to prevent duplicates within a reasonable time window
-    MAX_PROCESSED_MESSAGES = 1000
+    # Build the model, tools and agent graph once before accepting events
+    get_agent_runtime().warm_up()
+    
+    # Start the workers that run the agent off Bolt's listener threads
+    get_dispatcher()
     
     # Replace app.start() with SocketModeHandler
     handler = SocketModeHandler(
@@ -0,0 +1,265 @@
+"""
+Asyncio Slack entry point.
+
+Same behaviour as main.py, but built on Bolt's AsyncApp: each message is a coroutine
+awaiting achat_with_memory, so a single process can keep hundreds of conversations in
+flight without an OS thread per request.
+
+    python main_async.py
+"""
+
+import asyncio
+import time
+
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk.errors import SlackApiError
+from langfuse import Langfuse
+
+from src.agent import achat_with_memory
+from src.cancellation import TurnCancelled, cancellation_enabled, carried_over_text, get_turn_registry
+from src.circuit_breaker import get_circuit_breaker, langfuse_listener
+from src.dedup import get_event_deduplicator
+from src.rate_limit import get_admission_controller
+from src.response_cache import areplay, get_response_cache
+from src.runtime import get_agent_runtime
+from src.slack_streaming import AsyncSlackStreamer, streaming_enabled
+from aws_deploy.aws_secrets import get_secrets
+
+slack_token = get_secrets("SLACK_BOT_TOKEN")
+app = AsyncApp(token=slack_token)
+
+# Initialize Langfuse
+langfuse = Langfuse(
+    secret_key=get_secrets("LANGFUSE_SECRET_KEY"),
+    public_key=get_secrets("LANGFUSE_PUBLIC_KEY"),
+    host=get_secrets("LANGFUSE_HOST")
+)
+# Model backend outages (circuit breaker state changes) show up in Langfuse
+get_circuit_breaker().add_listener(langfuse_listener(langfuse))
+
+
+async def respond(event, client, say, trace):
+    """
+    Answer a DM or App Home message in its thread.
+
+    A message in a thread cancels the turns still answering older messages there (their
+    tasks are cancelled outright) and answers their text along with its own.
+    """
+    channel_id = event.get("channel")
+    message_ts = event.get("ts")
+    # Created before the first await, so a redelivery always finds it
+    entry = get_response_cache().start(f"{channel_id}:{message_ts}")
+
+    handle, superseded = None, []
+    if event.get("thread_ts") and cancellation_enabled():
+        registry = get_turn_registry()
+        key = f"{channel_id}:{event.get('thread_ts')}"
+        superseded = registry.supersede(key)
+        handle = registry.start(key, event.get("text", ""))
+    turn = asyncio.create_task(_respond(event, client, say, trace, entry, handle, superseded))
+    if handle is not None:
+        handle.task = turn
+    try:
+        await turn
+    finally:
+        if handle is not None:
+            registry.finish(handle)
+
+
+async def _respond(event, client, say, trace, entry, handle, superseded):
+    channel_id = event.get("channel")
+    message_ts = event.get("ts")
+    streamer = None
+    try:
+        # Each user, and the bot as a whole, may only start so many turns a minute
+        controller = get_admission_controller()
+        delay = controller.reserve_user(event.get("user"))
+        if delay is None:
+            print(f"Rate limit queue full, rejecting message {channel_id}:{message_ts}")
+            trace.event(name="rate_limited", level="WARNING", message="admission_queue_full")
+            get_response_cache().discard(f"{channel_id}:{message_ts}")
+            entry.fail(RuntimeError("rate limited"))
+            await _notify(client, event, "You're sending messages faster than I can answer. Please try again in a few minutes.")
+            return
+        if delay > 0:
+            # Over the limit: the turn waits its turn instead of failing
+            trace.event(name="rate_limit_queued", level="DEFAULT", message="admission_queued", metadata={"delay_seconds": delay})
+            await _notify(client, event, f":hourglass: You're in the queue. I'll start on this in about {max(1, round(delay))} seconds.")
+            await asyncio.sleep(delay)
+        # Only take a global token once this user's is due, so queued turns don't hold them
+        await asyncio.sleep(controller.reserve_global())
+
+        if superseded:
+            # Let the cancelled turns clean up (and forget their checkpoints) first
+            await asyncio.wait([h.task for h in superseded if h.task is not None])
+            text = carried_over_text(superseded, event.get("text", ""))
+            handle.text = text
+            event = dict(event, text=text)
+
+        # Add eyes emoji reaction to show we're processing
+        try:
+            await client.reactions_add(channel=channel_id, name="eyes", timestamp=message_ts)
+        except SlackApiError as e:
+            print(f"Error adding reaction: {e}")
+
+        # Always respond in a thread, and give each thread its own conversation memory
+        thread_ts_to_use = event.get("thread_ts") or message_ts
+        thread_id = f"slack-{channel_id}-{thread_ts_to_use}"
+        cancel = handle.cancel if handle is not None else None
+        if streaming_enabled():
+            # Post a placeholder now and edit it as tokens arrive
+            streamer = await AsyncSlackStreamer(client, channel_id, thread_ts_to_use).start()
+            response = await achat_with_memory(
+                event.get("text", ""), thread_id=thread_id, on_partial=streamer.update, cancel=cancel
+            )
+        else:
+            response = await achat_with_memory(event.get("text", ""), thread_id=thread_id, cancel=cancel)
+    except (TurnCancelled, asyncio.CancelledError) as e:
+        if handle is None or not handle.cancel.is_set():
+            # Cancelled from outside (e.g. shutdown), not by a newer message
+            entry.fail(e)
+            raise
+        # A newer message in the thread took over; nothing of this turn was saved
+        handle.cancelled = True
+        try:
+            await client.reactions_remove(channel=channel_id, name="eyes", timestamp=message_ts)
+        except SlackApiError as error:
+            print(f"Error removing reaction: {error}")
+        if streamer is not None:
+            await streamer.cancel()
+        print(f"Cancelled superseded turn in channel {channel_id}")
+        trace.event(
+            name="turn_cancelled",
+            level="WARNING",
+            message="superseded_by_newer_message",
+            metadata={"channel_id": channel_id, "elapsed_seconds": time.monotonic() - handle.started_at}
+        )
+        entry.fail(TurnCancelled("superseded by a newer message"))
+        return
+    except Exception as e:
+        entry.fail(e)
+        raise
+
+    # Remove eyes emoji reaction before sending response
+    try:
+        await client.reactions_remove(channel=channel_id, name="eyes", timestamp=message_ts)
+    except SlackApiError as e:
+        print(f"Error removing reaction: {e}")
+
+    try:
+        if streamer is not None:
+            total_seconds = await streamer.finish(response)
+            trace.event(
+                name="first_token_visible",
+                level="DEFAULT",
+                message="time_to_first_token",
+                metadata={"ttft_seconds": streamer.ttft, "total_seconds": total_seconds, "updates": streamer.updates}
+            )
+            delivered = streamer.delivered
+        else:
+            await say(text=response, channel=channel_id, thread_ts=thread_ts_to_use)
+            delivered = True
+        if delivered:
+            entry.mark_delivered()
+    finally:
+        # Only now may redeliveries look at the entry, so they never post a reply twice
+        entry.complete(response)
+    print(f"Response sent to channel {channel_id}")
+    trace.event(name="response_sent", level="DEFAULT", message="agent_response")
+
+
+async def _notify(client, event, text):
+    try:
+        await client.chat_postMessage(
+            channel=event.get("channel"), thread_ts=event.get("thread_ts") or event.get("ts"), text=text
+        )
+    except SlackApiError as e:
+        print(f"Error sending notice: {e}")
+
+
+async def is_duplicate(event, say):
+    message_id = f"{event.get('channel')}:{event.get('ts')}"
+    # The dedup backend may do I/O (SQLite or Redis), so keep it off the event loop
+    if not await asyncio.to_thread(get_event_deduplicator().claim, message_id):
+        print(f"Skipping already processed message: {message_id}")
+        # A redelivery of a message answered by this process reuses that answer
+        entry = get_response_cache().get(message_id)
+        if entry is not None:
+            thread_ts = event.get("thread_ts") or event.get("ts")
+            await areplay(entry, lambda text: say(text=text, channel=event.get("channel"), thread_ts=thread_ts))
+        return True
+    return False
+
+
+@app.event("app_mention")
+async def handle_app_mention_events(body, client, say):
+    """Handle when the bot is mentioned"""
+    event = body.get("event", {})
+    if await is_duplicate(event, say):
+        return
+    trace = langfuse.trace(
+        name="app_mention",
+        user_id=event.get("user"),
+        metadata={"channel_id": event.get("channel"), "in_thread": event.get("thread_ts") is not None}
+    )
+    print(f"Mention received from user {event.get('user')} in channel {event.get('channel')}")
+
+    # Only respond to DMs (im) or App Home
+    channel_type = event.get("channel_type")
+    if channel_type == "im" or channel_type == "app_home":
+        await respond(event, client, say, trace)
+    else:
+        print(f"Not responding to mention in channel type: {channel_type}")
+        trace.event(
+            name="no_response_channel_type",
+            level="DEFAULT",
+            message=f"Not responding to channel type: {channel_type}"
+        )
+
+
+@app.event("message")
+async def handle_message_events(body, client, say):
+    """Handle direct messages to the bot"""
+    event = body.get("event", {})
+    if await is_duplicate(event, say):
+        return
+    print(f"Message received: '{event.get('text', '')}' from user {event.get('user')} in channel {event.get('channel')}")
+    trace = langfuse.trace(
+        name="direct_message",
+        user_id=event.get("user"),
+        metadata={
+            "channel_id": event.get("channel"),
+            "message_text": event.get("text", ""),
+            "in_thread": event.get("thread_ts") is not None
+        }
+    )
+
+    # Only respond to DMs (im) or App Home, and never to bots
+    channel_type = event.get("channel_type")
+    if channel_type == "im" or channel_type == "app_home":
+        if event.get("bot_id"):
+            return
+        await respond(event, client, say, trace)
+    else:
+        print(f"Not responding to message in channel type: {channel_type}")
+        trace.event(
+            name="no_response_channel_type",
+            level="DEFAULT",
+            message=f"Not responding to channel type: {channel_type}"
+        )
+
+
+async def main():
+    print("Starting Leo PIP Agent bot (asyncio)...")
+    print("Bot will only respond to DMs and App Home, not in channels")
+
+    # Build the model, tools and agent graph once before accepting events
+    get_agent_runtime().warm_up()
+
+    handler = AsyncSocketModeHandler(app, get_secrets("SLACK_APP_TOKEN"))
+    await handler.start_async()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -99,6 +99,7 @@ agent_system_message = """
             - After collecting improvement plan information for all performance gaps, use the support_resources_identifier tool to start gathering information about support resources for the first performance gap.
             - When the user responds to a question about support resources, ALWAYS use the support_resources_identifier tool to analyze the input, provide feedback on that specific input, and then ask about the next performance gap.
             - After collecting support resources information for all performance gaps, use the comprehensive_pip_generator tool to generate the final PIP document.
+            - When calling the first four tools, pass the user's latest message and the question it answers as input_text. Do NOT paste the whole conversation: each tool is given the PIP record of the answers collected so far.
             - NEVER try to gather information yourself by asking multiple questions at once.
             - ALWAYS defer to the tools for gathering information.
             - CRITICAL PRIVACY RULE: NEVER include or repeat the employee's name (first name, last name, or full name) in your responses during the conversation, even if you've collected this information. Instead, use generic terms like "the employee" or "this individual" when referring to them.
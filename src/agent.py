@@ -1,135 +1,208 @@
-import os
-import json
-from pathlib import Path
-from langgraph.prebuilt import create_react_agent
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
+import asyncio
+import weakref
+from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
 
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from prompts.agent_system_prompt import agent_system_message
-
-from aws_deploy.aws_secrets import get_secrets
-# Import tools
-from tools.employee_info_extractor import EmployeeInfoExtractorTool
-from tools.performance_gap_analyzer import PerformanceGapAnalyzerTool
-from tools.improvement_plan_analyzer import ImprovementPlanAnalyzerTool
-from tools.support_resources_identifier import SupportResourcesIdentifierTool
-from tools.comprehensive_pip_generator import ComprehensivePIPGeneratorTool
+from src.cancellation import TurnCancelled
+from src.circuit_breaker import DEGRADED_REPLY, caused_by_open_circuit, get_circuit_breaker
+from src.runtime import get_agent_runtime
+# Conversation history lives in a pluggable store (SQLite by default, see MEMORY_BACKEND)
+from src.memory_store import ConcurrentUpdateError, get_conversation_store
+from src.metrics import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Define memory file path for persistence
-MEMORY_DIR = Path("./memory")
-MEMORY_DIR.mkdir(exist_ok=True)
-MEMORY_FILE = MEMORY_DIR / "conversation_memory.json"
-
 def load_conversation_memory(thread_id):
-    """Load conversation memory from file if it exists"""
-    if MEMORY_FILE.exists():
-        try:
-            with open(MEMORY_FILE, "r") as f:
-                memory_data = json.load(f)
-                return memory_data.get(thread_id, {"messages": []})
-        except Exception as e:
-            print(f"Error loading memory: {e}")
+    """Load conversation memory for a single thread from the conversation store"""
+    try:
+        return get_conversation_store().load_thread(thread_id)
+    except Exception as e:
+        print(f"Error loading memory: {e}")
     return {"messages": []}
 
+def load_conversation_history(thread_id):
+    """Load a thread's history as LangChain messages along with its version"""
+    try:
+        return get_conversation_store().load_history(thread_id)
+    except Exception as e:
+        print(f"Error loading memory: {e}")
+    return [], None
+
 def save_conversation_memory(thread_id, memory_data):
-    """Save conversation memory to file"""
-    all_memory = {}
-    if MEMORY_FILE.exists():
-        try:
-            with open(MEMORY_FILE, "r") as f:
-                all_memory = json.load(f)
-        except Exception as e:
-            print(f"Error reading existing memory: {e}")
-    
-    all_memory[thread_id] = memory_data
-    
+    """Replace the stored conversation memory for a single thread"""
     try:
-        with open(MEMORY_FILE, "w") as f:
-            json.dump(all_memory, f, indent=2)
+        get_conversation_store().save_thread(thread_id, memory_data)
     except Exception as e:
         print(f"Error saving memory: {e}")
 
-def chat_with_memory(user_input, thread_id="default"):
-    """Chat with the agent using persistent memory"""
-    # Initialize model using ChatOpenAI with LiteLLM proxy
-    model = ChatOpenAI(
-        model=get_secrets("ANTHROPIC_MODEL"),  # Still use the Anthropic model name
-        api_key=get_secrets("API_KEY"),  # Use the Anthropic API key
-        base_url=get_secrets("BASE_URL"),  # Use the LiteLLM proxy URL
-        temperature=0.3
-    )
-    
-    # Initialize memory saver
-    memory = MemorySaver()
-    
-    # Initialize tools
-    employee_info_tool = EmployeeInfoExtractorTool()
-    performance_gap_tool = PerformanceGapAnalyzerTool()
-    improvement_plan_tool = ImprovementPlanAnalyzerTool()
-    support_resources_tool = SupportResourcesIdentifierTool()
-    comprehensive_pip_tool = ComprehensivePIPGeneratorTool()
-    tools = [employee_info_tool, performance_gap_tool, improvement_plan_tool, support_resources_tool, comprehensive_pip_tool]
-    
-    # Create agent with tools
-    agent_executor = create_react_agent(model, checkpointer=memory, tools=tools)
-    
-    # Load previous conversation if it exists
-    conversation = load_conversation_memory(thread_id)
+def append_conversation_memory(thread_id, messages, expected_version=None):
+    """Append new messages to a thread without rewriting its history"""
+    store = get_conversation_store()
+    try:
+        try:
+            return store.append_messages(thread_id, messages, expected_version=expected_version)
+        except ConcurrentUpdateError as e:
+            # Someone else wrote to the thread since we read it; keep both updates
+            print(f"Concurrent update detected: {e}")
+            return store.append_messages(thread_id, messages)
+    except Exception as e:
+        print(f"Error saving memory: {e}")
+
+def chat_with_memory(user_input, thread_id="default", on_partial=None, cancel=None):
+    """
+    Chat with the agent using persistent memory.
+
+    If on_partial is given, the reply is streamed and on_partial(text_so_far) is called
+    as tokens arrive; the full reply is still returned at the end. If cancel (a
+    threading.Event) is set while the turn runs, it stops with TurnCancelled and
+    nothing from it is saved. While the model backend's circuit breaker is open, the
+    turn is not run and DEGRADED_REPLY is returned at once.
+    """
+    if get_circuit_breaker().is_open():
+        return _degraded_turn(thread_id)
+    # Serialise turns on the same thread across worker threads and processes
+    with get_conversation_store().thread_lock(thread_id):
+        return _chat_turn(user_input, thread_id, on_partial, cancel)
+
+async def achat_with_memory(user_input, thread_id="default", on_partial=None, cancel=None):
+    """
+    Async version of chat_with_memory; waits on the LLM without holding an OS thread.
+
+    Cancelling the task (or setting cancel) abandons the turn without saving anything.
+    """
+    if get_circuit_breaker().is_open():
+        return _degraded_turn(thread_id)
+    # Coroutines on the same thread queue here; the cross-process lock is then polled
+    # rather than waited on, so waiting turns never tie up worker threads
+    async with _async_thread_lock(thread_id):
+        lock = get_conversation_store().thread_lock(thread_id)
+        await lock.acquire_async()
+        try:
+            return await _achat_turn(user_input, thread_id, on_partial, cancel)
+        finally:
+            lock.release()
+
+_async_locks = weakref.WeakValueDictionary()
+
+def _async_thread_lock(thread_id):
+    lock = _async_locks.get(thread_id)
+    if lock is None:
+        lock = _async_locks[thread_id] = asyncio.Lock()
+    return lock
+
+def _start_turn(runtime, user_input, thread_id):
+    """Load the thread and work out which messages the graph needs this turn"""
+    # Load previous conversation (already as LangChain messages when the thread is hot)
+    history, version = load_conversation_history(thread_id)
     
     # Add the new user message
-    conversation["messages"].append({"role": "human", "content": user_input})
+    new_messages = [HumanMessage(content=user_input)]
     
-    # Convert to LangChain message format
-    lc_messages = []
-    for msg in conversation["messages"]:
-        if msg["role"] == "human":
-            lc_messages.append(HumanMessage(content=msg["content"]))
-        elif msg["role"] == "ai":
-            lc_messages.append(AIMessage(content=msg["content"]))
+    # If the graph's checkpoint is in step with the store, it already holds the history
+    # (with tool calls and results) and only the new message needs sending. Otherwise
+    # (first turn, another replica wrote to the thread, checkpoint lost) reseed it.
+    if version is None or runtime.checkpoint_version(thread_id) != version:
+        runtime.forget_thread(thread_id)
+        new_messages = history + new_messages
+        metrics.incr("checkpoint.reseeds")
+    else:
+        metrics.incr("checkpoint.resumes")
+    return new_messages, version
+
+def _reply_text(response):
+    # Extract the AI's response
+    ai_message = response["messages"][-1].content
     
-    # Add a system message to help the agent better track conversation history
-    if lc_messages:
-        # Add a system message to remind the agent to check conversation history and use tools
-        system_message = agent_system_message
-        lc_messages.insert(0, SystemMessage(content=system_message))
+    # If AI message is empty, return a default message instead
+    if not ai_message:
+        ai_message = "I'm processing your request. Could you provide more details?"
+    return ai_message
+
+def _degraded_turn(thread_id):
+    # Nothing is saved, so the message can simply be sent again once the backend is back
+    metrics.incr("turns.degraded")
+    print(f"Model backend unavailable; not running turn in thread {thread_id}")
+    return DEGRADED_REPLY
+
+def _failed_turn(runtime, thread_id, e):
+    import traceback
+    # Don't resume from a half-finished graph run next turn
+    runtime.forget_thread(thread_id)
+    if caused_by_open_circuit(e) or get_circuit_breaker().is_open():
+        # The backend failed the turn (and tripped the breaker); say so rather than apologise
+        metrics.incr("turns.degraded")
+        print(f"Model backend unavailable during turn in thread {thread_id}")
+        return DEGRADED_REPLY
+    print(f"Error invoking agent: {e}")
+    # Format from the exception itself; this may run in a worker thread
+    print(f"Detailed error: {''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+    return "I apologize, but I encountered an error. Please try again."
+
+def _cancelled_turn(runtime, thread_id):
+    # The checkpoint may hold the abandoned run's tool calls; reseed from the store next turn
+    runtime.forget_thread(thread_id)
+    metrics.incr("turns.cancelled")
+    print(f"Turn cancelled in thread {thread_id}; nothing saved")
+
+def _finish_turn(thread_id, user_input, ai_message, version):
+    # Save only the new human/ai pair
+    append_conversation_memory(
+        thread_id,
+        [{"role": "human", "content": user_input}, {"role": "ai", "content": ai_message}],
+        expected_version=version
+    )
+
+def _chat_turn(user_input, thread_id, on_partial=None, cancel=None):
+    """Run one turn of the conversation (the thread lock must be held)"""
+    # Reuse the model, tools and compiled agent graph built once per process
+    runtime = get_agent_runtime()
+    new_messages, version = _start_turn(runtime, user_input, thread_id)
     
     try:
-        response = agent_executor.invoke(
-            {"messages": lc_messages},
-            {"configurable": {"thread_id": thread_id}}
+        # The system message and context window are applied inside the graph
+        response = runtime.invoke(
+            new_messages,
+            thread_id=thread_id,
+            store_version=None if version is None else version + 1,
+            on_partial=on_partial,
+            cancel=cancel
         )
-
-        
-        # Extract the AI's response
-        ai_message = response["messages"][-1].content
-        
-        # If AI message is empty, return a default message instead
-        if not ai_message:
-            ai_message = "I'm processing your request. Could you provide more details?"
-
+        ai_message = _reply_text(response)
+    except TurnCancelled:
+        _cancelled_turn(runtime, thread_id)
+        raise
     except Exception as e:
-        import traceback
-        print(f"Error invoking agent: {e}")
-        print(f"Detailed error: {traceback.format_exc()}")
-        ai_message = "I apologize, but I encountered an error. Please try again."
+        ai_message = _failed_turn(runtime, thread_id, e)
     
-    # Add the AI response to the conversation
-    conversation["messages"].append({"role": "ai", "content": ai_message})
+    _finish_turn(thread_id, user_input, ai_message, version)
+    return ai_message
+
+async def _achat_turn(user_input, thread_id, on_partial=None, cancel=None):
+    """Async version of _chat_turn; store reads and writes run in a worker thread"""
+    runtime = get_agent_runtime()
+    new_messages, version = await asyncio.to_thread(_start_turn, runtime, user_input, thread_id)
     
-    # Save the updated conversation
-    save_conversation_memory(thread_id, conversation)
+    try:
+        response = await runtime.ainvoke(
+            new_messages,
+            thread_id=thread_id,
+            store_version=None if version is None else version + 1,
+            on_partial=on_partial,
+            cancel=cancel
+        )
+        ai_message = _reply_text(response)
+    except (TurnCancelled, asyncio.CancelledError):
+        await asyncio.to_thread(_cancelled_turn, runtime, thread_id)
+        raise
+    except Exception as e:
+        ai_message = await asyncio.to_thread(_failed_turn, runtime, thread_id, e)
     
+    await asyncio.to_thread(_finish_turn, thread_id, user_input, ai_message, version)
     return ai_message
 
 # Example usage
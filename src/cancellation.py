@@ -0,0 +1,109 @@
+"""
+Turn Cancellation
+
+Lets a newer message in a Slack thread abort the agent run that is answering an older
+one. Each queued or running turn registers a TurnHandle under its thread; supersede()
+cancels every handle in that thread. A cancelled run raises TurnCancelled at its next
+check (the runtime checks between streamed tokens and graph steps), or is cancelled
+outright when it is an asyncio task. Its partial state is never saved.
+
+A handle keeps the text it was answering, so the newer turn can take over the
+superseded messages instead of losing them.
+"""
+
+import os
+import threading
+import time
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+
+class TurnCancelled(Exception):
+    """Raised inside a turn whose cancel event was set by a newer message."""
+
+
+def cancellation_enabled():
+    """Whether newer messages cancel older runs in the same thread (SLACK_CANCEL_SUPERSEDED)"""
+    return os.environ.get("SLACK_CANCEL_SUPERSEDED", "1") != "0"
+
+
+class TurnHandle:
+    """A queued or running turn: its text, its cancel event and whether it was cancelled"""
+
+    def __init__(self, key, text):
+        self.key = key
+        self.text = text
+        self.cancel = threading.Event()
+        # Set once the turn stopped because of the cancel event (nothing was saved)
+        self.cancelled = False
+        self.started_at = time.monotonic()
+        # The asyncio task running the turn, if any; it is cancelled directly
+        self.task = None
+
+    def check(self):
+        """Raise TurnCancelled if a newer message has superseded this turn"""
+        if self.cancel.is_set():
+            raise TurnCancelled(f"turn in {self.key} superseded")
+
+
+class TurnRegistry:
+    """The unfinished turns per thread key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._turns = {}
+
+    def start(self, key, text):
+        """Register a turn for key (when it is queued) and return its handle"""
+        handle = TurnHandle(key, text)
+        with self._lock:
+            self._turns.setdefault(key, []).append(handle)
+        return handle
+
+    def supersede(self, key):
+        """Cancel every unfinished turn for key; returns their handles, oldest first"""
+        with self._lock:
+            handles = list(self._turns.get(key, ()))
+        for handle in handles:
+            if not handle.cancel.is_set():
+                handle.cancel.set()
+                metrics.incr("turns.superseded")
+                if handle.task is not None:
+                    handle.task.cancel()
+        return handles
+
+    def finish(self, handle):
+        with self._lock:
+            handles = self._turns.get(handle.key)
+            if handles and handle in handles:
+                handles.remove(handle)
+                if not handles:
+                    del self._turns[handle.key]
+
+    def active(self, key):
+        with self._lock:
+            return list(self._turns.get(key, ()))
+
+
+def carried_over_text(superseded, text):
+    """The text of the superseded turns that were cancelled (and so never saved), then text"""
+    earlier = [handle.text for handle in superseded if handle.cancelled]
+    return "\n\n".join(earlier + [text])
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_turn_registry():
+    """Return the process-wide turn registry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TurnRegistry()
+    return _registry
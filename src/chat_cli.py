@@ -5,41 +5,35 @@ This demonstrates how to use the agent with persistent memory across sessions.
 """
 
 import sys
-import os
 from pathlib import Path
 import argparse
 
 # Add the parent directory to the path so we can import from src
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.agent import chat_with_memory, MEMORY_FILE
-import json
-import shutil
+from src.agent import chat_with_memory
+from src.memory_store import get_conversation_store
+from src.runtime import get_agent_runtime
 
 def clear_thread_memory(thread_id=None):
     """Clear memory for a specific thread or all threads"""
-    if MEMORY_FILE.exists():
+    store = get_conversation_store()
+    runtime = get_agent_runtime()
+    try:
         if thread_id:
-            # Clear only the specified thread
-            try:
-                with open(MEMORY_FILE, 'r') as f:
-                    all_memory = json.load(f)
-                
-                if thread_id in all_memory:
-                    del all_memory[thread_id]
-                    
-                    with open(MEMORY_FILE, 'w') as f:
-                        json.dump(all_memory, f, indent=2)
-                    
-                    print(f"Cleared conversation history for thread: {thread_id}")
-                else:
-                    print(f"No conversation history found for thread: {thread_id}")
-            except Exception as e:
-                print(f"Error clearing memory: {e}")
+            # Clear only the specified thread (and the agent's saved graph state for it)
+            runtime.forget_thread(thread_id)
+            if store.delete_thread(thread_id):
+                print(f"Cleared conversation history for thread: {thread_id}")
+            else:
+                print(f"No conversation history found for thread: {thread_id}")
         else:
             # Clear all threads
-            os.remove(MEMORY_FILE)
+            store.clear()
+            runtime.forget_all_threads()
             print("Cleared all conversation history")
+    except Exception as e:
+        print(f"Error clearing memory: {e}")
 
 def main():
     """Main function for the CLI chat application"""
@@ -53,22 +47,16 @@ def main():
     
     # List all available threads if requested
     if args.list:
-        if MEMORY_FILE.exists():
-            try:
-                with open(MEMORY_FILE, 'r') as f:
-                    all_memory = json.load(f)
-                
-                if all_memory:
-                    print("Available conversation threads:")
-                    for tid in all_memory.keys():
-                        msg_count = len(all_memory[tid].get("messages", []))
-                        print(f"  - {tid} ({msg_count} messages)")
-                else:
-                    print("No conversation threads found")
-            except Exception as e:
-                print(f"Error listing threads: {e}")
-        else:
-            print("No conversation history found")
+        try:
+            threads = get_conversation_store().list_threads()
+            if threads:
+                print("Available conversation threads:")
+                for tid, msg_count in threads:
+                    print(f"  - {tid} ({msg_count} messages)")
+            else:
+                print("No conversation threads found")
+        except Exception as e:
+            print(f"Error listing threads: {e}")
         return
     
     # Clear conversation history if requested
@@ -101,27 +89,18 @@ def main():
                 clear_thread_memory(thread_id)
                 continue
             elif user_input.lower() == "!list":
-                if MEMORY_FILE.exists():
-                    try:
-                        with open(MEMORY_FILE, 'r') as f:
-                            all_memory = json.load(f)
-                        
-                        if thread_id in all_memory:
-                            messages = all_memory[thread_id].get("messages", [])
-                            if messages:
-                                print(f"\nMessages in thread '{thread_id}':")
-                                for i, msg in enumerate(messages):
-                                    role = msg.get("role", "unknown")
-                                    content = msg.get("content", "")
-                                    print(f"{i+1}. [{role.upper()}] {content[:50]}{'...' if len(content) > 50 else ''}")
-                            else:
-                                print(f"No messages in thread '{thread_id}'")
-                        else:
-                            print(f"Thread '{thread_id}' not found")
-                    except Exception as e:
-                        print(f"Error listing messages: {e}")
-                else:
-                    print("No conversation history found")
+                try:
+                    messages = get_conversation_store().load_thread(thread_id).get("messages", [])
+                    if messages:
+                        print(f"\nMessages in thread '{thread_id}':")
+                        for i, msg in enumerate(messages):
+                            role = msg.get("role", "unknown")
+                            content = msg.get("content", "")
+                            print(f"{i+1}. [{role.upper()}] {content[:50]}{'...' if len(content) > 50 else ''}")
+                    else:
+                        print(f"No messages in thread '{thread_id}'")
+                except Exception as e:
+                    print(f"Error listing messages: {e}")
                 continue
             elif user_input.lower().startswith("!switch "):
                 new_thread = user_input[8:].strip()
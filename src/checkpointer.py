@@ -0,0 +1,383 @@
+"""
+Agent Checkpointer
+
+Durable LangGraph checkpoint storage keyed by thread_id, so the agent resumes each
+conversation from its saved graph state (including tool calls and tool results) and a
+turn only has to push the new user message.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, copy_checkpoint, get_checkpoint_id,
+    get_checkpoint_metadata
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.memory_store import MEMORY_DIR
+from src.metrics import metrics
+
+CHECKPOINT_DB = MEMORY_DIR / "agent_checkpoints.db"
+MESSAGES_CHANNEL = "messages"
+
+
+class _Latest:
+    """A thread's latest checkpoint as held in memory."""
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "writes")
+
+    def __init__(self, checkpoint_id, parent_id, checkpoint, metadata, writes=None):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        # (task_id, idx) -> (task_id, channel, value)
+        self.writes = writes if writes is not None else {}
+
+
+class PIPCheckpointSaver(BaseCheckpointSaver):
+    """
+    Checkpoint saver keeping only the latest checkpoint of each thread, in SQLite.
+
+    The messages channel is stored one row per message, and a put only serialises the
+    messages added since the previous checkpoint; the rest of the checkpoint (channel
+    versions, small channels) is a small blob rewritten in place. When a message was
+    replaced or removed the thread's messages are rewritten once.
+
+    The latest checkpoint of recently used threads is also kept in memory (write-through,
+    at most max_threads threads), so a turn on a hot thread reads nothing from disk.
+    Each OS thread has its own connection (WAL), so threads only wait on each other
+    for SQLite's write lock. Only the latest checkpoint is kept, which bounds disk use
+    but means there is no checkpoint history to rewind to.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            thread_id TEXT NOT NULL,
+            checkpoint_ns TEXT NOT NULL,
+            checkpoint_id TEXT NOT NULL,
+            parent_checkpoint_id TEXT,
+            type TEXT,
+            checkpoint BLOB,
+            metadata_type TEXT,
+            metadata BLOB,
+            message_count INTEGER,
+            PRIMARY KEY (thread_id, checkpoint_ns)
+        );
+        CREATE TABLE IF NOT EXISTS checkpoint_messages (
+            thread_id TEXT NOT NULL,
+            checkpoint_ns TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            type TEXT,
+            message BLOB,
+            PRIMARY KEY (thread_id, checkpoint_ns, seq)
+        );
+        CREATE TABLE IF NOT EXISTS checkpoint_writes (
+            thread_id TEXT NOT NULL,
+            checkpoint_ns TEXT NOT NULL,
+            checkpoint_id TEXT NOT NULL,
+            task_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            type TEXT,
+            value BLOB,
+            PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+        );
+    """
+
+    def __init__(self, path=CHECKPOINT_DB, max_threads=None, serde=None):
+        super().__init__(serde=serde)
+        if max_threads is None:
+            max_threads = int(os.environ.get("CHECKPOINT_CACHE_MAX_THREADS", "256"))
+        self.path = Path(path)
+        self.max_threads = max_threads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._empty = set()
+        self.disk_reads = 0
+        self.messages_written = 0
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Return this OS thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # In-memory latest checkpoints
+
+    def _cache_get(self, key):
+        with self._lock:
+            latest = self._latest.get(key)
+            if latest is not None:
+                self._latest.move_to_end(key)
+            return latest
+
+    def _cache_put(self, key, latest):
+        with self._lock:
+            self._empty.discard(key[0])
+            self._latest[key] = latest
+            self._latest.move_to_end(key)
+            while len(self._latest) > max(self.max_threads, 0):
+                self._latest.popitem(last=False)
+
+    def _cache_drop(self, thread_id=None):
+        with self._lock:
+            if thread_id is None:
+                self._latest.clear()
+                self._empty.clear()
+                return
+            for key in [key for key in self._latest if key[0] == thread_id]:
+                del self._latest[key]
+            self._empty.add(thread_id)
+            if len(self._empty) > max(self.max_threads, 0):
+                self._empty.pop()
+
+    def _tuple(self, thread_id, checkpoint_ns, latest):
+        """Build a CheckpointTuple the caller may modify without touching the cache"""
+        checkpoint = copy_checkpoint(latest.checkpoint)
+        if MESSAGES_CHANNEL in checkpoint["channel_values"]:
+            checkpoint["channel_values"][MESSAGES_CHANNEL] = list(checkpoint["channel_values"][MESSAGES_CHANNEL])
+        configurable = {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}
+        return CheckpointTuple(
+            config={"configurable": {**configurable, "checkpoint_id": latest.checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=dict(latest.metadata),
+            parent_config={"configurable": {**configurable, "checkpoint_id": latest.parent_id}} if latest.parent_id else None,
+            pending_writes=[latest.writes[key] for key in sorted(latest.writes)],
+        )
+
+    def _load(self, thread_id, checkpoint_ns):
+        """Read a thread's latest checkpoint from disk"""
+        self.disk_reads += 1
+        metrics.incr("checkpoint.disk_reads")
+        conn = self._connect()
+        with conn:
+            # Read the checkpoint, its messages and its writes from the same snapshot
+            conn.execute("BEGIN")
+            row = conn.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, message_count "
+                "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns)
+            ).fetchone()
+            if row is None:
+                return None
+            checkpoint_id, parent_id, type_, blob, metadata_type, metadata_blob, message_count = row
+            message_rows = conn.execute(
+                "SELECT type, message FROM checkpoint_messages WHERE thread_id = ? AND checkpoint_ns = ? "
+                "AND seq < ? ORDER BY seq",
+                (thread_id, checkpoint_ns, message_count if message_count is not None else 0)
+            ).fetchall()
+            write_rows = conn.execute(
+                "SELECT task_id, idx, channel, type, value FROM checkpoint_writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id)
+            ).fetchall()
+        checkpoint = self.serde.loads_typed((type_, blob))
+        if message_count is not None:
+            checkpoint["channel_values"][MESSAGES_CHANNEL] = [self.serde.loads_typed(r) for r in message_rows]
+        writes = {
+            (task_id, idx): (task_id, channel, self.serde.loads_typed((value_type, value)))
+            for task_id, idx, channel, value_type, value in write_rows
+        }
+        return _Latest(checkpoint_id, parent_id, checkpoint, self.serde.loads_typed((metadata_type, metadata_blob)), writes)
+
+    # BaseCheckpointSaver
+
+    def get_tuple(self, config):
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        latest = self._cache_get(key)
+        if latest is None:
+            with self._lock:
+                if thread_id in self._empty:
+                    return None
+            latest = self._load(thread_id, checkpoint_ns)
+            if latest is None:
+                return None
+            self._cache_put(key, latest)
+        if checkpoint_id and checkpoint_id != latest.checkpoint_id:
+            # Older checkpoints aren't kept
+            return None
+        return self._tuple(thread_id, checkpoint_ns, latest)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """Yield the latest checkpoint of a thread (or of every thread), the only one kept"""
+        if config is not None:
+            keys = [(str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", ""))]
+        else:
+            keys = self._connect().execute("SELECT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+        if limit is not None:
+            keys = keys[:limit]
+        for thread_id, checkpoint_ns in keys:
+            found = self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+            if found is None:
+                continue
+            if before is not None and found.config["configurable"]["checkpoint_id"] >= get_checkpoint_id(before):
+                continue
+            if filter and any(found.metadata.get(k) != v for k, v in filter.items()):
+                continue
+            yield found
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        parent_id = config["configurable"].get("checkpoint_id")
+        checkpoint = copy_checkpoint(checkpoint)
+        metadata = get_checkpoint_metadata(config, metadata)
+
+        messages = checkpoint["channel_values"].pop(MESSAGES_CHANNEL, None)
+        stored = checkpoint
+        if messages is not None:
+            messages = list(messages)
+            checkpoint = copy_checkpoint(stored)
+            checkpoint["channel_values"][MESSAGES_CHANNEL] = messages
+
+        # Only messages after the unchanged prefix need writing
+        previous = self._cache_get(key)
+        previous_messages = previous.checkpoint["channel_values"].get(MESSAGES_CHANNEL) if previous else None
+        if messages is None:
+            start = 0
+        elif previous_messages is not None and len(previous_messages) <= len(messages) and all(
+                a is b for a, b in zip(previous_messages, messages)):
+            start = len(previous_messages)
+        else:
+            start = 0
+
+        type_, blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        new_rows = [
+            (thread_id, checkpoint_ns, start + i, *self.serde.dumps_typed(m))
+            for i, m in enumerate(messages[start:] if messages is not None else [])
+        ]
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if start == 0:
+                conn.execute(
+                    "DELETE FROM checkpoint_messages WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns)
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoint_messages (thread_id, checkpoint_ns, seq, type, message) "
+                "VALUES (?, ?, ?, ?, ?)",
+                new_rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+                "type, checkpoint, metadata_type, metadata, message_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, blob, metadata_type, metadata_blob,
+                 len(messages) if messages is not None else None)
+            )
+            # Writes made against older checkpoints are no longer needed
+            conn.execute(
+                "DELETE FROM checkpoint_writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                (thread_id, checkpoint_ns, checkpoint["id"])
+            )
+        self.messages_written += len(new_rows)
+        metrics.incr("checkpoint.messages_written", len(new_rows))
+        self._cache_put(key, _Latest(checkpoint["id"], parent_id, checkpoint, metadata))
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special channels overwrite their slot; ordinary writes are never replaced
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        entries = [
+            (WRITES_IDX_MAP.get(channel, idx), channel, value)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO checkpoint_writes "
+                "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *self.serde.dumps_typed(value))
+                    for idx, channel, value in entries
+                ]
+            )
+        latest = self._cache_get((thread_id, checkpoint_ns))
+        if latest is not None and latest.checkpoint_id == checkpoint_id:
+            with self._lock:
+                for idx, channel, value in entries:
+                    if replace or (task_id, idx) not in latest.writes:
+                        latest.writes[(task_id, idx)] = (task_id, channel, value)
+
+    def delete_thread(self, thread_id):
+        """Delete a thread's checkpoint, messages and writes"""
+        thread_id = str(thread_id)
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for table in ("checkpoints", "checkpoint_messages", "checkpoint_writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        self._cache_drop(thread_id)
+
+    def clear(self):
+        """Delete every thread's checkpoints"""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for table in ("checkpoints", "checkpoint_messages", "checkpoint_writes"):
+                conn.execute(f"DELETE FROM {table}")
+        self._cache_drop()
+
+    def has_thread(self, thread_id):
+        """Return True if any checkpoint exists for the thread"""
+        return self.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+
+    # Async interface: hot reads are served from memory, disk I/O runs in a worker thread
+
+    async def aget_tuple(self, config):
+        latest = self._cache_get((str(config["configurable"]["thread_id"]), config["configurable"].get("checkpoint_ns", "")))
+        if latest is not None:
+            return self.get_tuple(config)
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        found = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in found:
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def build_checkpointer(kind=None):
+    """Create the checkpointer selected by AGENT_CHECKPOINTER ("sqlite" by default, "memory" or "none")"""
+    kind = (kind or os.environ.get("AGENT_CHECKPOINTER", "sqlite")).lower()
+    if kind == "sqlite":
+        return PIPCheckpointSaver(os.environ.get("AGENT_CHECKPOINT_DB", CHECKPOINT_DB))
+    if kind == "memory":
+        return MemorySaver()
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown AGENT_CHECKPOINTER: {kind}")
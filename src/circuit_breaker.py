@@ -0,0 +1,217 @@
+"""
+Circuit Breaker for the Model Backend
+
+Stops sending requests to the LiteLLM proxy while it is failing, so turns fail in
+milliseconds with a friendly reply instead of each waiting out a full timeout.
+
+Every request the pooled LLM clients send is recorded as an outcome: a failure (a
+connection error, a timeout, a 5xx or a 408) or a success, and slow if its response
+headers took longer than LLM_BREAKER_SLOW_SECONDS. 429s count as successes; throttling
+is the outbound limiter's job. Once LLM_BREAKER_MIN_CALLS requests have been seen in the
+last LLM_BREAKER_WINDOW_SECONDS, the breaker opens if LLM_BREAKER_ERROR_RATE of them
+failed or LLM_BREAKER_SLOW_RATE of them were slow.
+
+While open, requests are refused with CircuitOpen. After LLM_BREAKER_OPEN_SECONDS it
+goes half-open: up to LLM_BREAKER_PROBES requests are let through as probes. If all of
+them succeed it closes; if one fails (or is slow) it opens again.
+
+State changes are recorded in metrics (the llm.breaker.state gauge, 0 closed, 1
+half-open, 2 open, and llm.breaker.<state> counters) and passed to listeners, which the
+Slack apps use to emit them to Langfuse. Refused requests count as llm.breaker.rejected.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Sent instead of an answer while the model backend is unavailable
+DEGRADED_REPLY = (
+    "I can't reach the AI service right now, so I can't work on this yet. "
+    "Please try again in a few minutes."
+)
+
+
+class CircuitOpen(Exception):
+    """The model backend is failing; requests are refused until it recovers"""
+
+
+def caused_by_open_circuit(exception):
+    """Whether exception (or one it was raised from, e.g. by the OpenAI client) is CircuitOpen"""
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        if isinstance(exception, CircuitOpen):
+            return True
+        seen.add(id(exception))
+        exception = exception.__cause__ or exception.__context__
+    return False
+
+
+def failed_status(status):
+    """Responses that say the backend (not the request) is in trouble"""
+    return status >= 500 or status == 408
+
+
+class CircuitBreaker:
+    """
+    Trips on error rate or latency over a sliding window and probes for recovery.
+
+    allow() returns a ticket for a request, or None if it must be refused; the request's
+    outcome is then given to record(ticket, ...), or abandon(ticket) if there is none.
+    """
+
+    def __init__(self, window_seconds=None, min_calls=None, error_rate=None, slow_seconds=None,
+                 slow_rate=None, open_seconds=None, probes=None, clock=time.monotonic):
+        env = os.environ.get
+        self.window_seconds = window_seconds if window_seconds is not None else float(env("LLM_BREAKER_WINDOW_SECONDS", "60"))
+        self.min_calls = min_calls if min_calls is not None else int(env("LLM_BREAKER_MIN_CALLS", "10"))
+        self.error_rate = error_rate if error_rate is not None else float(env("LLM_BREAKER_ERROR_RATE", "0.5"))
+        self.slow_seconds = slow_seconds if slow_seconds is not None else float(env("LLM_BREAKER_SLOW_SECONDS", "30"))
+        self.slow_rate = slow_rate if slow_rate is not None else float(env("LLM_BREAKER_SLOW_RATE", "0.8"))
+        self.open_seconds = open_seconds if open_seconds is not None else float(env("LLM_BREAKER_OPEN_SECONDS", "30"))
+        self.probes = probes if probes is not None else int(env("LLM_BREAKER_PROBES", "1"))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        # (time, failed, slow) for requests let through while closed
+        self._outcomes = deque()
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._listeners = []
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def add_listener(self, listener):
+        """Call listener(old_state, new_state, reason) on every state change"""
+        self._listeners.append(listener)
+
+    def is_open(self):
+        """Whether a request made now would be refused (without taking a probe slot)"""
+        with self._lock:
+            if self._state == OPEN:
+                return self._clock() - self._opened_at < self.open_seconds
+            return self._state == HALF_OPEN and self._probes_in_flight >= self.probes
+
+    def allow(self):
+        """A ticket for one request, or None if the breaker refuses it"""
+        changes = []
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                changes.append(self._move(HALF_OPEN, "open_timeout"))
+            if self._state == CLOSED:
+                ticket = CLOSED
+            elif self._state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                ticket = HALF_OPEN
+            else:
+                ticket = None
+        self._notify(changes)
+        if ticket is None:
+            metrics.incr("llm.breaker.rejected")
+        return ticket
+
+    def record(self, ticket, failed, seconds):
+        """The outcome of a request that allow() let through"""
+        slow = seconds >= self.slow_seconds
+        changes = []
+        with self._lock:
+            if ticket == HALF_OPEN and self._state == HALF_OPEN:
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    changes.append(self._trip("probe_failed" if failed else "probe_slow"))
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.probes:
+                        self._outcomes.clear()
+                        changes.append(self._move(CLOSED, "probes_succeeded"))
+            elif ticket == CLOSED and self._state == CLOSED:
+                now = self._clock()
+                self._outcomes.append((now, failed, slow))
+                while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+                    self._outcomes.popleft()
+                calls = len(self._outcomes)
+                if calls >= self.min_calls:
+                    if sum(1 for _, f, _ in self._outcomes if f) >= self.error_rate * calls:
+                        changes.append(self._trip("error_rate"))
+                    elif sum(1 for _, _, s in self._outcomes if s) >= self.slow_rate * calls:
+                        changes.append(self._trip("latency"))
+        self._notify(changes)
+
+    def abandon(self, ticket):
+        """A request that was let through but ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            if ticket == HALF_OPEN and self._state == HALF_OPEN:
+                self._probes_in_flight -= 1
+
+    def _trip(self, reason):
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        return self._move(OPEN, reason)
+
+    def _move(self, state, reason):
+        old, self._state = self._state, state
+        if state == HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        metrics.set_gauge("llm.breaker.state", _STATE_GAUGE[state])
+        metrics.incr(f"llm.breaker.{state}")
+        return old, state, reason
+
+    def _notify(self, changes):
+        for old, state, reason in changes:
+            print(f"LLM circuit breaker {old} -> {state} ({reason})")
+            for listener in list(self._listeners):
+                try:
+                    listener(old, state, reason)
+                except Exception as e:
+                    print(f"Error reporting circuit breaker state: {e}")
+
+
+def langfuse_listener(langfuse):
+    """A listener that records each state change as a Langfuse event"""
+    def report(old, state, reason):
+        langfuse.event(
+            name="llm_circuit_breaker",
+            level="DEFAULT" if state == CLOSED else "WARNING",
+            status_message=f"{old} -> {state}",
+            metadata={"from": old, "to": state, "reason": reason}
+        )
+    return report
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """Return the process-wide circuit breaker for the model backend"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
+
+
+def set_circuit_breaker(breaker):
+    """Replace the process-wide breaker (e.g. with other settings in tests)"""
+    global _breaker
+    with _breaker_lock:
+        _breaker = breaker
+    return breaker
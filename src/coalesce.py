@@ -0,0 +1,95 @@
+"""
+Message Coalescing
+
+Collects messages that arrive in quick succession under the same key (a Slack thread)
+and hands them over as one batch, so a summary pasted across several messages is
+answered by a single agent run. A batch is flushed once no message has arrived for
+SLACK_DEBOUNCE_SECONDS, or SLACK_DEBOUNCE_MAX_SECONDS after its first message, whichever
+comes first. A window of 0 disables coalescing: every message is flushed on its own
+straight away.
+
+coalesce.messages counts messages received, coalesce.invocations batches flushed and
+coalesce.saved_invocations the agent runs that merging avoided.
+"""
+
+import os
+import threading
+import time
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+
+class _Batch:
+    def __init__(self, now):
+        self.items = []
+        self.first_at = now
+        self.timer = None
+
+
+class MessageCoalescer:
+    """Calls on_flush(key, items) for each burst of items added under a key."""
+
+    def __init__(self, on_flush, window=None, max_wait=None):
+        self.on_flush = on_flush
+        self.window = window if window is not None else float(os.environ.get("SLACK_DEBOUNCE_SECONDS", "2"))
+        self.max_wait = max_wait if max_wait is not None else float(
+            os.environ.get("SLACK_DEBOUNCE_MAX_SECONDS", str(self.window * 3))
+        )
+        self._lock = threading.Lock()
+        self._batches = {}
+
+    def add(self, key, item):
+        """Add an item to key's pending batch; the batch is flushed when the burst ends"""
+        metrics.incr("coalesce.messages")
+        if self.window <= 0:
+            self._deliver(key, [item])
+            return
+        now = time.monotonic()
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(now)
+            else:
+                batch.timer.cancel()
+            batch.items.append(item)
+            # Each message restarts the window, but a burst never waits beyond max_wait
+            delay = max(0.0, min(self.window, batch.first_at + self.max_wait - now))
+            batch.timer = threading.Timer(delay, self._flush, (key, batch))
+            batch.timer.daemon = True
+            batch.timer.start()
+
+    def _flush(self, key, batch):
+        with self._lock:
+            # A cancelled timer that fired anyway, or a batch already flushed
+            if self._batches.get(key) is not batch:
+                return
+            del self._batches[key]
+        self._deliver(key, batch.items)
+
+    def _deliver(self, key, items):
+        metrics.incr("coalesce.invocations")
+        metrics.incr("coalesce.saved_invocations", len(items) - 1)
+        metrics.observe("coalesce.batch_size", len(items))
+        try:
+            self.on_flush(key, items)
+        except Exception as e:
+            print(f"Error handling coalesced messages: {e}")
+
+    def flush_all(self):
+        """Flush every pending batch now (e.g. on shutdown)"""
+        with self._lock:
+            batches = list(self._batches.items())
+            self._batches.clear()
+        for key, batch in batches:
+            batch.timer.cancel()
+            self._deliver(key, batch.items)
+
+    @property
+    def pending(self):
+        """Keys with a batch waiting for its window to close"""
+        with self._lock:
+            return len(self._batches)
@@ -0,0 +1,213 @@
+"""
+Context Window Manager
+
+Keeps the messages sent to the model within a token budget. Recent turns are passed
+verbatim; older turns are folded into a compact structured summary of the questions
+asked and the answers the manager already confirmed.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+# Rough per-message overhead for role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_ANSWER_CHARS = 400
+SUMMARY_QUESTION_CHARS = 200
+# Minimum room left for the summary of older turns
+SUMMARY_RESERVE_TOKENS = 300
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once; fall back to an estimate if it isn't available offline"""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Token encoding unavailable, estimating token counts: {e}")
+            _encoding_failed = True
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """Count tokens in a piece of text"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # About four characters per token for English prose
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(message):
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += count_tokens(str(tool_call.get("args", "")))
+    return tokens
+
+
+def split_turns(messages):
+    """Group messages into turns, each starting at a HumanMessage"""
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _last_question(text):
+    """The question the assistant ended its reply with, or the start of the reply"""
+    text = " ".join(text.split())
+    questions = re.findall(r"[^.?!]*\?", text)
+    question = questions[-1].strip() if questions else text
+    return question[:SUMMARY_QUESTION_CHARS]
+
+
+def _final_reply(turn):
+    for message in reversed(turn):
+        if isinstance(message, AIMessage) and message.content and not message.tool_calls:
+            return message.content
+    return ""
+
+
+def _summary_entries(turns, answer_chars, question_chars):
+    entries = []
+    previous_question = None
+    for turn in turns:
+        answer = " ".join(str(turn[0].content).split()) if isinstance(turn[0], HumanMessage) else ""
+        if answer:
+            if len(answer) > answer_chars:
+                answer = answer[:answer_chars] + "..."
+            if previous_question:
+                entries.append(f"- Q: {previous_question[:question_chars]}\n  A: {answer}")
+            else:
+                entries.append(f"- Manager: {answer}")
+        reply = _final_reply(turn)
+        previous_question = _last_question(reply) if reply else None
+    if previous_question:
+        entries.append(f"- Last question asked before the recent turns: {previous_question[:question_chars]}")
+    return entries
+
+
+def summarize_turns(turns, max_tokens=None):
+    """
+    Build a compact structured summary of older turns.
+
+    If max_tokens is given, answers and questions are shortened and then the oldest
+    entries dropped until the summary fits.
+    """
+    header = "Summary of earlier conversation (older turns condensed; answers are the manager's words):"
+    for answer_chars, question_chars in ((SUMMARY_ANSWER_CHARS, SUMMARY_QUESTION_CHARS), (150, 100), (60, 60)):
+        entries = _summary_entries(turns, answer_chars, question_chars)
+        summary = "\n".join([header] + entries)
+        if max_tokens is None or count_tokens(summary) <= max_tokens:
+            return summary
+
+    omitted = 0
+    while entries and count_tokens("\n".join([header] + entries)) > max_tokens:
+        entries.pop(0)
+        omitted += 1
+    return "\n".join([header, f"- ({omitted} earlier exchanges omitted)"] + entries)
+
+
+def _with_system_message(system_message, summary, messages):
+    """Prefix messages with a single SystemMessage combining the prompt and the summary"""
+    content = "\n\n".join(part for part in (system_message, summary) if part)
+    if not content:
+        return list(messages)
+    return [SystemMessage(content=content)] + list(messages)
+
+
+class ContextWindowManager:
+    """
+    Fits conversation history into a token budget.
+
+    token_budget covers the system message plus history. The last keep_recent_turns
+    turns are always kept verbatim (even if they alone exceed the budget); older turns
+    are kept verbatim newest-first while they fit, and whatever is left is replaced by
+    a summary sized to the remaining budget. The summary is appended to the system
+    message, because models behind the LiteLLM proxy (Anthropic) only accept a single
+    leading system prompt. A budget of 0 disables trimming.
+    """
+
+    def __init__(self, token_budget=None, keep_recent_turns=None):
+        if token_budget is None:
+            token_budget = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "16000"))
+        if keep_recent_turns is None:
+            keep_recent_turns = int(os.environ.get("CONTEXT_KEEP_RECENT_TURNS", "6"))
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+
+    def fit(self, history, system_message=""):
+        """
+        Return (messages, stats) where messages fit the budget.
+
+        messages start with one SystemMessage holding system_message and, when older
+        turns were condensed, their summary; it is omitted if there is neither. stats
+        reports tokens_before, tokens_after, tokens_saved and summarized_turns.
+        """
+        system_tokens = count_tokens(system_message) + MESSAGE_OVERHEAD_TOKENS if system_message else 0
+        turns = split_turns(history)
+        turn_tokens = [sum(count_message_tokens(m) for m in turn) for turn in turns]
+        tokens_before = system_tokens + sum(turn_tokens)
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_before,
+            "tokens_saved": 0,
+            "summarized_turns": 0,
+        }
+        if self.token_budget <= 0 or tokens_before <= self.token_budget:
+            return _with_system_message(system_message, None, history), stats
+
+        # Always keep the most recent turns, then add older ones while they fit
+        kept = max(min(self.keep_recent_turns, len(turns)), 0)
+        used = system_tokens + sum(turn_tokens[len(turns) - kept:])
+        while kept < len(turns):
+            candidate = turn_tokens[len(turns) - kept - 1]
+            if used + candidate + SUMMARY_RESERVE_TOKENS > self.token_budget:
+                break
+            used += candidate
+            kept += 1
+
+        older, recent = turns[:len(turns) - kept], turns[len(turns) - kept:]
+        summary = None
+        if older:
+            summary_budget = max(self.token_budget - used - MESSAGE_OVERHEAD_TOKENS, SUMMARY_RESERVE_TOKENS)
+            summary = summarize_turns(older, summary_budget)
+        messages = _with_system_message(system_message, summary, [m for turn in recent for m in turn])
+
+        tokens_after = sum(count_message_tokens(m) for m in messages)
+        stats.update({
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "summarized_turns": len(older),
+        })
+        return messages, stats
+
+
+def record_context_stats(thread_id, context_stats):
+    """Report how many prompt tokens the context window saved this turn"""
+    metrics.observe("context.tokens_sent", context_stats["tokens_after"])
+    metrics.observe("context.tokens_saved", context_stats["tokens_saved"])
+    if context_stats["tokens_saved"]:
+        print(
+            f"Context for {thread_id}: {context_stats['tokens_before']} -> {context_stats['tokens_after']} tokens "
+            f"({context_stats['tokens_saved']} saved, {context_stats['summarized_turns']} turns summarised)"
+        )
@@ -0,0 +1,236 @@
+"""
+Event Deduplication
+
+Remembers which Slack events have already been handled so redeliveries are not
+answered twice. Every process keeps a bounded in-memory record (TTL plus a size cap,
+O(1) per lookup); behind it a persistent backend survives restarts and can be shared
+by replicas:
+
+- sqlite (default): a table in the memory directory, so a restart or a second process
+  on the same volume sees what was handled
+- redis: SET NX with an expiry on a server every replica talks to (needs the optional
+  redis package and DEDUP_REDIS_URL)
+- memory: in-process only
+
+Claiming an event is a single atomic check-and-set in every backend, so two replicas
+receiving the same redelivery can't both win.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.memory_store import MEMORY_DIR
+from src.metrics import metrics
+
+DEDUP_DB = MEMORY_DIR / "slack_events.db"
+
+
+def dedup_ttl():
+    """Seconds an event stays remembered (DEDUP_TTL_SECONDS); Slack retries within minutes"""
+    return float(os.environ.get("DEDUP_TTL_SECONDS", "3600"))
+
+
+def dedup_max_entries():
+    """Most events remembered per store (DEDUP_MAX_ENTRIES)"""
+    return int(os.environ.get("DEDUP_MAX_ENTRIES", "10000"))
+
+
+class MemoryDedupStore:
+    """
+    In-process record of claimed events.
+
+    Entries are kept in claim order, so expired ones are always at the front and
+    eviction (by age or by size) pops from there.
+    """
+
+    def __init__(self, ttl=None, max_entries=None, clock=time.monotonic):
+        self.ttl = dedup_ttl() if ttl is None else ttl
+        self.max_entries = dedup_max_entries() if max_entries is None else max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def claim(self, event_id):
+        """Record event_id; returns False if it was already recorded"""
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            if event_id in self._entries:
+                return False
+            self._entries[event_id] = now
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest > cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteDedupStore:
+    """
+    Claimed events in a SQLite table, shared by every process using the same file.
+
+    Claims are a single upsert that only succeeds for unseen or expired events. Old
+    rows are pruned every prune_every claims, by age and down to max_entries.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS processed_events (
+            event_id TEXT PRIMARY KEY,
+            seen_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS processed_events_seen_at ON processed_events (seen_at);
+    """
+
+    def __init__(self, path=DEDUP_DB, ttl=None, max_entries=None, prune_every=500):
+        self.path = Path(path)
+        self.ttl = dedup_ttl() if ttl is None else ttl
+        self.max_entries = dedup_max_entries() if max_entries is None else max_entries
+        self.prune_every = prune_every
+        self._claims = 0
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Return this OS thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim(self, event_id):
+        """Record event_id; returns False if it was already recorded and hasn't expired"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO processed_events (event_id, seen_at) VALUES (?, ?)
+                ON CONFLICT (event_id) DO UPDATE SET seen_at = excluded.seen_at
+                WHERE processed_events.seen_at <= ?
+                """,
+                (event_id, now, now - self.ttl)
+            )
+            claimed = cursor.rowcount == 1
+        self._claims += 1
+        if self._claims % self.prune_every == 0:
+            self.prune()
+        return claimed
+
+    def prune(self):
+        """Delete expired rows and the oldest rows beyond max_entries"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM processed_events WHERE seen_at <= ?", (time.time() - self.ttl,))
+            conn.execute(
+                """
+                DELETE FROM processed_events WHERE event_id IN (
+                    SELECT event_id FROM processed_events ORDER BY seen_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM processed_events").fetchone()[0]
+
+
+class RedisDedupStore:
+    """Claimed events as expiring Redis keys, shared by every replica using the server"""
+
+    def __init__(self, client=None, url=None, ttl=None, prefix="pip-agent:slack-event:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("DEDUP_BACKEND=redis needs the redis package (pip install redis)") from e
+            client = redis.Redis.from_url(url or os.environ["DEDUP_REDIS_URL"])
+        self.client = client
+        self.ttl = dedup_ttl() if ttl is None else ttl
+        self.prefix = prefix
+
+    def claim(self, event_id):
+        """Record event_id; returns False if another process already recorded it"""
+        return bool(self.client.set(f"{self.prefix}{event_id}", 1, nx=True, ex=max(1, math.ceil(self.ttl))))
+
+
+class EventDeduplicator:
+    """
+    The in-memory record in front of an optional persistent backend.
+
+    A hit in memory needs no I/O. If the backend fails, the event is handled rather
+    than dropped (answering twice is better than not answering).
+    """
+
+    def __init__(self, backend=None, local=None):
+        self.backend = backend
+        self.local = local or MemoryDedupStore()
+
+    def claim(self, event_id):
+        """True if this process should handle event_id, False if it is a duplicate"""
+        claimed = self.local.claim(event_id)
+        if claimed and self.backend is not None:
+            try:
+                claimed = self.backend.claim(event_id)
+            except Exception as e:
+                print(f"Error checking processed events: {e}")
+                metrics.incr("dedup.backend_errors")
+        metrics.incr("dedup.claimed" if claimed else "dedup.duplicates")
+        metrics.set_gauge("dedup.local_entries", len(self.local))
+        return claimed
+
+
+def create_event_deduplicator(backend=None):
+    """Create the deduplicator for DEDUP_BACKEND ("sqlite" by default, "redis" or "memory")"""
+    backend = (backend or os.environ.get("DEDUP_BACKEND", "sqlite")).lower()
+    if backend == "memory":
+        return EventDeduplicator()
+    if backend == "sqlite":
+        return EventDeduplicator(SQLiteDedupStore(os.environ.get("DEDUP_DB", DEDUP_DB)))
+    if backend == "redis":
+        return EventDeduplicator(RedisDedupStore())
+    raise ValueError(f"Unknown DEDUP_BACKEND: {backend}")
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_event_deduplicator():
+    """Return the process-wide event deduplicator, creating it on first use"""
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = create_event_deduplicator()
+    return _deduplicator
+
+
+def set_event_deduplicator(deduplicator):
+    """Replace the process-wide event deduplicator (used by tests)"""
+    global _deduplicator
+    with _deduplicator_lock:
+        _deduplicator = deduplicator
+    return deduplicator
@@ -0,0 +1,235 @@
+"""
+Event Dispatch
+
+A bounded job queue with a fixed pool of worker threads, so Slack listeners can hand
+off a message and return at once instead of running the agent inline. Jobs share a key
+(the Slack thread) run one at a time in submission order; jobs with different keys run
+in parallel. When the queue is full, submit() waits up to a timeout for space and then
+rejects the job, so callers can tell the user to retry rather than pile up work.
+
+Jobs run in one of two lanes with their own workers: the interactive lane for quick
+question-and-answer turns and the bulk lane for long PIP document generation, so a burst
+of generations never takes the workers short turns need. A job in the interactive lane
+that turns out to generate a document enters bulk_work(): its lane is lent a replacement
+worker meanwhile, and the generation waits for one of the bulk lane's slots.
+
+Queue depth, wait time and rejections are recorded in the shared metrics registry
+under dispatch.* (wait time also per lane, as dispatch.<lane>.wait_seconds).
+"""
+
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# The dispatcher and lane of the job running on this thread, if any
+_current = threading.local()
+
+
+class _Job:
+    def __init__(self, fn, args, kwargs, lane=INTERACTIVE):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.lane = lane
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.future.set_result(self.fn(*self.args, **self.kwargs))
+        except BaseException as e:
+            print(f"Error in dispatched job: {e}")
+            print(f"Detailed error: {''.join(traceback.format_exception(type(e), e, e.__traceback__))}")
+            self.future.set_exception(e)
+
+
+class EventDispatcher:
+    """
+    Runs submitted jobs on per-lane worker pools, in order per key, with a bounded queue.
+
+    workers (the interactive lane), bulk_workers and max_queue default to SLACK_WORKERS,
+    SLACK_BULK_WORKERS and SLACK_QUEUE_SIZE; submit() waits up to
+    SLACK_QUEUE_WAIT_SECONDS for room before rejecting a job.
+    """
+
+    def __init__(self, workers=None, max_queue=None, queue_wait=None, bulk_workers=None):
+        self.workers = workers or int(os.environ.get("SLACK_WORKERS", "8"))
+        self.bulk_workers = bulk_workers or int(os.environ.get("SLACK_BULK_WORKERS", "2"))
+        self.max_queue = max_queue or int(os.environ.get("SLACK_QUEUE_SIZE", "100"))
+        self.queue_wait = queue_wait if queue_wait is not None else float(os.environ.get("SLACK_QUEUE_WAIT_SECONDS", "2"))
+        self._cond = threading.Condition()
+        # Per lane, keys whose first job is ready to run, in the order they became ready
+        self._ready = {INTERACTIVE: deque(), BULK: deque()}
+        # Jobs per key; the first one is ready or running, the rest wait behind it
+        self._jobs = {}
+        self._queued = 0
+        self._busy = 0
+        self._closed = False
+        # Workers per lane, and extra workers lent to a lane while its jobs do bulk work
+        self._limits = {INTERACTIVE: self.workers, BULK: self.bulk_workers}
+        self._lent = {INTERACTIVE: 0, BULK: 0}
+        self._alive = {INTERACTIVE: 0, BULK: 0}
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_workers)
+        self._threads = []
+        with self._cond:
+            for lane, limit in self._limits.items():
+                for _ in range(limit):
+                    self._start_worker(lane)
+
+    def _start_worker(self, lane):
+        thread = threading.Thread(
+            target=self._work, args=(lane,), name=f"dispatch-{lane}-{len(self._threads)}", daemon=True
+        )
+        self._alive[lane] += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def _surplus(self, lane):
+        return self._alive[lane] > self._limits[lane] + self._lent[lane]
+
+    @property
+    def depth(self):
+        """Jobs waiting to start"""
+        with self._cond:
+            return self._queued
+
+    def submit(self, key, fn, *args, timeout=None, lane=INTERACTIVE, **kwargs):
+        """
+        Queue fn(*args, **kwargs) behind any earlier jobs for key, to run in lane.
+
+        Returns a Future, or None if the queue stayed full for timeout seconds
+        (queue_wait by default).
+        """
+        job = _Job(fn, args, kwargs, lane)
+        timeout = self.queue_wait if timeout is None else timeout
+        with self._cond:
+            if self._queued >= self.max_queue:
+                metrics.incr("dispatch.backpressure_waits")
+                if not self._cond.wait_for(lambda: self._closed or self._queued < self.max_queue, timeout):
+                    metrics.incr("dispatch.rejected")
+                    return None
+            if self._closed:
+                raise RuntimeError("dispatcher is shut down")
+            self._queued += 1
+            jobs = self._jobs.get(key)
+            if jobs is None:
+                self._jobs[key] = deque([job])
+                self._ready[lane].append(key)
+                self._cond.notify_all()
+            else:
+                jobs.append(job)
+            self._record_depth()
+        metrics.incr("dispatch.submitted")
+        return job.future
+
+    def _work(self, lane):
+        _current.dispatcher, _current.lane = self, lane
+        ready = self._ready[lane]
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: ready or self._closed or self._surplus(lane))
+                if not ready or self._surplus(lane):
+                    # Shut down, or a worker lent to the lane is no longer needed
+                    self._alive[lane] -= 1
+                    return
+                key = ready.popleft()
+                job = self._jobs[key][0]
+                self._queued -= 1
+                self._busy += 1
+                self._record_depth()
+                # Room has freed up for a waiting submit()
+                self._cond.notify_all()
+            wait_seconds = time.monotonic() - job.queued_at
+            metrics.observe("dispatch.wait_seconds", wait_seconds)
+            metrics.observe(f"dispatch.{lane}.wait_seconds", wait_seconds)
+            job.run()
+            with self._cond:
+                self._busy -= 1
+                jobs = self._jobs[key]
+                jobs.popleft()
+                if jobs:
+                    # The key's next job may start now that this one is done, in its own lane
+                    self._ready[jobs[0].lane].append(key)
+                    self._cond.notify_all()
+                else:
+                    del self._jobs[key]
+                metrics.set_gauge("dispatch.busy_workers", self._busy)
+
+    def _record_depth(self):
+        metrics.set_gauge("dispatch.queue_depth", self._queued)
+        metrics.set_gauge("dispatch.busy_workers", self._busy)
+
+    @contextmanager
+    def _bulk_work(self, lane):
+        if lane == BULK:
+            # Generations escalated from the interactive lane share these slots
+            with self._bulk_slots:
+                yield
+            return
+        with self._cond:
+            self._lent[lane] += 1
+            if self._alive[lane] < self._limits[lane] + self._lent[lane] and not self._closed:
+                self._start_worker(lane)
+        metrics.incr("dispatch.bulk_escalations")
+        try:
+            with self._bulk_slots:
+                yield
+        finally:
+            with self._cond:
+                self._lent[lane] -= 1
+                self._cond.notify_all()
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs; workers finish what is queued and exit"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in list(self._threads):
+                thread.join()
+
+
+@contextmanager
+def bulk_work():
+    """
+    Mark long-running generation inside a dispatched job.
+
+    In the interactive lane the job's worker is replaced for the duration, so quick turns
+    keep their full pool; the work itself waits for one of the bulk lane's slots. Outside
+    a dispatcher worker it does nothing.
+    """
+    dispatcher = getattr(_current, "dispatcher", None)
+    if dispatcher is None:
+        yield
+        return
+    with dispatcher._bulk_work(_current.lane):
+        yield
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide event dispatcher, creating it on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EventDispatcher()
+    return _dispatcher
@@ -0,0 +1,179 @@
+"""
+Deadlines and Hedged Requests
+
+Wraps the model calls the PIP tools make so that none can hold a Slack thread
+indefinitely, and so one slow proxy response doesn't set the turn's latency.
+
+Every call has a deadline: LLM_DEADLINE_SECONDS_<TOOL NAME> if set, else the tool's
+default (document generation gets longer), else LLM_DEADLINE_SECONDS. A call that
+misses it raises DeadlineExceeded, which the agent sees as a failed tool call.
+
+With hedging (LLM_HEDGE, on by default), a call still running after the tool's recent
+p95 latency (LLM_HEDGE_PERCENTILE) is sent a second time and the first answer wins.
+Hedging waits until a tool has LLM_HEDGE_MIN_SAMPLES latencies to go on, and tools in
+LLM_HEDGE_EXCLUDE (the long, expensive document generation by default) are never
+hedged. Async losers are cancelled outright; a sync loser can't be interrupted, so its
+thread is abandoned and its answer dropped (it holds its proxy slot until it ends or hits
+LLM_TIMEOUT_SECONDS). Both are counted as
+llm.hedge.cancelled.<tool>, next to llm.hedge.sent.<tool>, llm.hedge.won.<tool> and
+llm.deadline_exceeded.<tool>.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+# Deadlines (seconds) for tools that need something other than LLM_DEADLINE_SECONDS
+DEFAULT_DEADLINES = {"comprehensive_pip_generator": 300.0}
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call took longer than its deadline"""
+
+
+def deadline_for(name):
+    """The deadline in seconds for calls made by name (a tool)"""
+    value = os.environ.get(f"LLM_DEADLINE_SECONDS_{name.upper()}")
+    if value:
+        return float(value)
+    if name in DEFAULT_DEADLINES:
+        return DEFAULT_DEADLINES[name]
+    return float(os.environ.get("LLM_DEADLINE_SECONDS", "60"))
+
+
+def hedge_delay(name):
+    """Seconds after which a call by name is duplicated, or None if it isn't hedged"""
+    if os.environ.get("LLM_HEDGE", "1") == "0":
+        return None
+    excluded = os.environ.get("LLM_HEDGE_EXCLUDE", "comprehensive_pip_generator").split(",")
+    if name in [tool.strip() for tool in excluded]:
+        return None
+    summary = f"llm.latency_seconds.{name}"
+    if metrics.count(summary) < int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20")):
+        return None
+    return metrics.percentile(summary, float(os.environ.get("LLM_HEDGE_PERCENTILE", "95")))
+
+
+def _start(fn, *args, **kwargs):
+    """Run fn on a daemon thread in the caller's context; returns a Future for its result"""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # A daemon thread, so an abandoned attempt never holds up shutdown
+    threading.Thread(target=run, name="llm-call", daemon=True).start()
+    return future
+
+
+class GuardedModel:
+    """
+    A chat model whose invoke() and ainvoke() keep to name's deadline and are hedged.
+
+    deadline and delay override deadline_for(name) and hedge_delay(name).
+    """
+
+    def __init__(self, model, name, deadline=None, delay=None):
+        self.model = model
+        self.name = name
+        self.deadline = deadline
+        self.delay = delay
+
+    def _plan(self):
+        deadline = self.deadline if self.deadline is not None else deadline_for(self.name)
+        delay = self.delay if self.delay is not None else hedge_delay(self.name)
+        if delay is not None and delay >= deadline:
+            delay = None
+        return deadline, delay
+
+    def _won(self, start, hedged):
+        metrics.observe(f"llm.latency_seconds.{self.name}", time.monotonic() - start)
+        if hedged:
+            metrics.incr(f"llm.hedge.won.{self.name}")
+
+    def _missed(self):
+        metrics.incr(f"llm.deadline_exceeded.{self.name}")
+        return DeadlineExceeded(f"{self.name} model call took longer than its deadline")
+
+    def invoke(self, messages, **kwargs):
+        deadline, delay = self._plan()
+        start = time.monotonic()
+        give_up_at = start + deadline
+
+        def submit():
+            # Run in the caller's context so tracing callbacks still apply
+            return _start(self.model.invoke, messages, **kwargs)
+
+        primary = submit()
+        pending = {primary}
+        hedge = None
+        while True:
+            timeout = give_up_at - time.monotonic()
+            if hedge is None and delay is not None:
+                timeout = min(timeout, start + delay - time.monotonic())
+            done, pending = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            # A failed attempt only decides the call once no other attempt is left
+            for future in done:
+                if future.exception() is None or not pending:
+                    self._drop(pending)
+                    if future.exception() is None:
+                        self._won(start, future is hedge)
+                    return future.result()
+            if time.monotonic() >= give_up_at:
+                self._drop(pending)
+                raise self._missed()
+            if hedge is None and delay is not None and time.monotonic() >= start + delay:
+                hedge = submit()
+                pending.add(hedge)
+                metrics.incr(f"llm.hedge.sent.{self.name}")
+
+    def _drop(self, pending):
+        for future in pending:
+            # A running call can't be interrupted; it finishes (or times out) unseen
+            future.cancel()
+            metrics.incr(f"llm.hedge.cancelled.{self.name}")
+
+    async def ainvoke(self, messages, **kwargs):
+        deadline, delay = self._plan()
+        start = time.monotonic()
+        give_up_at = start + deadline
+        primary = asyncio.ensure_future(self.model.ainvoke(messages, **kwargs))
+        pending = {primary}
+        hedge = None
+        try:
+            while True:
+                timeout = give_up_at - time.monotonic()
+                if hedge is None and delay is not None:
+                    timeout = min(timeout, start + delay - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None or not pending:
+                        if task.exception() is None:
+                            self._won(start, task is hedge)
+                        return task.result()
+                if time.monotonic() >= give_up_at:
+                    raise self._missed()
+                if hedge is None and delay is not None and time.monotonic() >= start + delay:
+                    hedge = asyncio.ensure_future(self.model.ainvoke(messages, **kwargs))
+                    pending.add(hedge)
+                    metrics.incr(f"llm.hedge.sent.{self.name}")
+        finally:
+            # The losers (or everything, past the deadline or on cancellation) stop here
+            for task in pending:
+                task.cancel()
+                metrics.incr(f"llm.hedge.cancelled.{self.name}")
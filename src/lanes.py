@@ -0,0 +1,35 @@
+"""
+Turn Lanes
+
+Picks the dispatcher lane for a Slack turn before it runs. A turn goes to the bulk lane
+when it is likely to generate the PIP document: the manager asks for the document, or the
+thread's phase tracker has reached the generation phase (the last gap's support resources
+are awaiting confirmation, or a document was already generated and is being revised).
+Everything else is a quick question-and-answer turn for the interactive lane. The tracker
+is the one the runtime keeps in memory, so choosing a lane reads no storage. A misjudged
+turn still cannot starve the interactive lane: the generator tool runs under bulk_work().
+"""
+
+import re
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.dispatch import BULK, INTERACTIVE
+from src.runtime import get_agent_runtime
+
+_GENERATE_REQUEST = re.compile(
+    r"\b(generate|draft|create|write|produce|finali[sz]e)\b.{0,40}\b(pip|plan|document)\b",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def choose_lane(thread_id, text):
+    """The lane for a turn answering text in thread_id"""
+    if _GENERATE_REQUEST.search(text or ""):
+        return BULK
+    tracker = get_agent_runtime().pip_phase(thread_id)
+    if tracker is not None and tracker.generating():
+        return BULK
+    return INTERACTIVE
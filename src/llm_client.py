@@ -0,0 +1,187 @@
+"""
+Shared LLM Client
+
+One connection-pooled HTTP client (plus an async twin) for every call to the LiteLLM
+proxy, so the agent and all the tools reuse keep-alive connections instead of paying
+for client construction and a new TCP/TLS handshake per call. Connection reuse is
+tracked per model. Requests go through the shared outbound limiter (src/llm_limiter.py),
+which caps how many are in flight and retries throttled ones.
+"""
+
+import os
+import threading
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from aws_deploy.aws_secrets import get_secrets
+from src.llm_limiter import AsyncLimitedTransport, LimitedTransport, request_model
+from src.metrics import metrics
+
+
+def pool_limits():
+    """Connection pool size and keep-alive from LLM_POOL_MAX_CONNECTIONS, LLM_POOL_MAX_KEEPALIVE, LLM_KEEPALIVE_SECONDS"""
+    return httpx.Limits(
+        max_connections=int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_SECONDS", "60")),
+    )
+
+
+def request_timeout():
+    """Timeouts from LLM_TIMEOUT_SECONDS (read/write/pool) and LLM_CONNECT_TIMEOUT_SECONDS"""
+    return httpx.Timeout(
+        float(os.environ.get("LLM_TIMEOUT_SECONDS", "120")),
+        connect=float(os.environ.get("LLM_CONNECT_TIMEOUT_SECONDS", "10")),
+    )
+
+
+class ConnectionStats:
+    """Counts requests per model and whether each opened a new connection or reused one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, model, new_connection):
+        kind = "new_connections" if new_connection else "reused_connections"
+        with self._lock:
+            stats = self._models.setdefault(model, {"requests": 0, "new_connections": 0, "reused_connections": 0})
+            stats["requests"] += 1
+            stats[kind] += 1
+        metrics.incr(f"llm.requests.{model}")
+        metrics.incr(f"llm.{kind}.{model}")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: dict(stats, reuse_rate=stats["reused_connections"] / stats["requests"])
+                for model, stats in self._models.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
+
+
+connection_stats = ConnectionStats()
+
+
+class _RequestTrace:
+    """httpcore trace hook noting whether a request had to open a connection"""
+
+    def __init__(self, model):
+        self.model = model
+        self.new_connection = False
+
+    def _note(self, event_name, info):
+        if event_name.startswith("connection.connect_tcp."):
+            self.new_connection = True
+
+    def __call__(self, event_name, info):
+        self._note(event_name, info)
+
+
+class _AsyncRequestTrace(_RequestTrace):
+    async def __call__(self, event_name, info):
+        self._note(event_name, info)
+
+
+def _on_request(request):
+    request.extensions["trace"] = _RequestTrace(request_model(request))
+
+
+def _on_response(response):
+    trace = response.request.extensions.get("trace")
+    if isinstance(trace, _RequestTrace):
+        connection_stats.record(trace.model, trace.new_connection)
+
+
+async def _on_async_request(request):
+    request.extensions["trace"] = _AsyncRequestTrace(request_model(request))
+
+
+async def _on_async_response(response):
+    _on_response(response)
+
+
+_lock = threading.RLock()
+_http_client = None
+_async_http_client = None
+_chat_models = {}
+
+
+def get_http_client():
+    """The process-wide pooled httpx.Client"""
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    # Every model call shares the outbound limiter and the 429-aware retries
+                    transport=LimitedTransport(httpx.HTTPTransport(limits=pool_limits())),
+                    timeout=request_timeout(),
+                    event_hooks={"request": [_on_request], "response": [_on_response]},
+                )
+    return _http_client
+
+
+def get_async_http_client():
+    """The process-wide pooled httpx.AsyncClient (bound to the event loop that first uses it)"""
+    global _async_http_client
+    if _async_http_client is None:
+        with _lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(
+                    transport=AsyncLimitedTransport(httpx.AsyncHTTPTransport(limits=pool_limits())),
+                    timeout=request_timeout(),
+                    event_hooks={"request": [_on_async_request], "response": [_on_async_response]},
+                )
+    return _async_http_client
+
+
+def get_chat_model(temperature=None, model=None, api_key=None, base_url=None):
+    """
+    Return a ChatOpenAI for the LiteLLM proxy that shares the pooled HTTP clients.
+
+    Settings default to ANTHROPIC_MODEL, API_KEY and BASE_URL. Instances are cached
+    per configuration, so repeated calls are cheap and safe across threads.
+    """
+    model = model or get_secrets("ANTHROPIC_MODEL")  # Still use the Anthropic model name
+    api_key = api_key or get_secrets("API_KEY")  # Use the Anthropic API key
+    base_url = base_url or get_secrets("BASE_URL")  # Use the LiteLLM proxy URL
+    key = (model, api_key, base_url, temperature)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        with _lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                kwargs = {"temperature": temperature} if temperature is not None else {}
+                chat_model = _chat_models[key] = ChatOpenAI(
+                    model=model,
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=request_timeout(),
+                    http_client=get_http_client(),
+                    http_async_client=get_async_http_client(),
+                    # Retries (and Retry-After) are handled by the pooled clients' transports
+                    max_retries=0,
+                    **kwargs
+                )
+    return chat_model
+
+
+def reset_llm_clients():
+    """Close the pooled clients and forget cached models (e.g. after the pool settings change)"""
+    global _http_client, _async_http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        # The async client may belong to a loop that is gone; let it be collected
+        _async_http_client = None
+        _chat_models.clear()
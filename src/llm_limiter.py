@@ -0,0 +1,380 @@
+"""
+Outbound LLM Limiter
+
+Caps how many requests the process has in flight to the LiteLLM proxy, across the agent
+and every tool, and retries the ones the proxy pushes back on. The cap is
+LLM_MAX_IN_FLIGHT; a request waits for a free slot (first come, first served) for up to
+LLM_LIMITER_WAIT_SECONDS. A slot is held until the response body has been read, so
+streamed replies count for as long as they stream.
+
+429s, 408s, 409s, 5xx responses and connection errors are retried up to LLM_MAX_RETRIES
+times. The wait honours the proxy's Retry-After (plus a little jitter so callers don't
+retry in lockstep); without one it is jittered exponential backoff from
+LLM_RETRY_BASE_SECONDS up to LLM_RETRY_MAX_SECONDS. The slot is given up while waiting.
+
+Each attempt first asks the model backend's circuit breaker (src.circuit_breaker), so
+while the proxy is down requests fail at once with CircuitOpen instead of retrying.
+
+Both retry layers can't be on at once: the OpenAI client's own retries are turned off
+where these transports are used. Per-model counters are recorded as llm.throttled.<model>,
+llm.retries.<model> and llm.gave_up.<model>; slot usage as llm.in_flight, llm.waiting and
+llm.limiter_wait_seconds.
+"""
+
+import asyncio
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.circuit_breaker import CircuitOpen, failed_status, get_circuit_breaker
+from src.metrics import metrics
+
+RETRY_STATUSES = {408, 409, 429}
+
+
+def _retryable(status):
+    return status in RETRY_STATUSES or status >= 500
+
+
+def retry_after_seconds(response):
+    """The wait the server asked for (Retry-After or retry-after-ms), or None"""
+    milliseconds = response.headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How often and how long to back off; settings default to LLM_MAX_RETRIES and LLM_RETRY_*"""
+
+    def __init__(self, max_retries=None, base=None, cap=None):
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("LLM_MAX_RETRIES", "4"))
+        self.base = base if base is not None else float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5"))
+        self.cap = cap if cap is not None else float(os.environ.get("LLM_RETRY_MAX_SECONDS", "30"))
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (0-based)"""
+        if retry_after is not None:
+            # Do as the server says, spread out a little so waiting callers don't return together
+            return min(self.cap, retry_after) + random.uniform(0, min(1.0, 0.1 * retry_after + 0.05))
+        backoff = min(self.cap, self.base * 2 ** attempt)
+        return random.uniform(backoff / 2, backoff)
+
+
+class OutboundLimiter:
+    """
+    A first-come, first-served cap on in-flight requests shared by threads and event loops.
+
+    A released slot is handed straight to the longest waiter, so a burst can't overtake
+    requests that were already waiting.
+    """
+
+    def __init__(self, max_in_flight=None, max_wait=None):
+        self.max_in_flight = max_in_flight or int(os.environ.get("LLM_MAX_IN_FLIGHT", "16"))
+        self.max_wait = max_wait if max_wait is not None else float(os.environ.get("LLM_LIMITER_WAIT_SECONDS", "60"))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # Callables that hand a freed slot to a waiting thread or task
+        self._waiters = deque()
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def _try_acquire(self):
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self._record()
+            return True
+        return False
+
+    def acquire(self):
+        """Wait for a slot; returns False if none came free within max_wait"""
+        start = time.monotonic()
+        granted = threading.Event()
+        with self._lock:
+            if self._try_acquire():
+                return True
+            self._waiters.append(granted.set)
+            self._record()
+        if not granted.wait(self.max_wait):
+            with self._lock:
+                if granted.set in self._waiters:
+                    self._waiters.remove(granted.set)
+                    self._record()
+                    return False
+            # Handed a slot just as the wait ran out
+        metrics.observe("llm.limiter_wait_seconds", time.monotonic() - start)
+        return True
+
+    async def aacquire(self):
+        """Async version of acquire(); waiting never blocks the event loop"""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(self._grant, granted)
+
+        with self._lock:
+            if self._try_acquire():
+                return True
+            self._waiters.append(grant)
+            self._record()
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                waiting = grant in self._waiters
+                if waiting:
+                    self._waiters.remove(grant)
+                    self._record()
+            # A slot already on its way is passed on by _grant, or here if it has arrived
+            if not waiting and not granted.cancel():
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+        metrics.observe("llm.limiter_wait_seconds", time.monotonic() - start)
+        return True
+
+    def _grant(self, granted):
+        if granted.cancelled():
+            self.release()
+        else:
+            granted.set_result(True)
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the next waiter; in_flight stays the same
+                grant = self._waiters.popleft()
+            else:
+                grant = None
+                self._in_flight -= 1
+            self._record()
+        if grant is not None:
+            grant()
+
+    def _record(self):
+        metrics.set_gauge("llm.in_flight", self._in_flight)
+        metrics.set_gauge("llm.waiting", len(self._waiters))
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """A response body that gives the limiter slot back once it is closed"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def request_model(request):
+    """The model named in an OpenAI-style JSON request body"""
+    try:
+        return json.loads(request.content).get("model") or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def _slot_timeout(request):
+    metrics.incr(f"llm.limiter_timeouts.{request_model(request)}")
+    return httpx.PoolTimeout("Too many LLM requests in flight", request=request)
+
+
+def _circuit_open(request):
+    return CircuitOpen(f"LLM backend circuit is open; not sending {request_model(request)} request")
+
+
+class LimitedTransport(httpx.BaseTransport):
+    """Wraps a transport with the circuit breaker, the outbound limiter and the retry policy."""
+
+    def __init__(self, transport, limiter=None, policy=None, sleep=time.sleep, breaker=None):
+        self._transport = transport
+        self.limiter = limiter or get_outbound_limiter()
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or get_circuit_breaker()
+        self._sleep = sleep
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            ticket = self.breaker.allow()
+            if ticket is None:
+                raise _circuit_open(request)
+            if not self.limiter.acquire():
+                self.breaker.abandon(ticket)
+                raise _slot_timeout(request)
+            start = time.monotonic()
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError:
+                self.breaker.record(ticket, True, time.monotonic() - start)
+                self.limiter.release()
+                if attempt >= self.policy.max_retries:
+                    metrics.incr(f"llm.gave_up.{request_model(request)}")
+                    raise
+                retry_after = None
+            except BaseException:
+                self.breaker.abandon(ticket)
+                self.limiter.release()
+                raise
+            else:
+                self.breaker.record(ticket, failed_status(response.status_code), time.monotonic() - start)
+                if not _retryable(response.status_code) or attempt >= self.policy.max_retries:
+                    if _retryable(response.status_code):
+                        metrics.incr(f"llm.gave_up.{request_model(request)}")
+                    response.stream = _ReleasingStream(response.stream, self.limiter.release)
+                    return response
+                retry_after = _note_retry(request, response)
+                response.read()
+                response.close()
+                self.limiter.release()
+            delay = self.policy.delay(attempt, retry_after)
+            metrics.incr(f"llm.retries.{request_model(request)}")
+            metrics.observe("llm.retry_wait_seconds", delay)
+            self._sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncLimitedTransport(httpx.AsyncBaseTransport):
+    """Async version of LimitedTransport."""
+
+    def __init__(self, transport, limiter=None, policy=None, sleep=asyncio.sleep, breaker=None):
+        self._transport = transport
+        self.limiter = limiter or get_outbound_limiter()
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or get_circuit_breaker()
+        self._sleep = sleep
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            ticket = self.breaker.allow()
+            if ticket is None:
+                raise _circuit_open(request)
+            try:
+                acquired = await self.limiter.aacquire()
+            except BaseException:
+                self.breaker.abandon(ticket)
+                raise
+            if not acquired:
+                self.breaker.abandon(ticket)
+                raise _slot_timeout(request)
+            start = time.monotonic()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.breaker.record(ticket, True, time.monotonic() - start)
+                self.limiter.release()
+                if attempt >= self.policy.max_retries:
+                    metrics.incr(f"llm.gave_up.{request_model(request)}")
+                    raise
+                retry_after = None
+            except BaseException:
+                self.breaker.abandon(ticket)
+                self.limiter.release()
+                raise
+            else:
+                self.breaker.record(ticket, failed_status(response.status_code), time.monotonic() - start)
+                if not _retryable(response.status_code) or attempt >= self.policy.max_retries:
+                    if _retryable(response.status_code):
+                        metrics.incr(f"llm.gave_up.{request_model(request)}")
+                    response.stream = _AsyncReleasingStream(response.stream, self.limiter.release)
+                    return response
+                retry_after = _note_retry(request, response)
+                await response.aread()
+                await response.aclose()
+                self.limiter.release()
+            delay = self.policy.delay(attempt, retry_after)
+            metrics.incr(f"llm.retries.{request_model(request)}")
+            metrics.observe("llm.retry_wait_seconds", delay)
+            await self._sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _note_retry(request, response):
+    if response.status_code == 429:
+        metrics.incr(f"llm.throttled.{request_model(request)}")
+    return retry_after_seconds(response)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_outbound_limiter():
+    """Return the process-wide outbound limiter, creating it on first use"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = OutboundLimiter()
+    return _limiter
+
+
+def set_outbound_limiter(limiter):
+    """Replace the process-wide limiter (e.g. with other settings in tests)"""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
+    return limiter
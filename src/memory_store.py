@@ -0,0 +1,678 @@
+"""
+Conversation Store
+
+Pluggable backends for persisting conversation history per thread. The SQLite backend
+reads and appends a single thread's messages through an indexed thread_id lookup, so
+the cost of a turn no longer grows with the number of stored threads.
+
+Every backend is safe to share between threads and between processes using the same
+memory directory: writers that must read-modify-write take an exclusive file lock,
+each thread carries a version that append_messages can check (optimistic concurrency),
+and thread_lock() serialises whole turns on a single thread_id.
+"""
+
+import os
+import json
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+# Define memory file paths for persistence
+MEMORY_DIR = Path(os.environ.get("MEMORY_DIR", "./memory"))
+MEMORY_DIR.mkdir(exist_ok=True)
+MEMORY_FILE = MEMORY_DIR / "conversation_memory.json"
+MEMORY_DB = MEMORY_DIR / "conversation_memory.db"
+MEMORY_SNAPSHOT = MEMORY_DIR / "conversation_memory.snapshot.json"
+MEMORY_JOURNAL = MEMORY_DIR / "conversation_memory.journal"
+
+
+def to_langchain_messages(messages):
+    """Convert stored {"role", "content"} dicts to LangChain messages"""
+    lc_messages = []
+    for msg in messages:
+        if msg["role"] == "human":
+            lc_messages.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "ai":
+            lc_messages.append(AIMessage(content=msg["content"]))
+    return lc_messages
+
+
+def from_langchain_messages(lc_messages):
+    """Convert LangChain human/ai messages back to stored {"role", "content"} dicts"""
+    return [
+        {"role": "human" if m.type == "human" else "ai", "content": m.content}
+        for m in lc_messages
+    ]
+
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a thread changed since the version the caller read."""
+
+    def __init__(self, thread_id, expected_version, actual_version):
+        super().__init__(
+            f"thread {thread_id} is at version {actual_version}, expected {expected_version}"
+        )
+        self.thread_id = thread_id
+        self.expected_version = expected_version
+        self.actual_version = actual_version
+
+
+class InterProcessLock:
+    """Exclusive lock held against other threads in this process and other processes."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock; with blocking=False return False instead of waiting"""
+        if not self._lock.acquire(blocking):
+            return False
+        try:
+            self._file = open(self.path, "a")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process holds it
+            self._file.close()
+            self._file = None
+            self._lock.release()
+            return False
+        except Exception:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        finally:
+            self._file = None
+            self._lock.release()
+
+    async def acquire_async(self, poll_seconds=0.005, max_poll_seconds=0.05):
+        """Take the lock from a coroutine by polling, so no OS thread blocks waiting for it"""
+        while not self.acquire(blocking=False):
+            await asyncio.sleep(poll_seconds)
+            poll_seconds = min(poll_seconds * 2, max_poll_seconds)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class ThreadLockManager:
+    """
+    Maps thread_ids onto a fixed set of InterProcessLock stripes in lock_dir.
+
+    Each thread_id hashes to one of `stripes` lock files, so the lock directory never
+    grows past that many files however many Slack threads there are. Two threads that
+    share a stripe wait for each other, which only costs throughput, not correctness.
+    """
+
+    def __init__(self, lock_dir, stripes=None):
+        if stripes is None:
+            stripes = int(os.environ.get("MEMORY_LOCK_STRIPES", "256"))
+        self.lock_dir = Path(lock_dir)
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.stripes = max(stripes, 1)
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def stripe(self, thread_id):
+        """Return the stripe number a thread_id locks"""
+        digest = hashlib.sha1(thread_id.encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.stripes
+
+    def lock(self, thread_id):
+        stripe = self.stripe(thread_id)
+        with self._guard:
+            lock = self._locks.get(stripe)
+            if lock is None:
+                lock = self._locks[stripe] = InterProcessLock(self.lock_dir / f"stripe-{stripe:03d}.lock")
+        return lock
+
+
+class ConversationStore:
+    """Base class for conversation store backends."""
+
+    def __init__(self, lock_dir):
+        self.locks = ThreadLockManager(lock_dir)
+
+    def thread_lock(self, thread_id):
+        """Lock a thread_id against concurrent turns in this and other processes"""
+        return self.locks.lock(thread_id)
+
+    def load_thread(self, thread_id):
+        """Return {"messages": [...], "version": n} for a thread, empty if it doesn't exist"""
+        raise NotImplementedError
+
+    def get_version(self, thread_id):
+        """Return a thread's current version (0 if it doesn't exist)"""
+        return self.load_thread(thread_id)["version"]
+
+    def load_history(self, thread_id):
+        """Return (LangChain messages, version) for a thread"""
+        data = self.load_thread(thread_id)
+        return to_langchain_messages(data["messages"]), data["version"]
+
+    def append_messages(self, thread_id, messages, expected_version=None):
+        """
+        Append messages ({"role": ..., "content": ...}) to the end of a thread.
+
+        If expected_version is given and the thread has moved on since, nothing is
+        written and ConcurrentUpdateError is raised. Returns the new version.
+        """
+        raise NotImplementedError
+
+    def save_thread(self, thread_id, memory_data):
+        """Replace a thread's stored messages with memory_data["messages"]"""
+        raise NotImplementedError
+
+    def delete_thread(self, thread_id):
+        """Delete a thread, returning True if it existed"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Delete every thread"""
+        raise NotImplementedError
+
+    def list_threads(self):
+        """Return a list of (thread_id, message_count) tuples"""
+        raise NotImplementedError
+
+
+def _check_version(thread_id, expected_version, actual_version):
+    if expected_version is not None and expected_version != actual_version:
+        raise ConcurrentUpdateError(thread_id, expected_version, actual_version)
+
+
+class JsonConversationStore(ConversationStore):
+    """Legacy backend keeping every thread in a single JSON file."""
+
+    def __init__(self, path=MEMORY_FILE, lock_dir=None):
+        self.path = Path(path)
+        super().__init__(lock_dir or self.path.parent / "locks")
+        self._file_lock = InterProcessLock(self.path.parent / f"{self.path.name}.lock")
+
+    def _read_all(self):
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error loading memory: {e}")
+        return {}
+
+    def _write_all(self, all_memory):
+        # Errors propagate so callers never see a version that wasn't persisted
+        tmp_path = self.path.parent / f"{self.path.name}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(all_memory, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def load_thread(self, thread_id):
+        with self._file_lock:
+            data = self._read_all().get(thread_id, {"messages": []})
+        return {"messages": data.get("messages", []), "version": data.get("version", 0)}
+
+    def append_messages(self, thread_id, messages, expected_version=None):
+        with self._file_lock:
+            all_memory = self._read_all()
+            data = all_memory.setdefault(thread_id, {"messages": []})
+            _check_version(thread_id, expected_version, data.get("version", 0))
+            data["messages"].extend(messages)
+            data["version"] = data.get("version", 0) + 1
+            self._write_all(all_memory)
+            return data["version"]
+
+    def save_thread(self, thread_id, memory_data):
+        with self._file_lock:
+            all_memory = self._read_all()
+            version = all_memory.get(thread_id, {}).get("version", 0) + 1
+            all_memory[thread_id] = {"messages": list(memory_data.get("messages", [])), "version": version}
+            self._write_all(all_memory)
+
+    def delete_thread(self, thread_id):
+        with self._file_lock:
+            all_memory = self._read_all()
+            if thread_id not in all_memory:
+                return False
+            del all_memory[thread_id]
+            self._write_all(all_memory)
+            return True
+
+    def clear(self):
+        with self._file_lock:
+            if self.path.exists():
+                os.remove(self.path)
+
+    def list_threads(self):
+        with self._file_lock:
+            all_memory = self._read_all()
+        return [(tid, len(data.get("messages", []))) for tid, data in all_memory.items()]
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Backend storing one row per message in SQLite.
+
+    Messages are indexed by (thread_id, seq) and a small threads table keeps message
+    counts and versions, so loading, appending and listing never touch other threads'
+    history. Writes run in BEGIN IMMEDIATE transactions, which SQLite serialises across
+    threads and processes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS threads (
+            thread_id TEXT PRIMARY KEY,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            thread_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (thread_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path=MEMORY_DB, lock_dir=None):
+        self.path = Path(path)
+        super().__init__(lock_dir or self.path.parent / "locks")
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.executescript(self.SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(threads)")]
+            if "version" not in columns:
+                # Databases created before versioning was added
+                conn.execute("ALTER TABLE threads ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        """Return this OS thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load_thread(self, thread_id):
+        conn = self._connect()
+        with conn:
+            # Read the version and the messages from the same snapshot
+            conn.execute("BEGIN")
+            row = conn.execute("SELECT version FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            rows = conn.execute(
+                "SELECT role, content FROM messages WHERE thread_id = ? ORDER BY seq",
+                (thread_id,)
+            ).fetchall()
+        return {
+            "messages": [{"role": role, "content": content} for role, content in rows],
+            "version": row[0] if row else 0,
+        }
+
+    def get_version(self, thread_id):
+        row = self._connect().execute("SELECT version FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _append(self, conn, thread_id, messages, expected_version=None):
+        row = conn.execute(
+            "SELECT message_count, version FROM threads WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        count, version = row if row else (0, 0)
+        _check_version(thread_id, expected_version, version)
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO messages (thread_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            [(thread_id, count + i, m["role"], m["content"], now) for i, m in enumerate(messages)]
+        )
+        conn.execute(
+            "INSERT INTO threads (thread_id, message_count, version, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET message_count = excluded.message_count, "
+            "version = excluded.version, updated_at = excluded.updated_at",
+            (thread_id, count + len(messages), version + 1, now)
+        )
+        return version + 1
+
+    def append_messages(self, thread_id, messages, expected_version=None):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return self._append(conn, thread_id, messages, expected_version)
+
+    def save_thread(self, thread_id, memory_data):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            conn.execute(
+                "UPDATE threads SET message_count = 0 WHERE thread_id = ?", (thread_id,)
+            )
+            self._append(conn, thread_id, memory_data.get("messages", []), row[0] if row else 0)
+
+    def delete_thread(self, thread_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            deleted = conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,)).rowcount
+        return deleted > 0
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM threads")
+
+    def list_threads(self):
+        return self._connect().execute(
+            "SELECT thread_id, message_count FROM threads ORDER BY updated_at"
+        ).fetchall()
+
+    def get_meta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+
+class JournalConversationStore(ConversationStore):
+    """
+    Backend that appends each change to a journal and periodically compacts it.
+
+    Every append writes a single JSON line (just the new messages), so its cost does not
+    depend on how much history is stored. Every compact_every records the in-memory
+    state is written to a snapshot file atomically (temp file + rename) and the journal
+    is truncated. On startup the snapshot is loaded and the journal tail replayed;
+    records carry a sequence number so a crash between writing the snapshot and
+    truncating the journal never applies a record twice, and a torn final line from a
+    crash mid-write is discarded.
+
+    All access happens under an exclusive file lock. Before each operation the store
+    replays any records other processes appended since it last looked (or reloads if
+    another process compacted), so replicas sharing the memory directory stay in step.
+    """
+
+    def __init__(self, snapshot_path=MEMORY_SNAPSHOT, journal_path=MEMORY_JOURNAL,
+                 compact_every=None, fsync=True, legacy_path=None, lock_dir=None):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path)
+        super().__init__(lock_dir or self.journal_path.parent / "locks")
+        if compact_every is None:
+            compact_every = int(os.environ.get("MEMORY_COMPACT_EVERY", "500"))
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._file_lock = InterProcessLock(self.journal_path.parent / f"{self.journal_path.name}.lock")
+        self._journal = open(self.journal_path, "ab")
+        with self._file_lock:
+            self._reload()
+            if not self.snapshot_path.exists() and self._offset == 0 and legacy_path and Path(legacy_path).exists():
+                # Seed from the legacy single-file store the first time journal mode starts
+                legacy = JsonConversationStore(legacy_path)._read_all()
+                self._threads = {tid: data.get("messages", []) for tid, data in legacy.items()}
+                self._versions = {tid: 1 for tid in legacy}
+                self._compact()
+                print(f"Seeded journal store with {len(legacy)} threads from {legacy_path}")
+
+    def _snapshot_signature(self):
+        try:
+            stat = self.snapshot_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reload(self):
+        """Rebuild state from the snapshot plus the whole journal"""
+        self._threads = {}
+        self._versions = {}
+        self._seq = self._snapshot_seq = 0
+        self._offset = 0
+        self._snapshot_sig = self._snapshot_signature()
+        if self._snapshot_sig is not None:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._threads = {tid: data["messages"] for tid, data in snapshot["threads"].items()}
+            self._versions = {tid: data.get("version", 1) for tid, data in snapshot["threads"].items()}
+            self._seq = self._snapshot_seq = snapshot["last_seq"]
+        replayed = self._replay()
+        if replayed:
+            print(f"Replayed {replayed} journal records")
+
+    def _replay(self):
+        """Apply journal records written after self._offset"""
+        replayed = 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; everything after it is unusable
+                    print(f"Discarding incomplete journal record at offset {self._offset}")
+                    self._journal.truncate(self._offset)
+                    break
+                self._offset += len(line)
+                if record["seq"] <= self._snapshot_seq:
+                    continue
+                self._apply(record)
+                self._seq = record["seq"]
+                replayed += 1
+        return replayed
+
+    def _sync(self):
+        """Catch up with changes made by other processes (file lock must be held)"""
+        if self._snapshot_signature() != self._snapshot_sig:
+            # Another process compacted; its snapshot supersedes our view
+            self._reload()
+        elif os.path.getsize(self.journal_path) != self._offset:
+            if os.path.getsize(self.journal_path) < self._offset:
+                self._reload()
+            else:
+                self._replay()
+
+    def _apply(self, record):
+        op = record["op"]
+        thread_id = record.get("thread_id")
+        if op == "append":
+            self._threads.setdefault(thread_id, []).extend(record["messages"])
+            self._versions[thread_id] = self._versions.get(thread_id, 0) + 1
+        elif op == "save":
+            self._threads[thread_id] = list(record["messages"])
+            self._versions[thread_id] = self._versions.get(thread_id, 0) + 1
+        elif op == "delete":
+            self._threads.pop(thread_id, None)
+            self._versions.pop(thread_id, None)
+        elif op == "clear":
+            self._threads = {}
+            self._versions = {}
+
+    def _write(self, record):
+        """Append a record to the journal and apply it in memory (file lock must be held)"""
+        self._seq += 1
+        record["seq"] = self._seq
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        self._journal.write(line)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._offset += len(line)
+        self._apply(record)
+        if self._seq - self._snapshot_seq >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        snapshot = {
+            "last_seq": self._seq,
+            "threads": {
+                tid: {"messages": messages, "version": self._versions.get(tid, 0)}
+                for tid, messages in self._threads.items()
+            },
+        }
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._snapshot_seq = self._seq
+        self._snapshot_sig = self._snapshot_signature()
+        self._journal.truncate(0)
+        self._offset = 0
+
+    def compact(self):
+        """Write an atomic snapshot of the current state and truncate the journal"""
+        with self._file_lock:
+            self._sync()
+            self._compact()
+
+    def close(self):
+        with self._file_lock:
+            self._journal.close()
+
+    def load_thread(self, thread_id):
+        with self._file_lock:
+            self._sync()
+            return {
+                "messages": list(self._threads.get(thread_id, [])),
+                "version": self._versions.get(thread_id, 0),
+            }
+
+    def get_version(self, thread_id):
+        with self._file_lock:
+            self._sync()
+            return self._versions.get(thread_id, 0)
+
+    def append_messages(self, thread_id, messages, expected_version=None):
+        with self._file_lock:
+            self._sync()
+            _check_version(thread_id, expected_version, self._versions.get(thread_id, 0))
+            self._write({"op": "append", "thread_id": thread_id, "messages": list(messages)})
+            return self._versions[thread_id]
+
+    def save_thread(self, thread_id, memory_data):
+        with self._file_lock:
+            self._sync()
+            self._write({"op": "save", "thread_id": thread_id, "messages": list(memory_data.get("messages", []))})
+
+    def delete_thread(self, thread_id):
+        with self._file_lock:
+            self._sync()
+            if thread_id not in self._threads:
+                return False
+            self._write({"op": "delete", "thread_id": thread_id})
+            return True
+
+    def clear(self):
+        with self._file_lock:
+            self._sync()
+            self._write({"op": "clear"})
+
+    def list_threads(self):
+        with self._file_lock:
+            self._sync()
+            return [(tid, len(messages)) for tid, messages in self._threads.items()]
+
+
+def migrate_json_memory(store, json_path=MEMORY_FILE):
+    """
+    One-shot import of the legacy conversation_memory.json into a SQLite store.
+
+    The JSON file is left in place; the store records that the migration ran so it is
+    never repeated. Returns the number of threads imported.
+    """
+    json_path = Path(json_path)
+    # Replicas starting together must not both import the file
+    with store.thread_lock("__migrate_json__"):
+        if store.get_meta("migrated_from_json") or not json_path.exists():
+            return 0
+
+        legacy = JsonConversationStore(json_path)._read_all()
+        for thread_id, memory_data in legacy.items():
+            store.save_thread(thread_id, memory_data)
+        store.set_meta("migrated_from_json", str(json_path))
+    print(f"Migrated {len(legacy)} conversation threads from {json_path}")
+    return len(legacy)
+
+
+def create_persistent_store(backend=None):
+    """Create the backend selected by MEMORY_BACKEND ("sqlite" by default, "journal" or "json")"""
+    backend = (backend or os.environ.get("MEMORY_BACKEND", "sqlite")).lower()
+    if backend == "json":
+        return JsonConversationStore(MEMORY_FILE)
+    if backend == "journal":
+        return JournalConversationStore(MEMORY_SNAPSHOT, MEMORY_JOURNAL, legacy_path=MEMORY_FILE)
+    if backend == "sqlite":
+        store = SQLiteConversationStore(MEMORY_DB)
+        migrate_json_memory(store, MEMORY_FILE)
+        return store
+    raise ValueError(f"Unknown MEMORY_BACKEND: {backend}")
+
+
+def create_conversation_store(backend=None):
+    """Create the persistent backend, fronted by the hot-thread cache unless it is disabled"""
+    store = create_persistent_store(backend)
+    if int(os.environ.get("THREAD_CACHE_MAX_THREADS", "256")) <= 0:
+        return store
+    # Imported here because the cache module builds on this one
+    from src.thread_cache import CachedConversationStore
+    return CachedConversationStore(store)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide conversation store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_conversation_store()
+    return _store
+
+
+def set_conversation_store(store):
+    """Replace the process-wide conversation store (used by tests and tools)"""
+    global _store
+    with _store_lock:
+        _store = store
+    return store
@@ -0,0 +1,107 @@
+"""
+Metrics
+
+A small thread-safe, in-process registry of counters, gauges and timing summaries.
+Components record into the shared `metrics` instance; snapshot() returns everything
+as a plain dict that can be logged or attached to a Langfuse trace.
+"""
+
+import threading
+
+
+class Summary:
+    """Running count/sum/max plus a bounded window of recent values for percentiles."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.window = window
+        self._recent = []
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+        if len(self._recent) > self.window:
+            del self._recent[0]
+
+    def percentile(self, p):
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class Metrics:
+    """Thread-safe named counters, gauges and summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = Summary()
+            summary.observe(value)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name):
+        with self._lock:
+            return self._gauges.get(name)
+
+    def count(self, name):
+        """How many values a summary has observed"""
+        with self._lock:
+            summary = self._summaries.get(name)
+            return summary.count if summary else 0
+
+    def percentile(self, name, p):
+        with self._lock:
+            summary = self._summaries.get(name)
+            return summary.percentile(p) if summary else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {name: s.as_dict() for name, s in self._summaries.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+# Shared registry used across the application
+metrics = Metrics()
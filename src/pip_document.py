@@ -0,0 +1,214 @@
+"""
+PIP Document
+
+Assembles a PIP document from sections drafted one performance gap at a time. Each
+gap's section (title, current performance, examples, expected performance, goal,
+action plans and support resources) comes back from the model under fixed headings;
+parse_section reads them and assemble_document lays the sections out in the
+prompts.output_format layout. The letter's fixed text (the opening, the monitoring
+and consequences paragraphs and the signature block) is taken from that template, so
+the two can't drift apart.
+
+The template's placeholders (the date, the employee's name, address, job title, team
+and identification number, and the signatory) are filled from LetterDetails, which
+parse_letter_details reads from a short completion run alongside the sections. A detail
+the conversation didn't give is left as a blank line to fill in by hand, so no
+"[...]" placeholder is left in the document.
+"""
+
+import re
+import textwrap
+from dataclasses import dataclass, field
+from datetime import date
+from typing import List
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from prompts.output_format import pip_output_format
+
+# The headings a drafted section uses, in order, and the GapSection field each fills
+SECTION_HEADINGS = (
+    ("Performance gap:", "title"),
+    ("Current performance:", "current_performance"),
+    ("Examples:", "examples"),
+    ("Expected performance", "expected_performance"),
+    ("Goal:", "goal"),
+    ("Action Plans:", "action_plans"),
+    ("Support & Resources:", "resources"),
+)
+
+HEADING = re.compile(
+    r"^[\s*#]*(" + "|".join(re.escape(heading.rstrip(":")) for heading, _ in SECTION_HEADINGS) + r")\b:?\**[ \t]*",
+    re.IGNORECASE | re.MULTILINE
+)
+FIELDS_BY_HEADING = {heading.rstrip(":").lower(): name for heading, name in SECTION_HEADINGS}
+BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+# The letter details a completion gives, one "Heading: value" line each
+LETTER_HEADINGS = (
+    ("Employee name:", "employee_name"),
+    ("Address:", "address"),
+    ("Identification number:", "id_number"),
+    ("Signatory name:", "signatory_name"),
+    ("Signatory designation:", "signatory_designation"),
+)
+UNKNOWN = re.compile(r"^\W*(unknown|not (given|provided|mentioned)|none|n/?a)?\W*$", re.IGNORECASE)
+PLACEHOLDER = re.compile(r"\[[^\]\n]*\]")
+ADDRESS_LINES = re.compile(r"\[Address Line 1\]\n\[Address Line 2\]\n\[Address Line 3\]\n")
+# What a detail nobody gave is left as, for the letter to be completed by hand
+BLANK = "_______________"
+
+_TEMPLATE = textwrap.dedent(pip_output_format).strip("\n")
+# The template's text before the first gap, and from the monitoring paragraph to the end
+OPENING = _TEMPLATE[:_TEMPLATE.index("Performance Areas Requiring Improvement:")].rstrip()
+CLOSING = _TEMPLATE[_TEMPLATE.index("We will monitor"):].rstrip()
+
+
+@dataclass
+class GapSection:
+    """The drafted text for one performance gap"""
+    title: str = ""
+    current_performance: str = ""
+    examples: str = ""
+    expected_performance: str = ""
+    goal: str = ""
+    action_plans: List[str] = field(default_factory=list)
+    resources: List[str] = field(default_factory=list)
+
+    def is_complete(self):
+        """Whether the draft has every part the document needs"""
+        return all((self.title, self.current_performance, self.expected_performance, self.goal, self.action_plans))
+
+
+@dataclass
+class LetterDetails:
+    """The details the letter around the sections needs ("" where unknown)"""
+    date: str = ""
+    employee_name: str = ""
+    address: List[str] = field(default_factory=list)
+    id_number: str = ""
+    signatory_name: str = ""
+    signatory_designation: str = ""
+    role: str = ""
+    team: str = ""
+
+
+def letter_date(day=None):
+    """A date as the letter gives it, e.g. "January 15, 2025" """
+    day = day or date.today()
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+def _items(text):
+    """The lines of a list, without their bullets or numbers"""
+    return [BULLET.sub("", line).strip() for line in text.splitlines() if BULLET.sub("", line).strip()]
+
+
+def parse_section(text, title=""):
+    """
+    Read a drafted section into a GapSection.
+
+    The model may bold or prefix the headings (e.g. "**Goal:**"); anything before the
+    first heading is ignored. title is used if the draft doesn't give one.
+    """
+    section = GapSection(title=title)
+    matches = list(HEADING.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        name = FIELDS_BY_HEADING[match.group(1).lower()]
+        if name in ("action_plans", "resources"):
+            setattr(section, name, _items(body))
+        elif body:
+            setattr(section, name, body.strip("*").strip())
+    return section
+
+
+def parse_letter_details(text, role="", team=""):
+    """
+    Read the letter details completion into LetterDetails.
+
+    Details given as unknown (or missing) stay empty; the address may span several
+    lines, separated by ";". role and team come from the PIP record, and the date is
+    today's.
+    """
+    details = LetterDetails(date=letter_date(), role=role, team=team)
+    names = {heading.rstrip(":").lower(): name for heading, name in LETTER_HEADINGS}
+    for line in text.splitlines():
+        heading, _, value = line.strip().strip("*-• ").partition(":")
+        name = names.get(heading.strip("* ").lower())
+        value = value.strip().strip("*").strip()
+        if name is None or UNKNOWN.match(value):
+            continue
+        if name == "address":
+            details.address = [part.strip() for part in value.split(";") if part.strip()][:3]
+        else:
+            setattr(details, name, value)
+    return details
+
+
+def _fill(text, details):
+    """text with the template's placeholders replaced from details, and any others blanked"""
+    address = "".join(f"{line}\n" for line in details.address)
+    text = ADDRESS_LINES.sub(lambda match: address, text)
+    values = {
+        "date": details.date,
+        "employee name": details.employee_name,
+        "employee full name as per id": details.employee_name,
+        "employee job title": details.role,
+        "employee team/sub-team": details.team,
+        "identification number": details.id_number,
+        "signatory name": details.signatory_name,
+        "signatory designation": details.signatory_designation,
+    }
+    return PLACEHOLDER.sub(lambda match: values.get(match.group(0)[1:-1].lower()) or BLANK, text)
+
+
+def assemble_document(sections, details=None):
+    """
+    The PIP document for sections, in order, in the prompts.output_format layout.
+
+    Support resources are listed once each, in the order the gaps first mention them.
+    The template's placeholders are filled from details (a LetterDetails), as are the
+    job title and team where a section left them as placeholders.
+    """
+    details = details or LetterDetails(date=letter_date())
+    lines = [_fill(OPENING, details), "", "Performance Areas Requiring Improvement:", ""]
+    for number, section in enumerate(sections, 1):
+        lines += [
+            f"{number}. {section.title}",
+            "",
+            "Current performance:",
+            section.current_performance,
+            "Examples:",
+            section.examples,
+            "Expected performance",
+            "",
+            _fill_role(section.expected_performance, details),
+            "",
+        ]
+    lines += ["", "", "Next steps on expected improvements:", ""]
+    for section in sections:
+        lines += [section.title, "", f"Goal: {section.goal}", "", "Action Plans:"]
+        lines += [f"{number}. {plan}" for number, plan in enumerate(section.action_plans, 1)]
+        lines.append("")
+    resources = []
+    seen = set()
+    for section in sections:
+        for resource in section.resources:
+            if resource.lower() not in seen:
+                seen.add(resource.lower())
+                resources.append(resource)
+    lines += ["To support your improvement efforts, we will provide:", ""]
+    lines += [f"- {resource}" for resource in resources]
+    lines += ["", _fill(CLOSING, details)]
+    return "\n".join(lines)
+
+
+def _fill_role(text, details):
+    """A drafted section with the job title and team filled in, should it have left them as placeholders"""
+    for placeholder, value in (("[employee job title]", details.role), ("[employee team/sub-team]", details.team)):
+        text = re.sub(re.escape(placeholder), lambda match: value or BLANK, text, flags=re.IGNORECASE)
+    return text
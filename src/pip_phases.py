@@ -0,0 +1,382 @@
+"""
+PIP Phase Tracker
+
+The PIP conversation is a fixed sequence: employee info, then four questions per
+performance gap, two improvement plan questions per gap, one support resources question
+per gap, and finally the document. PhaseTracker follows a thread through that sequence
+from the replies it has been sent, so a turn that simply answers the question just asked
+can go straight to the tool that asked it, without a model call to work out where the
+conversation is.
+
+Replies are classified by their last question (or a completion notice) with the
+patterns below, which cover the wording the tools use and older variants of the flow
+found in recorded threads. Anything the tracker can't place, and any input that isn't
+an answer (a question, a greeting, a request to go back), is left to the agent: route()
+returns None.
+"""
+
+import re
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.pip_record import EMPLOYEE_SLOTS, GAP_SLOTS, LABELS, PIPRecord
+
+EMPLOYEE_INFO = "employee_info"
+GAPS = "performance_gaps"
+IMPROVEMENT = "improvement_plan"
+SUPPORT = "support_resources"
+DOCUMENT = "document"
+DONE = "done"
+
+PHASES = (EMPLOYEE_INFO, GAPS, IMPROVEMENT, SUPPORT, DOCUMENT)
+
+PHASE_TOOLS = {
+    EMPLOYEE_INFO: "employee_info_extractor",
+    GAPS: "performance_gap_analyzer",
+    IMPROVEMENT: "improvement_plan_analyzer",
+    SUPPORT: "support_resources_identifier",
+    DOCUMENT: "comprehensive_pip_generator",
+}
+
+TOOL_PHASES = {tool: phase for phase, tool in PHASE_TOOLS.items()}
+
+# Questions in the order each phase asks them; the last one ends a gap (or the phase).
+# Earlier variants of the flow also asked for the name, manager, how concerns were
+# raised and a timeline.
+PHASE_SLOTS = {
+    EMPLOYEE_INFO: ("name", "manager", "role", "team"),
+    GAPS: ("title", "current_performance", "examples", "previous_concerns", "expected_performance"),
+    IMPROVEMENT: ("goal", "action_steps", "timeline"),
+    SUPPORT: ("resources",),
+}
+
+# Questions that close a gap (or the employee details); "summary" is a phase's request
+# to refine anything collected so far
+GAP_END_SLOTS = {"team", "expected_performance", "action_steps", "timeline", "resources", "summary"}
+
+# (phase, slot, pattern), tried in order against the last question of a reply. Later
+# phases come first: their questions mention the gap or goal they are about.
+SLOT_PATTERNS = [(phase, slot, re.compile(pattern, re.IGNORECASE)) for phase, slot, pattern in (
+    (SUPPORT, "resources", r"support(ing)? (and |or )?resources|resources (are|will be) available|support plan|support (section|statement)"),
+    (IMPROVEMENT, "action_steps", r"action(able)? (steps|plans?|items)|\bsteps to achieve"),
+    (IMPROVEMENT, "timeline", r"timeline|time ?frame|by when"),
+    (IMPROVEMENT, "goal", r"goal for improvement|improvement goal|(this|the|your) goal\b|goal statement"),
+    (GAPS, "title", r"gap title|(this|the|your) title\b|specific performance gap (you'?ve|you have) identified|performance (gap|issue)s? (need|needs) to be addressed"),
+    (GAPS, "current_performance", r"current performance|(this|the|your|original) summary"),
+    (GAPS, "examples", r"examples?\b"),
+    (GAPS, "previous_concerns", r"concerns\b.{0,120}\b(been|were) raised|raised (these|this|the) concerns?"),
+    (GAPS, "expected_performance", r"expected (level of )?performance|expectations?\b|(this|the|your|original) (statement|description)"),
+    (EMPLOYEE_INFO, "name", r"\b(full|last|first) name\b|employee'?s name"),
+    (EMPLOYEE_INFO, "manager", r"\bmanager\b"),
+    (EMPLOYEE_INFO, "role", r"job title|\brole\b|position"),
+    (EMPLOYEE_INFO, "team", r"\bteam\b|department"),
+)]
+
+MORE_GAPS = re.compile(r"\b(any|more|other|additional|another|next)\b.{0,40}\bperformance (gaps?|issues?|areas?)\b", re.IGNORECASE)
+
+# A question asking the user to accept or refine what they just gave
+CONFIRM = re.compile(
+    r"\b(refine|revise|modify|change|adjust|update)\b.{0,80}\b(satisfied|happy|proceed|move|continue|keep)\b"
+    r"|\brefine any of (this|the)\b|\b(use|keep) (this|the) (revised|refined|suggested|updated)|\bsatisfied with\b|\blooks? good\b|\bis (this|that) (correct|accurate)\b",
+    re.IGNORECASE
+)
+
+# Notices that a phase is finished, matched on the whole reply. Each phase names the
+# next one it hands over to.
+COMPLETE_PATTERNS = [(phase, re.compile(pattern, re.IGNORECASE)) for phase, pattern in (
+    (SUPPORT, r"support resources? (information )?(collection )?(is|are) complete|(generate|create|prepare) the (final |comprehensive )?(pip|performance improvement plan)"),
+    (IMPROVEMENT, r"improvement plan (information )?(collection )?is complete|(proceed|move on|moving on|continue) to .{0,30}support"),
+    (GAPS, r"performance gap (information )?(collection )?is complete|(proceed|move on|moving on|continue) to .{0,30}improvement plan"),
+    (EMPLOYEE_INFO, r"employee (information|info|details) (collection )?is complete|(proceed|move on|moving on|continue) to .{0,30}performance gaps?"),
+)]
+
+# A generated PIP document rather than a question
+DOCUMENT_PATTERN = re.compile(r"\bDear\b.*\bPerformance Improvement Plan\b|PERFORMANCE IMPROVEMENT PLAN", re.DOTALL)
+
+AFFIRMATIVE = re.compile(r"^\s*(yes|yep|yeah|yup|y|ok|okay|sure)\b", re.IGNORECASE)
+
+# Accepting an answer (or its revision) as it stands
+PROCEED = re.compile(
+    r"^\s*(sounds good|looks good|good|fine|great|perfect|correct|proceed|continue|next|move on|no changes?|"
+    r"(i'?m |i am )?(satisfied|happy)|(use|keep|go with) (the |this |that |my )?(revised|refined|suggested|updated|new|original)|"
+    r"that'?s (fine|good|great|correct|right)|all good|(yes|ok|okay)\W+(satisfied|proceed|continue|looks good|move on))\b",
+    re.IGNORECASE
+)
+
+NEGATIVE = re.compile(r"^\s*(no|nope|nah|n|none|not really|that'?s (all|it)|no more|nothing (else|more))\b", re.IGNORECASE)
+
+# Choosing the revision a tool suggested over the answer as given
+USE_SUGGESTION = re.compile(r"\b(revised|refined|suggested|suggestion|your version|updated)\b", re.IGNORECASE)
+
+# Where a tool's feedback gives its suggested rewrite of the answer
+SUGGESTION = re.compile(
+    r"(?:I suggest[^:\n]*|Suggested revision|Revised version|Revised \w+)\s*:\s*", re.IGNORECASE
+)
+
+# Input that isn't an answer to the question asked: leave it to the agent
+FREE_FORM = re.compile(
+    r"\?\s*$|^\s*(what|why|how|who|when|where|which|can|could|would|should|is|are|do|does|please explain|explain|"
+    r"help|hi|hello|hey|thanks|thank you|restart|start (over|again)|go back|back to|change|edit|skip|cancel|stop|"
+    r"show|generate|create|draft|i want to|i wanna|i'?d like to|let'?s|let me)\b",
+    re.IGNORECASE
+)
+
+
+def last_question(text):
+    """The last sentence of text that ends with a question mark, or None"""
+    questions = re.findall(r"[^.?!\n]*\?", text or "")
+    return questions[-1].strip() if questions else None
+
+
+def suggested_revision(text):
+    """The rewrite of the user's answer a tool's feedback suggests, or None"""
+    match = None
+    for match in SUGGESTION.finditer(text or ""):
+        pass
+    if match is None:
+        return None
+    rest = text[match.end():]
+    question = last_question(rest)
+    if question is not None:
+        rest = rest[:rest.rfind(question)]
+    return rest.strip().strip("\"'“”").strip()[:2000] or None
+
+
+def classify(text):
+    """
+    Place a reply in the flow: (phase, slot, mode), or None if it can't be placed.
+
+    mode is "answer" for a question, "confirm" for a request to accept or refine the
+    last answer, or "complete" for a notice that phase is finished. A generated document
+    is (DOCUMENT, "document", "complete"); a request to refine anything collected so far
+    is (None, "summary", "confirm"), in whichever phase the thread is in.
+    """
+    if not text:
+        return None
+    if len(text) > 800 and DOCUMENT_PATTERN.search(text):
+        return DOCUMENT, "document", "complete"
+    question = last_question(text)
+    if question is not None and MORE_GAPS.search(question) and not CONFIRM.search(question):
+        return GAPS, "more_gaps", "answer"
+    for phase, pattern in COMPLETE_PATTERNS:
+        if pattern.search(text):
+            return phase, None, "complete"
+    if question is None:
+        return None
+    mode = "confirm" if CONFIRM.search(question) else "answer"
+    for phase, slot, pattern in SLOT_PATTERNS:
+        if pattern.search(question):
+            return phase, slot, mode
+    if mode == "confirm":
+        return None, "summary", mode
+    return None
+
+
+class PhaseTracker:
+    """
+    Where a thread is in the PIP flow, rebuilt from its messages and saved per thread.
+
+    phase, slot and mode describe the last reply the tracker could place (see classify);
+    unplaced replies clear slot, so the next turn goes to the agent. round counts the
+    gaps the current phase has started on and gaps the gaps collected so far. seen is how
+    many of the thread's messages have been observed, so each turn only reads the new ones.
+
+    record holds the confirmed answers (a PIPRecord). An answer waits in pending, with any
+    revision the tool suggested, until the user accepts it (accepted) or the tool moves on;
+    a new answer to the same question replaces it.
+    """
+
+    def __init__(self, phase=None, slot=None, mode=None, round=0, gaps=0, record=None, pending=None,
+                 accepted=False, seen=0):
+        self.phase = phase
+        self.slot = slot
+        self.mode = mode
+        self.round = round
+        self.gaps = gaps
+        self.record = record if isinstance(record, PIPRecord) else PIPRecord.from_dict(record)
+        self.pending = dict(pending) if pending else None
+        self.accepted = accepted
+        self.seen = seen
+
+    def as_dict(self):
+        return {
+            "phase": self.phase, "slot": self.slot, "mode": self.mode, "round": self.round,
+            "gaps": self.gaps, "record": self.record.as_dict(), "pending": self.pending,
+            "accepted": self.accepted, "seen": self.seen,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(**{key: data[key] for key in FIELDS if key in data})
+
+    @classmethod
+    def replay(cls, messages):
+        """A tracker that has observed messages from the start of the thread"""
+        tracker = cls()
+        tracker.observe(messages)
+        return tracker
+
+    def observe(self, messages):
+        """Read the thread's messages that arrived since the last call"""
+        for message in messages[self.seen:]:
+            if message.type == "human":
+                self._answered(message.content)
+            elif message.type == "tool":
+                if message.name == PHASE_TOOLS[DOCUMENT] and getattr(message, "status", None) != "error":
+                    self._place(DOCUMENT, "document", "complete")
+                elif message.name in TOOL_PHASES and getattr(message, "status", None) != "error":
+                    self._reply(message.content, TOOL_PHASES[message.name])
+            elif message.type == "ai" and message.content and not getattr(message, "tool_calls", None):
+                self._reply(message.content)
+        self.seen = len(messages)
+
+    def _reply(self, text, tool_phase=None):
+        text = text if isinstance(text, str) else str(text)
+        placed = classify(text)
+        if placed is None:
+            # Still within the tool's phase, but the question is unknown
+            self.slot, self.mode = None, None
+            if tool_phase is not None:
+                self.phase = tool_phase
+            return
+        phase, slot, mode = placed
+        if self.pending and (mode != "confirm" or slot not in (self.pending["slot"], "summary")):
+            # The tool has moved on from the answer
+            self._commit()
+        if self.pending and mode == "confirm":
+            self.pending["suggestion"] = suggested_revision(text)
+        self._place(phase, slot, mode)
+
+    def _place(self, phase, slot, mode):
+        if phase is None:
+            if self.phase not in (None, DONE):
+                self.slot, self.mode = slot, mode
+            return
+        if phase == DOCUMENT:
+            self.phase, self.slot, self.mode = DONE, None, None
+            return
+        first = PHASE_SLOTS[phase][0]
+        if phase != self.phase:
+            # Starting on the first gap
+            self.round = 1
+            if phase == GAPS:
+                self.gaps = max(self.gaps, 1)
+        elif slot == first and mode == "answer" and (self.slot != first or (self.mode == "confirm" and self.accepted)):
+            # Back to the phase's first question (not asked again after a refinement): the next gap
+            self.round += 1
+            if phase == GAPS:
+                self.gaps = max(self.gaps, self.round)
+        if phase != GAPS and self.round > self.gaps and self.gaps:
+            self.round = self.gaps
+        self.phase, self.slot, self.mode = phase, slot, mode
+
+    def _gap_index(self):
+        return max(self.round, 1) - 1 if self.phase in (GAPS, IMPROVEMENT, SUPPORT) else None
+
+    def _answered(self, text):
+        text = text.strip() if isinstance(text, str) else str(text)
+        self.accepted = self.mode == "confirm" and bool(PROCEED.search(text) or NEGATIVE.search(text))
+        if self.slot in RECORD_SLOTS and self.mode == "answer" and self.phase != DONE:
+            self.pending = {"slot": self.slot, "gap": self._gap_index(), "value": text, "suggestion": None}
+        elif self.pending and self.mode == "confirm":
+            if self.accepted:
+                if USE_SUGGESTION.search(text) and self.pending.get("suggestion"):
+                    self.pending["value"] = self.pending["suggestion"]
+                self._commit()
+            elif not FREE_FORM.search(text):
+                # A refined answer
+                self.pending.update(value=text, suggestion=None)
+
+    def _commit(self):
+        self.record.set(self.pending["slot"], self.pending["value"], self.pending["gap"])
+        self.pending = None
+
+    def brief(self, tool_name):
+        """What tool_name should be told of the record and the answer awaiting confirmation"""
+        lines = []
+        record = self.record.brief(tool_name, self._gap_index())
+        if record:
+            lines += ["PIP record so far:", record]
+        if self.pending:
+            lines.append(f"Awaiting confirmation, {LABELS[self.pending['slot']].lower()}: {self.pending['value']}")
+            if self.pending.get("suggestion"):
+                lines.append(f"Your suggested revision: {self.pending['suggestion']}")
+        if self.slot is not None and self.slot in LABELS:
+            asked = "feedback given, asked to refine or confirm" if self.mode == "confirm" else "asked"
+            lines.append(f"Last question: {LABELS[self.slot].lower()} ({asked})")
+        return "\n".join(lines)
+
+    def generating(self):
+        """
+        Whether the next turn is likely to generate the document: the support resources
+        for the last gap are awaiting confirmation, or a document was already generated
+        and may be revised
+        """
+        if self.phase in (DOCUMENT, DONE):
+            return True
+        return (self.phase == SUPPORT and bool(self.gaps) and self.round >= self.gaps
+                and self.mode in ("confirm", "complete"))
+
+    def _next_phase_tool(self):
+        """The tool for the phase after this one, or None when that is the document"""
+        following = PHASES[PHASES.index(self.phase) + 1]
+        return PHASE_TOOLS[following] if following != DOCUMENT else None
+
+    def _after_gap(self):
+        """The tool once the user accepts the last answer for a gap (or the summary)"""
+        if self.phase == EMPLOYEE_INFO:
+            return PHASE_TOOLS[GAPS]
+        if self.phase == GAPS:
+            # The gap analyzer asks about more gaps; its summary hands over to the plan
+            return PHASE_TOOLS[GAPS] if self.slot != "summary" else PHASE_TOOLS[IMPROVEMENT]
+        if not self.gaps:
+            return None
+        return self._next_phase_tool() if self.round >= self.gaps else PHASE_TOOLS[self.phase]
+
+    def route(self, user_text):
+        """
+        The tool that should handle user_text, or None to let the agent decide.
+
+        Only an answer (or a refinement) to one of the current flow's questions within a
+        phase is routed, to the tool that asked it (see ROUTED_SLOTS). Answers to a
+        phase's or a gap's last question, to whether there are more gaps and to a
+        phase's summary can move the flow on, so they are left to the agent, as are the
+        older variants' extra questions and the document.
+        """
+        if self.phase in (None, DONE) or not user_text or FREE_FORM.search(user_text):
+            return None
+        if self.slot is None or self.mode not in ("answer", "confirm"):
+            return None
+        if self.slot not in ROUTED_SLOTS:
+            return None
+        return PHASE_TOOLS[self.phase]
+
+    def tool_input(self, user_text, last_reply=None):
+        """The input_text for a routed tool call: what was last asked and what the user said"""
+        lines = [f"Current step: {self.phase.replace('_', ' ')}"]
+        if self.phase in (IMPROVEMENT, SUPPORT) and self.gaps:
+            lines[0] += f" (performance gap {max(self.round, 1)} of {self.gaps})"
+        if last_reply:
+            lines += ["", "Your last message to the manager:", last_reply]
+        lines += ["", "The manager's reply:", user_text]
+        return "\n".join(lines)
+
+
+FIELDS = ("phase", "slot", "mode", "round", "gaps", "record", "pending", "accepted", "seen")
+
+# The answers kept in the record (older variants' extra questions aren't)
+RECORD_SLOTS = set(EMPLOYEE_SLOTS) | set(GAP_SLOTS)
+
+# The questions whose answers route() sends straight to the asking tool: the record's,
+# except those that end a gap or a phase, where the agent picks the next step
+ROUTED_SLOTS = RECORD_SLOTS - GAP_END_SLOTS
+
+
+def tool_brief(state, tool_name):
+    """The record brief for tool_name from a thread's graph state ("" without a tracker)"""
+    data = (state or {}).get("pip_phase")
+    return PhaseTracker.from_dict(data).brief(tool_name) if data else ""
@@ -0,0 +1,98 @@
+"""
+PIP Record
+
+The answers a thread has collected so far: the employee's role and team, and for each
+performance gap its title, current performance, examples, expected performance, goal,
+action steps and support resources. The phase tracker (see src.pip_phases) fills it in
+as each answer is confirmed and saves it with the thread, and each question-asking tool
+is given only the part of it that tool needs, instead of reading the transcript to
+work out what is already known.
+"""
+
+from dataclasses import asdict, dataclass, field, fields
+from typing import List
+
+
+@dataclass
+class GapRecord:
+    """What has been collected for one performance gap"""
+    title: str = ""
+    current_performance: str = ""
+    examples: str = ""
+    expected_performance: str = ""
+    goal: str = ""
+    action_steps: str = ""
+    resources: str = ""
+
+
+@dataclass
+class PIPRecord:
+    """What has been collected for a thread's PIP"""
+    role: str = ""
+    team: str = ""
+    gaps: List[GapRecord] = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(
+            role=data.get("role", ""),
+            team=data.get("team", ""),
+            gaps=[GapRecord(**gap) for gap in data.get("gaps", [])]
+        )
+
+    def set(self, slot, value, gap=None):
+        """Record the answer for slot (of gap, an index, for the per-gap slots)"""
+        if slot in EMPLOYEE_SLOTS:
+            setattr(self, slot, value)
+        elif slot in GAP_SLOTS and gap is not None:
+            while len(self.gaps) <= gap:
+                self.gaps.append(GapRecord())
+            setattr(self.gaps[gap], slot, value)
+
+    def brief(self, tool_name, gap=None):
+        """
+        The part of the record tool_name needs, as short labelled lines ("" if empty).
+
+        gap is the index of the gap being discussed; the other gaps appear by title only.
+        """
+        lines = [f"- {LABELS[slot]}: {getattr(self, slot)}" for slot in EMPLOYEE_SLOTS if getattr(self, slot)]
+        if tool_name != "employee_info_extractor" and self.gaps:
+            titles = "; ".join(f"{i}. {g.title or '(untitled)'}" for i, g in enumerate(self.gaps, 1))
+            lines.append(f"- Performance gaps so far: {titles}")
+            current = self.gaps[gap] if gap is not None and gap < len(self.gaps) else None
+            if current is not None:
+                lines.append(f"Performance gap {gap + 1} of {len(self.gaps)}:")
+                lines += [
+                    f"- {LABELS[slot]}: {getattr(current, slot)}"
+                    for slot in TOOL_GAP_SLOTS.get(tool_name, ()) if getattr(current, slot)
+                ]
+        return "\n".join(lines)
+
+
+EMPLOYEE_SLOTS = ("role", "team")
+GAP_SLOTS = tuple(f.name for f in fields(GapRecord))
+
+# The per-gap answers each tool is shown for the gap being discussed
+TOOL_GAP_SLOTS = {
+    "performance_gap_analyzer": ("title", "current_performance", "examples", "expected_performance"),
+    "improvement_plan_analyzer": ("title", "expected_performance", "goal", "action_steps"),
+    "support_resources_identifier": ("title", "goal", "action_steps", "resources"),
+    "comprehensive_pip_generator": GAP_SLOTS,
+}
+
+LABELS = {
+    "role": "Employee role",
+    "team": "Team",
+    "title": "Title",
+    "current_performance": "Current performance",
+    "examples": "Examples",
+    "expected_performance": "Expected performance",
+    "goal": "Goal",
+    "action_steps": "Action steps",
+    "resources": "Support resources",
+}
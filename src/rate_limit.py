@@ -0,0 +1,183 @@
+"""
+Admission Control
+
+Token buckets that limit how fast one Slack user, and the bot as a whole, can start
+agent turns (each of which drives several LLM calls through the LiteLLM proxy). A turn
+first takes a token from its user's bucket and then, once that token is due, one from
+the global bucket, so a user's queued turns never hold global tokens other users could be using.
+When a bucket is empty the turn is not refused: it reserves the next token and waits for
+it, so over-limit turns queue up in arrival order. Only a turn that would wait longer
+than RATE_LIMIT_MAX_QUEUE_SECONDS is rejected.
+
+Rates are per minute (RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_GLOBAL_PER_MINUTE) with
+bursts of RATE_LIMIT_USER_BURST and RATE_LIMIT_GLOBAL_BURST; a rate of 0 disables that
+limit. Admissions, queued and waiting turns, queueing time and the global bucket's level
+are recorded under ratelimit.*.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+
+class TokenBucket:
+    """
+    A bucket of up to burst tokens refilled at rate tokens per second.
+
+    reserve() may take the level below zero: the debt is the queue of turns waiting for
+    tokens that have not been refilled yet.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self):
+        self._refill()
+        return self._tokens
+
+    def reserve(self, n=1):
+        """Take n tokens; returns the seconds until they are actually available"""
+        self._refill()
+        self._tokens -= n
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, n=1):
+        self._tokens = min(self.burst, self._tokens + n)
+
+
+class AdmissionController:
+    """Per-user and global token buckets deciding when a turn may start."""
+
+    def __init__(self, user_rate=None, user_burst=None, global_rate=None, global_burst=None,
+                 max_queue_seconds=None, max_users=10000, clock=time.monotonic):
+        # Rates are given per minute and kept per second
+        self.user_rate = (user_rate if user_rate is not None else float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "6"))) / 60
+        self.user_burst = user_burst or int(os.environ.get("RATE_LIMIT_USER_BURST", "3"))
+        self.global_rate = (global_rate if global_rate is not None else float(os.environ.get("RATE_LIMIT_GLOBAL_PER_MINUTE", "60"))) / 60
+        self.global_burst = global_burst or int(os.environ.get("RATE_LIMIT_GLOBAL_BURST", "20"))
+        self.max_queue_seconds = max_queue_seconds if max_queue_seconds is not None else float(
+            os.environ.get("RATE_LIMIT_MAX_QUEUE_SECONDS", "120")
+        )
+        self.max_users = max_users
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(self.global_rate, self.global_burst, clock) if self.global_rate > 0 else None
+        # Least recently seen users first, so idle users' buckets are dropped first
+        self._users = OrderedDict()
+        self._queued = 0
+
+    def _user_bucket(self, user):
+        bucket = self._users.get(user)
+        if bucket is None:
+            bucket = self._users[user] = TokenBucket(self.user_rate, self.user_burst, self._clock)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user)
+        return bucket
+
+    def reserve_user(self, user):
+        """
+        Reserve user's next turn.
+
+        Returns the seconds until it may go on to reserve_global(), or None if it would
+        wait longer than max_queue_seconds and was rejected.
+        """
+        if self.user_rate <= 0:
+            return 0.0
+        with self._lock:
+            bucket = self._user_bucket(user)
+            delay = bucket.reserve()
+            if delay > self.max_queue_seconds:
+                bucket.refund()
+                metrics.incr("ratelimit.rejected")
+                return None
+            metrics.set_gauge("ratelimit.users", len(self._users))
+        return delay
+
+    def reserve_global(self):
+        """Reserve a turn from the global bucket; returns the seconds until it may start"""
+        if self._global is None:
+            return 0.0
+        with self._lock:
+            delay = self._global.reserve()
+            metrics.set_gauge("ratelimit.global_tokens", self._global.tokens)
+        return delay
+
+    def admit(self, user, start):
+        """
+        Call start() once user's and the global bucket allow another turn.
+
+        Returns the estimated seconds until then (0 if start() already ran), or None if the
+        turn was rejected. Waiting turns are started from a timer thread.
+        """
+        queued_at = self._clock()
+        delay = self.reserve_user(user)
+        if delay is None:
+            return None
+        then = self._user_token_due
+        if delay == 0:
+            delay = self.reserve_global()
+            if delay == 0:
+                metrics.incr("ratelimit.admitted")
+                start()
+                return 0.0
+            then = self._started
+        metrics.incr("ratelimit.queued")
+        metrics.set_gauge("ratelimit.waiting", self._waiting(1))
+        self._later(delay, then, queued_at, start)
+        return delay
+
+    def _user_token_due(self, queued_at, start):
+        self._later(self.reserve_global(), self._started, queued_at, start)
+
+    def _started(self, queued_at, start):
+        metrics.set_gauge("ratelimit.waiting", self._waiting(-1))
+        metrics.incr("ratelimit.admitted")
+        metrics.observe("ratelimit.queue_seconds", self._clock() - queued_at)
+        start()
+
+    def _waiting(self, change):
+        with self._lock:
+            self._queued += change
+            return self._queued
+
+    @staticmethod
+    def _later(delay, fn, *args):
+        if delay <= 0:
+            fn(*args)
+            return
+        timer = threading.Timer(delay, fn, args)
+        timer.daemon = True
+        timer.start()
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Return the process-wide admission controller, creating it on first use"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
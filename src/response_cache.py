@@ -0,0 +1,182 @@
+"""
+Response Cache
+
+Keeps each Slack event's reply by its channel:ts id so a redelivered event never runs
+the agent again. While the first attempt is still running, a redelivery attaches to
+that attempt's future; once it has finished, the cached text is re-posted if (and only
+if) the first attempt failed to deliver it. Entries expire after
+RESPONSE_CACHE_TTL_SECONDS and at most RESPONSE_CACHE_MAX_ENTRIES are kept.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+
+class ResponseEntry:
+    """One event's reply: a future for the text, and whether it reached Slack"""
+
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.future = Future()
+        self.delivered = False
+        self.created_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def text(self):
+        """The reply, or None while it is being computed (or if computing it failed)"""
+        if not self.future.done() or self.future.exception() is not None:
+            return None
+        return self.future.result()
+
+    def complete(self, text):
+        if not self.future.done():
+            self.future.set_result(text)
+
+    def fail(self, e):
+        if not self.future.done():
+            self.future.set_exception(e)
+
+    def mark_delivered(self):
+        with self._lock:
+            self.delivered = True
+
+    def claim_delivery(self):
+        """
+        Return the reply for the caller to post, or None if it was already delivered
+        (or there is none). Call delivery_failed() if posting it fails.
+        """
+        with self._lock:
+            text = self.text
+            if self.delivered or text is None:
+                return None
+            self.delivered = True
+            return text
+
+    def delivery_failed(self):
+        with self._lock:
+            self.delivered = False
+
+
+class ResponseCache:
+    """Bounded, expiring map of event id to ResponseEntry, oldest first."""
+
+    def __init__(self, ttl=None, max_entries=None, clock=time.monotonic):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+        self.max_entries = max_entries or int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def start(self, event_id):
+        """Begin an event's entry, or return the existing one for a redelivery"""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(event_id)
+            if entry is None:
+                entry = self._entries[event_id] = ResponseEntry(event_id)
+                entry.created_at = self._clock()
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return entry
+
+    def get(self, event_id):
+        with self._lock:
+            self._expire()
+            return self._entries.get(event_id)
+
+    def discard(self, event_id):
+        with self._lock:
+            self._entries.pop(event_id, None)
+
+    def _expire(self):
+        cutoff = self._clock() - self.ttl
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest.created_at > cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _repost(entry, post):
+    text = entry.claim_delivery()
+    if text is None:
+        return
+    try:
+        post(text)
+    except Exception:
+        entry.delivery_failed()
+        raise
+    metrics.incr("responses.reposted")
+
+
+def replay(entry, post):
+    """
+    Handle a redelivered event from its cached entry without calling the model.
+
+    If the first attempt is still running, post is attached to its future; either way
+    the reply is posted only if the first attempt didn't deliver it.
+    """
+    if entry.future.done():
+        metrics.incr("responses.redelivered_after_completion")
+        _repost(entry, post)
+        return
+
+    metrics.incr("responses.redelivered_in_flight")
+
+    def on_done(future):
+        try:
+            _repost(entry, post)
+        except Exception as e:
+            print(f"Error re-posting cached response: {e}")
+
+    entry.future.add_done_callback(on_done)
+
+
+async def areplay(entry, post):
+    """Async version of replay(); post is a coroutine function and an in-flight attempt is awaited"""
+    if entry.future.done():
+        metrics.incr("responses.redelivered_after_completion")
+    else:
+        metrics.incr("responses.redelivered_in_flight")
+        try:
+            await asyncio.wrap_future(entry.future)
+        except Exception:
+            return
+    text = entry.claim_delivery()
+    if text is None:
+        return
+    try:
+        await post(text)
+    except Exception:
+        entry.delivery_failed()
+        raise
+    metrics.incr("responses.reposted")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,501 @@
+"""
+Agent Runtime
+
+Builds the chat model, the PIP tools and the compiled ReAct agent graph once per process
+so every conversation turn (and every Slack thread) can reuse them.
+"""
+
+import importlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import prompts.agent_system_prompt
+from aws_deploy.aws_secrets import clear_secrets_cache
+from src.cancellation import TurnCancelled
+from src.checkpointer import build_checkpointer
+from src.context_window import ContextWindowManager, record_context_stats
+from src.llm_client import get_chat_model
+from src.metrics import metrics
+from src.pip_phases import PhaseTracker
+from tools.employee_info_extractor import EmployeeInfoExtractorTool
+from tools.performance_gap_analyzer import PerformanceGapAnalyzerTool
+from tools.improvement_plan_analyzer import ImprovementPlanAnalyzerTool
+from tools.support_resources_identifier import SupportResourcesIdentifierTool
+from tools.comprehensive_pip_generator import ComprehensivePIPGeneratorTool
+
+
+def build_chat_model():
+    """Create the agent's chat model using the LiteLLM proxy (over the shared connection pool)"""
+    return get_chat_model(temperature=0.3)
+
+
+def build_tools():
+    """Create the PIP tools available to the agent"""
+    return [
+        EmployeeInfoExtractorTool(),
+        PerformanceGapAnalyzerTool(),
+        ImprovementPlanAnalyzerTool(),
+        SupportResourcesIdentifierTool(),
+        ComprehensivePIPGeneratorTool(),
+    ]
+
+
+# Tools that ask the user the next question: their reply is the turn's answer
+QUESTION_TOOLS = (
+    "employee_info_extractor",
+    "performance_gap_analyzer",
+    "improvement_plan_analyzer",
+    "support_resources_identifier",
+)
+
+
+def direct_tool_names():
+    """Tools whose output goes straight to the user (AGENT_DIRECT_TOOLS, comma-separated)"""
+    names = os.environ.get("AGENT_DIRECT_TOOLS", ",".join(QUESTION_TOOLS))
+    return {name.strip() for name in names.split(",") if name.strip()}
+
+
+# How many threads' PIP phases AgentRuntime.pip_phase() remembers
+PHASE_CACHE_SIZE = 10000
+
+
+def phase_routing_enabled():
+    """Whether turns that answer the current PIP question skip the agent (AGENT_PHASE_ROUTING)"""
+    return os.environ.get("AGENT_PHASE_ROUTING", "0") != "0"
+
+
+def load_system_message(reload=False):
+    """Return the agent system message, optionally re-reading the prompt module"""
+    if reload:
+        importlib.reload(prompts.agent_system_prompt)
+    return prompts.agent_system_prompt.agent_system_message
+
+
+class PIPAgentState(AgentState):
+    """
+    Agent graph state plus the conversation store version the checkpoint matches and
+    where the thread is in the PIP flow (a PhaseTracker as a dict)
+    """
+    store_version: int
+    pip_phase: dict
+
+
+class AgentRuntime:
+    """
+    Holds the model, tools and compiled agent graph shared by every thread.
+
+    Graph state is checkpointed per thread_id, so a turn on a thread with a checkpoint
+    only sends the new message and the graph resumes from the saved state, tool calls
+    and tool results included. The system message and the context window are applied
+    when the model is called rather than stored in the checkpoint. Components are built
+    lazily on first use, or eagerly with warm_up(); rebuild() swaps in a fresh set
+    without disturbing turns that are already running on the previous one. The
+    checkpointer outlives rebuilds.
+
+    A turn whose model call only calls direct_tools (default: direct_tool_names()) ends
+    with the tools' output as the reply, instead of a further model call to restate it.
+
+    With a checkpointer, each thread carries a PhaseTracker, whose record of confirmed
+    answers the question-asking tools are given. With phase_routing (default:
+    phase_routing_enabled()), a turn that answers the question the tracker placed skips
+    the agent's model call: the tool call is written to the checkpoint as if the agent
+    had made it, and the graph runs from the tool. Other turns go to the agent as before.
+    """
+
+    def __init__(self, model_factory=build_chat_model, tools_factory=build_tools,
+                 system_message_factory=load_system_message, context_window_factory=ContextWindowManager,
+                 checkpointer_factory=build_checkpointer, direct_tools=None, phase_routing=None):
+        self._model_factory = model_factory
+        self._tools_factory = tools_factory
+        self._system_message_factory = system_message_factory
+        self._context_window_factory = context_window_factory
+        self._checkpointer_factory = checkpointer_factory
+        self.direct_tools = set(direct_tools) if direct_tools is not None else direct_tool_names()
+        self.phase_routing = phase_routing if phase_routing is not None else phase_routing_enabled()
+        self._lock = threading.Lock()
+        self._checkpointer_lock = threading.Lock()
+        self._components = None
+        self._checkpointer = None
+        self._checkpointer_built = False
+        self._phases = OrderedDict()
+        self._phases_lock = threading.Lock()
+        self.build_count = 0
+        self.last_build_seconds = None
+
+    def _build(self, reload_prompts=False):
+        """Build a new set of model, tools, agent graph, system message and context window"""
+        start = time.perf_counter()
+        model = self._model_factory()
+        tools = self._tools_factory()
+        for tool in tools:
+            # The graph ends the turn on these tools' output (see create_react_agent)
+            tool.return_direct = tool.name in self.direct_tools
+        system_message = self._system_message_factory(reload=reload_prompts)
+        context_window = self._context_window_factory()
+        agent_executor = create_react_agent(
+            model,
+            tools=tools,
+            prompt=self._make_prompt(system_message, context_window),
+            state_schema=PIPAgentState,
+            checkpointer=self.checkpointer,
+        )
+        self.last_build_seconds = time.perf_counter() - start
+        self.build_count += 1
+        return {
+            "model": model,
+            "tools": tools,
+            "agent_executor": agent_executor,
+            "system_message": system_message,
+            "context_window": context_window,
+        }
+
+    @staticmethod
+    def _make_prompt(system_message, context_window):
+        """Build the graph's prompt step: system message plus the history fitted to the budget"""
+        def prompt(state, config):
+            messages, context_stats = context_window.fit(list(state["messages"]), system_message)
+            # Report once per turn, not on every model call of the tool loop
+            if state["messages"] and isinstance(state["messages"][-1], HumanMessage):
+                record_context_stats(config["configurable"].get("thread_id"), context_stats)
+            return messages
+        return prompt
+
+    @property
+    def checkpointer(self):
+        """The checkpointer shared by every graph this runtime builds (None if disabled)"""
+        if not self._checkpointer_built:
+            with self._checkpointer_lock:
+                if not self._checkpointer_built:
+                    self._checkpointer = self._checkpointer_factory() if self._checkpointer_factory else None
+                    self._checkpointer_built = True
+        return self._checkpointer
+
+    def _get_components(self):
+        components = self._components
+        if components is None:
+            with self._lock:
+                if self._components is None:
+                    self._components = self._build()
+                components = self._components
+        return components
+
+    @property
+    def is_warm(self):
+        return self._components is not None
+
+    @property
+    def model(self):
+        return self._get_components()["model"]
+
+    @property
+    def tools(self):
+        return self._get_components()["tools"]
+
+    @property
+    def agent_executor(self):
+        return self._get_components()["agent_executor"]
+
+    @property
+    def system_message(self):
+        return self._get_components()["system_message"]
+
+    @property
+    def context_window(self):
+        return self._get_components()["context_window"]
+
+    def warm_up(self):
+        """Build everything up front so the first turn doesn't pay for it"""
+        self._get_components()
+        print(f"Agent runtime ready (build took {self.last_build_seconds:.3f}s)")
+        return self
+
+    def rebuild(self, refresh_secrets=False, reload_prompts=False):
+        """
+        Rebuild the model, tools and graph, e.g. after secrets or prompts change.
+
+        Turns already in flight keep using the components they started with.
+        """
+        if refresh_secrets:
+            clear_secrets_cache()
+        components = self._build(reload_prompts=reload_prompts)
+        with self._lock:
+            self._components = components
+        print(f"Agent runtime rebuilt (build took {self.last_build_seconds:.3f}s)")
+        return self
+
+    def checkpoint_version(self, thread_id):
+        """
+        Return the conversation store version the thread's checkpoint was saved at.
+
+        None means there is no usable checkpoint and the turn must seed the graph
+        with the stored history.
+        """
+        checkpointer = self.checkpointer
+        if checkpointer is None:
+            return None
+        saved = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+        if saved is None:
+            return None
+        return saved.checkpoint["channel_values"].get("store_version")
+
+    def tools_called(self, thread_id):
+        """Names of the tools the thread's checkpointed turns have called, oldest first"""
+        checkpointer = self.checkpointer
+        if checkpointer is None:
+            return []
+        saved = checkpointer.get_tuple({"configurable": {"thread_id": thread_id}})
+        if saved is None:
+            return []
+        return [
+            message.name for message in saved.checkpoint["channel_values"].get("messages", [])
+            if message.type == "tool"
+        ]
+
+    def pip_phase(self, thread_id):
+        """
+        The thread's PhaseTracker as of its last turn in this process, or None.
+
+        Kept in memory (for the PHASE_CACHE_SIZE most recent threads), so it can be
+        read before a turn is dispatched without touching the checkpointer.
+        """
+        with self._phases_lock:
+            data = self._phases.get(thread_id)
+        return PhaseTracker.from_dict(data) if data else None
+
+    def _remember_phase(self, thread_id, state):
+        """Bring the tracker up to date with the turn's reply and keep it for pip_phase()"""
+        data = (state or {}).get("pip_phase")
+        if not data:
+            return
+        tracker = PhaseTracker.from_dict(data)
+        tracker.observe(state["messages"])
+        with self._phases_lock:
+            self._phases[thread_id] = tracker.as_dict()
+            self._phases.move_to_end(thread_id)
+            while len(self._phases) > PHASE_CACHE_SIZE:
+                self._phases.popitem(last=False)
+
+    def forget_thread(self, thread_id):
+        """Drop a thread's checkpoints so its next turn starts from the conversation store"""
+        checkpointer = self.checkpointer
+        if checkpointer is not None:
+            checkpointer.delete_thread(thread_id)
+
+    def forget_all_threads(self):
+        """Drop every thread's checkpoints"""
+        checkpointer = self.checkpointer
+        if checkpointer is not None and hasattr(checkpointer, "clear"):
+            checkpointer.clear()
+        elif checkpointer is not None:
+            for thread_id in list(getattr(checkpointer, "storage", {})):
+                checkpointer.delete_thread(thread_id)
+
+    def invoke(self, messages, thread_id="default", store_version=None, on_partial=None, cancel=None):
+        """
+        Run the agent graph for a thread.
+
+        With a checkpoint, messages are added to the thread's saved state, so they should
+        only be the new ones; store_version is saved alongside for the next turn to check.
+        With on_partial, the agent's model calls are streamed and on_partial is called with
+        the text of the reply so far each time a token arrives. With cancel (a
+        threading.Event), the run stops with TurnCancelled at the first token or graph
+        step after it is set; the thread's checkpoint may then hold a partial run.
+        """
+        state = self._invoke(messages, thread_id, store_version, on_partial, cancel)
+        if _direct_tool_failed(state):
+            # Don't send a direct tool's error to the user; let the agent answer instead
+            state = self._invoke(state["messages"], thread_id, store_version, on_partial, cancel)
+        self._remember_phase(thread_id, state)
+        return state
+
+    def _invoke(self, messages, thread_id, store_version, on_partial, cancel):
+        state, config = self._run_args(messages, thread_id, store_version, cancel)
+        executor = self.agent_executor
+        if self._tracks_turn(state) and self._route(state, config, self._saved_state(config)):
+            executor.update_state(config, state, as_node="agent")
+            state = None
+        if on_partial is None and cancel is None:
+            return executor.invoke(state, config)
+        partial = _PartialReply(on_partial, cancel, self.direct_tools)
+        partial.check()
+        for mode, data in executor.stream(state, config, stream_mode=["messages", "values"]):
+            state = partial.feed(mode, data, state)
+        return state
+
+    async def ainvoke(self, messages, thread_id="default", store_version=None, on_partial=None, cancel=None):
+        """Async version of invoke(); model and tool calls await the LiteLLM proxy"""
+        state = await self._ainvoke(messages, thread_id, store_version, on_partial, cancel)
+        if _direct_tool_failed(state):
+            state = await self._ainvoke(state["messages"], thread_id, store_version, on_partial, cancel)
+        self._remember_phase(thread_id, state)
+        return state
+
+    async def _ainvoke(self, messages, thread_id, store_version, on_partial, cancel):
+        state, config = self._run_args(messages, thread_id, store_version, cancel)
+        executor = self.agent_executor
+        if self._tracks_turn(state) and self._route(state, config, await self._asaved_state(config)):
+            await executor.aupdate_state(config, state, as_node="agent")
+            state = None
+        if on_partial is None and cancel is None:
+            return await executor.ainvoke(state, config)
+        partial = _PartialReply(on_partial, cancel, self.direct_tools)
+        partial.check()
+        async for mode, data in executor.astream(state, config, stream_mode=["messages", "values"]):
+            state = partial.feed(mode, data, state)
+        return state
+
+    def _tracks_turn(self, state):
+        """Whether the thread's phase tracker is updated this turn (one that starts with a user message)"""
+        messages = state["messages"]
+        return self.checkpointer is not None and bool(messages) and isinstance(messages[-1], HumanMessage)
+
+    def _saved_state(self, config):
+        saved = self.checkpointer.get_tuple(config)
+        return saved.checkpoint["channel_values"] if saved else {}
+
+    async def _asaved_state(self, config):
+        saved = await self.checkpointer.aget_tuple(config)
+        return saved.checkpoint["channel_values"] if saved else {}
+
+    def _route(self, state, config, saved):
+        """
+        Bring the thread's phase tracker up to date and route the turn if it can (and may).
+
+        The tracker is added to state so it is saved with the turn. Returns True if the
+        turn was routed, in which case state's messages end with the tool call.
+        """
+        messages = state["messages"]
+        history = list(saved.get("messages", [])) + list(messages[:-1])
+        tracker = PhaseTracker.from_dict(saved.get("pip_phase"))
+        if tracker.seen > len(history):
+            tracker = PhaseTracker()
+        tracker.observe(history)
+        state["pip_phase"] = tracker.as_dict()
+        if not self.phase_routing:
+            return False
+        tool = tracker.route(messages[-1].content)
+        if tool is None:
+            metrics.incr("routing.fallback")
+            return False
+        last_reply = next((m.content for m in reversed(history) if m.type in ("ai", "tool") and m.content), None)
+        call = {"name": tool, "args": {"input_text": tracker.tool_input(messages[-1].content, last_reply)},
+                "id": f"route_{uuid.uuid4().hex[:12]}"}
+        state["messages"] = list(messages) + [AIMessage(content="", tool_calls=[call])]
+        metrics.incr("routing.routed")
+        metrics.incr(f"routing.routed.{tool}")
+        return True
+
+    @staticmethod
+    def _run_args(messages, thread_id, store_version, cancel=None):
+        state = {"messages": messages}
+        if store_version is not None:
+            state["store_version"] = store_version
+        config = {"configurable": {"thread_id": thread_id}}
+        if cancel is not None:
+            config["callbacks"] = [_CancelCheck(cancel)]
+        return state, config
+
+
+def _direct_tool_failed(state):
+    """Whether the run ended on a direct tool's error rather than its reply"""
+    last = state["messages"][-1] if state.get("messages") else None
+    return last is not None and last.type == "tool" and getattr(last, "status", None) == "error"
+
+
+class _CancelCheck(BaseCallbackHandler):
+    """
+    Raises TurnCancelled inside model and tool calls once cancel is set.
+
+    Leaving the stream loop alone would still wait for the running node to finish; raising
+    from the token callback stops the model call itself.
+    """
+
+    raise_error = True
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+
+    def _check(self, *args, **kwargs):
+        if self.cancel.is_set():
+            raise TurnCancelled("turn cancelled by a newer message")
+
+    on_llm_start = on_chat_model_start = on_llm_new_token = on_tool_start = _check
+
+
+class _PartialReply:
+    """
+    Accumulates streamed tokens from the agent's own model calls into reply text.
+
+    Tokens from the LLM calls made inside tools are skipped, unless the tools were
+    direct_tools and so write the reply themselves. Each new message (e.g. the answer
+    after a tool call) starts the text afresh.
+    """
+
+    def __init__(self, on_partial, cancel=None, direct_tools=()):
+        self.on_partial = on_partial
+        self.cancel = cancel
+        self.direct_tools = direct_tools
+        self.message_id = None
+        self.text = ""
+        # Whether the tools about to run answer the user directly
+        self.direct = False
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise TurnCancelled("turn cancelled by a newer message")
+
+    def feed(self, mode, data, state):
+        """Handle one (mode, data) item of the graph stream; returns the latest state"""
+        self.check()
+        if mode == "values":
+            calls = getattr(data["messages"][-1], "tool_calls", None) if data.get("messages") else None
+            self.direct = bool(calls) and all(call["name"] in self.direct_tools for call in calls)
+            return data
+        chunk, metadata = data
+        node = metadata.get("langgraph_node")
+        if node != "agent" and not (node == "tools" and self.direct and chunk.type in ("ai", "AIMessageChunk")):
+            return state
+        if chunk.id != self.message_id:
+            self.message_id = chunk.id
+            self.text = ""
+        token = chunk.content if isinstance(chunk.content, str) else "".join(
+            part.get("text", "") for part in chunk.content if isinstance(part, dict)
+        )
+        if token:
+            self.text += token
+            if self.on_partial is not None:
+                self.on_partial(self.text)
+        return state
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_agent_runtime():
+    """Return the process-wide agent runtime, creating it on first use"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AgentRuntime()
+    return _runtime
+
+
+def set_agent_runtime(runtime):
+    """Replace the process-wide agent runtime (used by tests and benchmarks)"""
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
+    return runtime
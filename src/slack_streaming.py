@@ -0,0 +1,269 @@
+"""
+Slack Streaming
+
+Shows the agent's reply in Slack while it is being generated: a placeholder reply is
+posted in the thread straight away and edited with chat.update as tokens arrive. Edits
+are throttled to one per SLACK_STREAM_UPDATE_SECONDS per message (Slack rate-limits
+chat.update), and a 429 pauses them for the Retry-After period. The final edit always
+carries the complete reply.
+
+Time to first visible token (from the start of the reply until Slack first shows reply
+text) is recorded as slack.time_to_first_token_seconds; time to the full reply as
+slack.time_to_full_response_seconds.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+
+PLACEHOLDER = ":hourglass_flowing_sand: Working on it..."
+# Marks a reply that is still being written
+CURSOR = " ▍"
+# Rate-limited attempts at the final edit before giving up
+FINAL_ATTEMPTS = 3
+# Replaces the partial reply of a turn cancelled by a newer message in the thread
+SUPERSEDED = ":fast_forward: Answering your newer message instead..."
+
+
+def update_interval():
+    """Minimum seconds between edits of a streaming message (SLACK_STREAM_UPDATE_SECONDS)"""
+    return float(os.environ.get("SLACK_STREAM_UPDATE_SECONDS", "1.0"))
+
+
+def streaming_enabled():
+    """Whether replies are streamed into Slack (SLACK_STREAMING, on by default)"""
+    return os.environ.get("SLACK_STREAMING", "1") != "0"
+
+
+def _retry_after(e):
+    """Seconds Slack asked us to wait, or None if the error isn't a rate limit"""
+    response = getattr(e, "response", None)
+    if response is None or response.status_code != 429:
+        return None
+    return float(response.headers.get("Retry-After", 1))
+
+
+class _StreamState:
+    """Throttle and timing bookkeeping shared by the sync and async streamers"""
+
+    def __init__(self, channel, thread_ts, min_interval=None, started_at=None):
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.min_interval = update_interval() if min_interval is None else min_interval
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.ts = None
+        self.ttft = None
+        self.updates = 0
+        # Whether the complete reply reached Slack
+        self.delivered = False
+        self._pending = None
+        self._next_update = 0.0
+        self._finished = False
+
+    def _wait_seconds(self):
+        return max(0.0, self._next_update - time.monotonic())
+
+    def _sent(self):
+        """Note a successful edit; the first one is when the user first sees the reply"""
+        self.updates += 1
+        self._next_update = time.monotonic() + self.min_interval
+        metrics.incr("slack.stream.updates")
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.started_at
+            metrics.observe("slack.time_to_first_token_seconds", self.ttft)
+
+    def _rate_limited(self, retry_after):
+        self._next_update = time.monotonic() + retry_after
+        metrics.incr("slack.stream.rate_limited")
+
+    def _finished_at(self):
+        elapsed = time.monotonic() - self.started_at
+        metrics.observe("slack.time_to_full_response_seconds", elapsed)
+        return elapsed
+
+
+class SlackStreamer(_StreamState):
+    """
+    Streams a reply into a Slack thread with a slack_sdk WebClient.
+
+    Call start() to post the placeholder, pass update as on_partial to chat_with_memory,
+    then finish(reply). update() never waits on Slack: edits go out from a timer thread.
+    """
+
+    def __init__(self, client, channel, thread_ts, min_interval=None, started_at=None):
+        super().__init__(channel, thread_ts, min_interval, started_at)
+        self.client = client
+        self._state_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._timer = None
+
+    def start(self):
+        try:
+            self.ts = self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, text=PLACEHOLDER
+            )["ts"]
+        except SlackApiError as e:
+            # Without a placeholder to edit, the reply is posted once at the end
+            print(f"Error posting placeholder: {e}")
+        return self
+
+    def update(self, text):
+        """Show text (the reply so far), at most once per update interval"""
+        with self._state_lock:
+            if self._finished or self.ts is None:
+                return
+            self._pending = text
+            if self._timer is None:
+                self._timer = threading.Timer(self._wait_seconds(), self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._send_lock:
+            # Another edit may have gone out since this one was scheduled
+            time.sleep(self._wait_seconds())
+            with self._state_lock:
+                text, self._pending, self._timer = self._pending, None, None
+            if text is None or self._finished:
+                return
+            if not self._edit(text + CURSOR):
+                # Rate limited: try again later unless newer text has arrived meanwhile
+                self.update(self._pending or text)
+
+    def _edit(self, text):
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+        except SlackApiError as e:
+            retry_after = _retry_after(e)
+            if retry_after is None:
+                print(f"Error updating streamed reply: {e}")
+                return True
+            self._rate_limited(retry_after)
+            return False
+        self._sent()
+        return True
+
+    def cancel(self):
+        """Stop streaming and mark the placeholder as superseded by a newer message"""
+        with self._state_lock:
+            self._finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._send_lock:
+            if self.ts is not None:
+                self._edit(SUPERSEDED)
+
+    def finish(self, text):
+        """Replace the placeholder with the complete reply (or post it if there is none)"""
+        with self._state_lock:
+            self._finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._send_lock:
+            if self.ts is not None:
+                sent_before = self.updates
+                for _ in range(FINAL_ATTEMPTS):
+                    time.sleep(self._wait_seconds())
+                    if self._edit(text):
+                        break
+                self.delivered = self.updates > sent_before
+            else:
+                self.client.chat_postMessage(channel=self.channel, thread_ts=self.thread_ts, text=text)
+                self._sent()
+                self.delivered = True
+        return self._finished_at()
+
+
+class AsyncSlackStreamer(_StreamState):
+    """
+    SlackStreamer for an AsyncWebClient on an asyncio event loop.
+
+    update() is a plain function (as on_partial must be); edits go out from a task.
+    """
+
+    def __init__(self, client, channel, thread_ts, min_interval=None, started_at=None):
+        super().__init__(channel, thread_ts, min_interval, started_at)
+        self.client = client
+        self._send_lock = asyncio.Lock()
+        self._task = None
+
+    async def start(self):
+        try:
+            response = await self.client.chat_postMessage(
+                channel=self.channel, thread_ts=self.thread_ts, text=PLACEHOLDER
+            )
+            self.ts = response["ts"]
+        except SlackApiError as e:
+            print(f"Error posting placeholder: {e}")
+        return self
+
+    def update(self, text):
+        """Show text (the reply so far), at most once per update interval"""
+        if self._finished or self.ts is None:
+            return
+        self._pending = text
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        async with self._send_lock:
+            await asyncio.sleep(self._wait_seconds())
+            text, self._pending, self._task = self._pending, None, None
+            if text is None or self._finished:
+                return
+            if not await self._edit(text + CURSOR):
+                self.update(self._pending or text)
+
+    async def _edit(self, text):
+        try:
+            await self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+        except SlackApiError as e:
+            retry_after = _retry_after(e)
+            if retry_after is None:
+                print(f"Error updating streamed reply: {e}")
+                return True
+            self._rate_limited(retry_after)
+            return False
+        self._sent()
+        return True
+
+    async def cancel(self):
+        """Stop streaming and mark the placeholder as superseded by a newer message"""
+        self._finished = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        async with self._send_lock:
+            if self.ts is not None:
+                await self._edit(SUPERSEDED)
+
+    async def finish(self, text):
+        """Replace the placeholder with the complete reply (or post it if there is none)"""
+        self._finished = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        async with self._send_lock:
+            if self.ts is not None:
+                sent_before = self.updates
+                for _ in range(FINAL_ATTEMPTS):
+                    await asyncio.sleep(self._wait_seconds())
+                    if await self._edit(text):
+                        break
+                self.delivered = self.updates > sent_before
+            else:
+                await self.client.chat_postMessage(channel=self.channel, thread_ts=self.thread_ts, text=text)
+                self._sent()
+                self.delivered = True
+        return self._finished_at()
@@ -0,0 +1,189 @@
+"""
+Thread History Cache
+
+Keeps recently used threads' histories in memory as LangChain messages, so turns on an
+active Slack thread neither re-read nor re-parse its history. The cache wraps a
+persistent conversation store and writes through to it.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.memory_store import (
+    ConcurrentUpdateError, ConversationStore, from_langchain_messages, to_langchain_messages
+)
+from src.metrics import metrics
+
+
+class _Entry:
+    __slots__ = ("messages", "version", "chars", "touched_at")
+
+    def __init__(self, messages, version):
+        self.messages = messages
+        self.version = version
+        self.chars = sum(len(m.content) for m in messages)
+        self.touched_at = time.monotonic()
+
+
+class CachedConversationStore(ConversationStore):
+    """
+    Write-through LRU/TTL cache in front of another ConversationStore.
+
+    At most max_threads histories and max_chars characters of message content are kept;
+    the least recently used threads are evicted first, and entries not touched for
+    ttl_seconds expire. Every write goes to the backing store before the cache is
+    updated. If the backing store reports a version conflict (another replica wrote to
+    the thread) the entry is dropped so the next turn reloads it.
+
+    With verify_versions (the default) every hit also asks the backing store for the
+    thread's version, a single indexed lookup, and reloads the history if another
+    replica has written to the thread since. A single-replica deployment can turn this
+    off (THREAD_CACHE_VERIFY_VERSION=0) so hot turns never touch the store at all.
+    """
+
+    def __init__(self, store, max_threads=None, max_chars=None, ttl_seconds=None, verify_versions=None):
+        self.store = store
+        self.locks = store.locks
+        if max_threads is None:
+            max_threads = int(os.environ.get("THREAD_CACHE_MAX_THREADS", "256"))
+        if max_chars is None:
+            max_chars = int(os.environ.get("THREAD_CACHE_MAX_CHARS", "20000000"))
+        if ttl_seconds is None:
+            ttl_seconds = float(os.environ.get("THREAD_CACHE_TTL_SECONDS", "1800"))
+        if verify_versions is None:
+            verify_versions = os.environ.get("THREAD_CACHE_VERIFY_VERSION", "1") != "0"
+        self.max_threads = max_threads
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self.verify_versions = verify_versions
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+
+    def _get(self, thread_id):
+        """Return a live entry and mark it most recently used (lock must be held)"""
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return None
+        if self.ttl_seconds and time.monotonic() - entry.touched_at > self.ttl_seconds:
+            self._remove(thread_id)
+            metrics.incr("thread_cache.expirations")
+            return None
+        entry.touched_at = time.monotonic()
+        self._entries.move_to_end(thread_id)
+        return entry
+
+    def _remove(self, thread_id):
+        entry = self._entries.pop(thread_id, None)
+        if entry is not None:
+            self._chars -= entry.chars
+
+    def _put(self, thread_id, messages, version):
+        self._remove(thread_id)
+        entry = _Entry(messages, version)
+        if entry.chars > self.max_chars or self.max_threads <= 0:
+            return
+        self._entries[thread_id] = entry
+        self._chars += entry.chars
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_threads or self._chars > self.max_chars):
+            thread_id, entry = self._entries.popitem(last=False)
+            self._chars -= entry.chars
+            self.evictions += 1
+            metrics.incr("thread_cache.evictions")
+        metrics.set_gauge("thread_cache.threads", len(self._entries))
+        metrics.set_gauge("thread_cache.chars", self._chars)
+
+    def invalidate(self, thread_id=None):
+        """Drop one thread (or everything) from the cache"""
+        with self._lock:
+            if thread_id is None:
+                self._entries.clear()
+                self._chars = 0
+            else:
+                self._remove(thread_id)
+
+    def load_history(self, thread_id):
+        with self._lock:
+            entry = self._get(thread_id)
+        if entry is not None and self.verify_versions and self.store.get_version(thread_id) != entry.version:
+            # Another replica wrote to the thread since it was cached
+            with self._lock:
+                if self._entries.get(thread_id) is entry:
+                    self._remove(thread_id)
+                self.stale_hits += 1
+            metrics.incr("thread_cache.stale_hits")
+            entry = None
+        with self._lock:
+            if entry is not None:
+                self.hits += 1
+                metrics.incr("thread_cache.hits")
+                return list(entry.messages), entry.version
+            self.misses += 1
+        metrics.incr("thread_cache.misses")
+        data = self.store.load_thread(thread_id)
+        messages = to_langchain_messages(data["messages"])
+        with self._lock:
+            self._put(thread_id, messages, data["version"])
+        return list(messages), data["version"]
+
+    def load_thread(self, thread_id):
+        messages, version = self.load_history(thread_id)
+        return {"messages": from_langchain_messages(messages), "version": version}
+
+    def append_messages(self, thread_id, messages, expected_version=None):
+        try:
+            version = self.store.append_messages(thread_id, messages, expected_version=expected_version)
+        except ConcurrentUpdateError:
+            self.invalidate(thread_id)
+            raise
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is not None and entry.version == version - 1:
+                self._put(thread_id, entry.messages + to_langchain_messages(messages), version)
+            else:
+                self._remove(thread_id)
+        return version
+
+    def save_thread(self, thread_id, memory_data):
+        self.invalidate(thread_id)
+        self.store.save_thread(thread_id, memory_data)
+
+    def delete_thread(self, thread_id):
+        self.invalidate(thread_id)
+        return self.store.delete_thread(thread_id)
+
+    def clear(self):
+        self.invalidate()
+        self.store.clear()
+
+    def get_version(self, thread_id):
+        return self.store.get_version(thread_id)
+
+    def list_threads(self):
+        return self.store.list_threads()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "threads": len(self._entries),
+                "chars": self._chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "hit_rate": self.hits / total if total else None,
+            }
@@ -0,0 +1,114 @@
+"""
+Local stand-in for the LiteLLM proxy's OpenAI-compatible API.
+
+Serves POST /chat/completions over HTTP/1.1 keep-alive on a random local port so the
+real ChatOpenAI client, connection pool and retry logic can be exercised offline.
+Replies echo the last user message; a per-request delay and scripted error responses
+can be set on the server, and a capacity makes it answer 429 (like a rate-limited proxy)
+while more requests than that are in flight.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, kept-alive sockets stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            scripted = server.script.pop(0) if server.script else None
+            over_capacity = server.capacity is not None and server.in_flight > server.capacity
+            if over_capacity:
+                server.throttled += 1
+        try:
+            status, headers, delay = 200, {}, server.delay
+            if over_capacity:
+                status, headers, delay = 429, {"Retry-After": str(server.retry_after)}, 0
+            elif scripted is not None:
+                status = scripted.get("status", 200)
+                headers = scripted.get("headers", {})
+                delay = scripted.get("delay", delay)
+            if delay:
+                time.sleep(delay)
+            if status == 200:
+                payload = self._completion(body)
+            else:
+                payload = {"error": {"message": f"stub error {status}", "type": "stub", "code": status}}
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _completion(self, body):
+        messages = body.get("messages", [])
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        return {
+            "id": f"chatcmpl-stub-{self.server.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"Echo: {last_user}"},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """OpenAI-compatible stub server; use as a context manager."""
+    daemon_threads = True
+
+    def __init__(self, delay=0.0, capacity=None, retry_after=0.1):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.delay = delay
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.throttled = 0
+        # Scripted responses for the next requests, e.g. {"status": 429, "headers": {"Retry-After": "1"}}
+        self.script = []
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,102 @@
+"""
+Stub chat model for offline tests and benchmarks.
+
+Behaves like a tool-calling chat model without touching the network, so the agent
+graph, memory store and Slack pipeline can be exercised locally.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+def echo_last_human(messages):
+    """Default responder: echo the most recent human message"""
+    for message in reversed(messages):
+        if message.type == "human":
+            return f"Echo: {message.content}"
+    return "Echo"
+
+
+def _reply_chunks(reply):
+    """Split a reply into word-sized stream chunks; tool calls arrive with the last one"""
+    words = re.findall(r"\S+\s*", reply.content) or [""]
+    for i, word in enumerate(words):
+        tool_call_chunks = []
+        if i == len(words) - 1:
+            tool_call_chunks = [
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": n}
+                for n, call in enumerate(reply.tool_calls)
+            ]
+        yield ChatGenerationChunk(message=AIMessageChunk(content=word, tool_call_chunks=tool_call_chunks))
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that answers with a responder function after an optional delay.
+
+    When streamed, the reply arrives word by word with token_delay between words.
+    """
+    responder: Callable[[List[BaseMessage]], Any] = echo_last_human
+    delay: float = 0.0
+    token_delay: float = 0.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: List[List[BaseMessage]] = PrivateAttr(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def call_count(self) -> int:
+        return len(self._calls)
+
+    @property
+    def calls(self) -> List[List[BaseMessage]]:
+        return list(self._calls)
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages):
+        with self._lock:
+            self._calls.append(list(messages))
+        reply = self.responder(messages)
+        if isinstance(reply, BaseMessage):
+            return reply
+        return AIMessage(content=reply)
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        for chunk in _reply_chunks(self._respond(messages)):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield chunk
+
+    async def _astream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        for chunk in _reply_chunks(self._respond(messages)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield chunk
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests and benchmark for the shared agent runtime.
+
+Runs offline against a stubbed chat model. Execute directly to print the per-turn
+overhead of building the agent on every call versus reusing the runtime, and the model
+calls and latency of a question-asking turn with and without direct tool replies:
+
+    python tests/test_agent_runtime.py
+"""
+
+import sys
+import time
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+import src.agent as agent
+import tools.performance_gap_analyzer
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.runtime import AgentRuntime, build_tools, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+
+def make_stub_runtime(model=None):
+    """Create a runtime that uses the stub model instead of the LiteLLM proxy"""
+    model = model or StubChatModel()
+    return AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver
+    )
+
+
+def test_runtime_builds_once():
+    """The graph is built on first use and reused by later turns"""
+    runtime = make_stub_runtime()
+    assert not runtime.is_warm
+    runtime.warm_up()
+    executor = runtime.agent_executor
+    for i in range(3):
+        runtime.invoke([HumanMessage(content=f"turn {i}")], thread_id=f"thread-{i}")
+    assert runtime.agent_executor is executor
+    assert runtime.build_count == 1
+
+
+def test_runtime_rebuild_swaps_components():
+    """rebuild() replaces the graph and re-reads the system message"""
+    prompts = iter(["first prompt", "second prompt"])
+    runtime = AgentRuntime(
+        model_factory=StubChatModel,
+        system_message_factory=lambda reload=False: next(prompts),
+        checkpointer_factory=MemorySaver
+    )
+    executor = runtime.agent_executor
+    assert runtime.system_message == "first prompt"
+    runtime.rebuild(reload_prompts=True)
+    assert runtime.agent_executor is not executor
+    assert runtime.system_message == "second prompt"
+    assert runtime.build_count == 2
+
+
+def test_chat_with_memory_uses_shared_runtime():
+    """chat_with_memory answers through the process-wide runtime"""
+    model = StubChatModel()
+    runtime = set_agent_runtime(make_stub_runtime(model))
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        assert agent.chat_with_memory("hello", thread_id="t1") == "Echo: hello"
+        assert agent.chat_with_memory("again", thread_id="t2") == "Echo: again"
+        set_conversation_store(None)
+    assert runtime.build_count == 1
+    assert isinstance(model.calls[0][0], SystemMessage)
+    set_agent_runtime(None)
+
+
+def call_gap_analyzer(messages):
+    """Agent responder: call the gap analyzer, then restate whatever it said"""
+    last = messages[-1]
+    if last.type == "tool":
+        return f"Restated: {last.content}"
+    return AIMessage(content="", tool_calls=[
+        {"name": "performance_gap_analyzer", "args": {"input_text": last.content}, "id": f"call-{len(messages)}"}
+    ])
+
+
+def run_tool_turn(direct_tools, tool_responder, delay=0.0):
+    """One turn that calls the gap analyzer; returns the reply and both stub models"""
+    model = StubChatModel(responder=call_gap_analyzer, delay=delay)
+    tool_llm = StubChatModel(responder=tool_responder, delay=delay)
+    original = tools.performance_gap_analyzer.create_tool_llm
+    tools.performance_gap_analyzer.create_tool_llm = lambda tool_name=None: tool_llm
+    runtime = AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver,
+        direct_tools=direct_tools
+    )
+    try:
+        reply = runtime.invoke([HumanMessage(content="Missed two deadlines")], thread_id="t1")["messages"][-1].content
+    finally:
+        tools.performance_gap_analyzer.create_tool_llm = original
+    return reply, model, tool_llm
+
+
+def test_direct_tool_reply_ends_the_turn():
+    reply, model, tool_llm = run_tool_turn({"performance_gap_analyzer"}, lambda messages: "Which deadlines?")
+    assert reply == "Which deadlines?"
+    assert model.call_count == 1 and tool_llm.call_count == 1
+    reply, model, _ = run_tool_turn(set(), lambda messages: "Which deadlines?")
+    assert reply == "Restated: Which deadlines?"
+    assert model.call_count == 2
+
+
+def test_failed_direct_tool_is_answered_by_the_agent():
+    def fail(messages):
+        raise TimeoutError("tool model call timed out")
+
+    reply, model, _ = run_tool_turn({"performance_gap_analyzer"}, fail)
+    assert reply.startswith("Restated: Error")
+    assert model.call_count == 2
+
+
+def benchmark_direct_tools(turns=10, delay=0.2):
+    """Model calls and seconds per question-asking turn when each model call takes delay"""
+    for label, direct_tools in (("agent restates", set()), ("direct reply", {"performance_gap_analyzer"})):
+        start = time.perf_counter()
+        calls = 0
+        for _ in range(turns):
+            _, model, tool_llm = run_tool_turn(direct_tools, lambda messages: "Which deadlines?", delay=delay)
+            calls += model.call_count + tool_llm.call_count
+        seconds = (time.perf_counter() - start) / turns
+        print(f"{label:>14}: {calls / turns:.0f} model calls, {seconds * 1000:.0f} ms per turn")
+
+
+def benchmark_turn_overhead(turns=20):
+    """Compare per-turn time when building the agent every call versus reusing it"""
+    model = StubChatModel()
+    messages = [SystemMessage(content="You are Leo."), HumanMessage(content="Software Engineer")]
+
+    start = time.perf_counter()
+    for i in range(turns):
+        # What chat_with_memory used to do on every message
+        ChatOpenAI(model="bench", api_key="bench", base_url="http://localhost:1", temperature=0.3)
+        agent_executor = create_react_agent(model, checkpointer=MemorySaver(), tools=build_tools())
+        agent_executor.invoke({"messages": messages}, {"configurable": {"thread_id": f"bench-{i}"}})
+    before = (time.perf_counter() - start) / turns
+
+    runtime = AgentRuntime(model_factory=lambda: model, checkpointer_factory=MemorySaver)
+    runtime.warm_up()
+    start = time.perf_counter()
+    for i in range(turns):
+        runtime.invoke(messages, thread_id=f"bench-{i}")
+    after = (time.perf_counter() - start) / turns
+
+    print(f"Per-turn overhead, building every call: {before * 1000:.2f} ms")
+    print(f"Per-turn overhead, shared runtime:      {after * 1000:.2f} ms")
+    print(f"Speedup: {before / after:.1f}x")
+    return before, after
+
+
+if __name__ == "__main__":
+    test_runtime_builds_once()
+    test_runtime_rebuild_swaps_components()
+    test_chat_with_memory_uses_shared_runtime()
+    test_direct_tool_reply_ends_the_turn()
+    test_failed_direct_tool_is_answered_by_the_agent()
+    print("Runtime tests passed\n")
+    benchmark_turn_overhead()
+    print()
+    benchmark_direct_tools()
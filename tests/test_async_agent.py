@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tests for the asyncio path: achat_with_memory and the tools' _arun.
+
+Runs offline against the stub chat model. Execute directly to see how long hundreds of
+concurrent conversations take when every model call waits on the network.
+"""
+
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+import tools.comprehensive_pip_generator
+import tools.employee_info_extractor
+import tools.improvement_plan_analyzer
+import tools.performance_gap_analyzer
+import tools.support_resources_identifier
+from src.checkpointer import PIPCheckpointSaver
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.runtime import AgentRuntime, build_tools, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+TOOL_MODULES = [
+    tools.employee_info_extractor,
+    tools.performance_gap_analyzer,
+    tools.improvement_plan_analyzer,
+    tools.support_resources_identifier,
+    tools.comprehensive_pip_generator,
+]
+
+
+class AsyncOnlyStubModel(StubChatModel):
+    """Stub that fails if called synchronously, to prove the async path never blocks"""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise AssertionError("synchronous model call on the async path")
+
+
+def patch_tool_llms(model):
+    originals = {module: module.create_tool_llm for module in TOOL_MODULES}
+    for module in TOOL_MODULES:
+        module.create_tool_llm = lambda tool_name=None: model
+    return originals
+
+
+def restore_tool_llms(originals):
+    for module, factory in originals.items():
+        module.create_tool_llm = factory
+
+
+def run_concurrent_conversations(conversations=200, turns=2, delay=0.05, sqlite_checkpoints=False):
+    """Run many threads' turns at once on one event loop; returns the elapsed seconds"""
+    model = AsyncOnlyStubModel(delay=delay)
+    with tempfile.TemporaryDirectory() as tmp:
+        set_agent_runtime(AgentRuntime(
+            model_factory=lambda: model,
+            system_message_factory=lambda reload=False: "You are Leo.",
+            checkpointer_factory=(lambda: PIPCheckpointSaver(Path(tmp) / "checkpoints.db")) if sqlite_checkpoints else MemorySaver
+        ))
+        store = set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+
+        async def conversation(i):
+            for turn in range(turns):
+                reply = await agent.achat_with_memory(f"thread {i} turn {turn}", thread_id=f"t{i}")
+                assert reply == f"Echo: thread {i} turn {turn}"
+
+        async def main():
+            await asyncio.gather(*(conversation(i) for i in range(conversations)))
+
+        start = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - start
+
+        for i in range(conversations):
+            assert [m["content"] for m in store.load_thread(f"t{i}")["messages"][::2]] == [
+                f"thread {i} turn {turn}" for turn in range(turns)
+            ]
+        set_conversation_store(None)
+        set_agent_runtime(None)
+    return elapsed
+
+
+def test_many_conversations_in_flight():
+    """200 conversations waiting 50 ms per model call finish far faster than serially"""
+    elapsed = run_concurrent_conversations()
+    # Serially this would take 200 * 2 * 0.05 = 20 seconds
+    assert elapsed < 10, elapsed
+
+
+def test_async_turns_with_sqlite_checkpoints():
+    run_concurrent_conversations(conversations=50, turns=3, delay=0.01, sqlite_checkpoints=True)
+
+
+def test_every_tool_runs_async():
+    model = AsyncOnlyStubModel(responder=lambda messages: "tool reply")
+    originals = patch_tool_llms(model)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            for tool in build_tools():
+                assert asyncio.run(tool.ainvoke({"input_text": "Software Engineer"})) == "tool reply"
+            set_conversation_store(None)
+    finally:
+        restore_tool_llms(originals)
+    assert model.call_count == 5
+
+
+def test_async_turn_calls_tools():
+    """The agent's tool calls go through _arun on the async path"""
+    def responder(messages):
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"Tool said: {last.content}")
+        return AIMessage(content="", tool_calls=[
+            {"name": "employee_info_extractor", "args": {"input_text": last.content}, "id": "call-1"}
+        ])
+
+    model = AsyncOnlyStubModel(responder=responder)
+    originals = patch_tool_llms(AsyncOnlyStubModel(responder=lambda messages: "tool reply"))
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver
+    ))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            reply = asyncio.run(agent.achat_with_memory("The role is QA lead", thread_id="t1"))
+            # A question-asking tool's reply goes straight to the user
+            assert reply == "tool reply"
+            assert model.call_count == 1
+            set_conversation_store(None)
+    finally:
+        restore_tool_llms(originals)
+        set_agent_runtime(None)
+
+
+if __name__ == "__main__":
+    test_every_tool_runs_async()
+    test_async_turn_calls_tools()
+    elapsed = run_concurrent_conversations(conversations=500)
+    print(f"500 conversations x 2 turns with 50 ms model calls: {elapsed:.2f}s on one event loop")
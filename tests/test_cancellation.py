@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for cancelling a superseded turn when a newer message arrives in its thread.
+
+Runs offline against the stub chat model. Execute directly to compare how long a
+superseded turn keeps generating with and without cancellation.
+"""
+
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+from src.cancellation import TurnCancelled, TurnRegistry, carried_over_text
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.metrics import metrics
+from src.runtime import AgentRuntime, set_agent_runtime
+from src.slack_streaming import SUPERSEDED, SlackStreamer
+from tests.stub_model import StubChatModel
+from tests.test_slack_streaming import FakeSlackClient
+
+REPLY = " ".join(f"word{i}" for i in range(100))
+
+
+class Conversation:
+    """A stub runtime and a temporary conversation store for one test"""
+
+    def __init__(self, token_delay=0.01):
+        self.model = StubChatModel(
+            responder=lambda messages: REPLY if "long" in messages[-1].content else f"Echo: {messages[-1].content}",
+            token_delay=token_delay
+        )
+        set_agent_runtime(AgentRuntime(
+            model_factory=lambda: self.model,
+            system_message_factory=lambda reload=False: "You are Leo.",
+            checkpointer_factory=MemorySaver
+        ))
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = set_conversation_store(SQLiteConversationStore(Path(self._tmp.name) / "memory.db"))
+
+    def stored(self, thread_id):
+        return [m["content"] for m in self.store.load_thread(thread_id)["messages"]]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        set_conversation_store(None)
+        set_agent_runtime(None)
+        self._tmp.cleanup()
+
+
+def cancel_after(event, seconds):
+    timer = threading.Timer(seconds, event.set)
+    timer.start()
+    return timer
+
+
+def test_supersede_cancels_unfinished_turns_in_the_thread():
+    metrics.reset()
+    registry = TurnRegistry()
+    first = registry.start("D1:1.0", "first")
+    other = registry.start("D2:1.0", "other thread")
+    superseded = registry.supersede("D1:1.0")
+    assert superseded == [first] and first.cancel.is_set() and not other.cancel.is_set()
+    # Superseding twice cancels once
+    registry.supersede("D1:1.0")
+    assert metrics.counter("turns.superseded") == 1
+    registry.finish(first)
+    assert registry.active("D1:1.0") == []
+
+
+def test_only_cancelled_turns_are_carried_over():
+    registry = TurnRegistry()
+    finished = registry.start("D1:1.0", "answered anyway")
+    cancelled = registry.start("D1:1.0", "Gap: missed deadlines")
+    cancelled.cancelled = True
+    assert carried_over_text([finished, cancelled], "since March") == "Gap: missed deadlines\n\nsince March"
+
+
+def test_cancelled_turn_saves_nothing():
+    metrics.reset()
+    with Conversation() as conversation:
+        cancel = threading.Event()
+        cancel_after(cancel, 0.1)
+        start = time.monotonic()
+        try:
+            agent.chat_with_memory("write something long", thread_id="D1:1.0", cancel=cancel)
+            assert False, "turn was not cancelled"
+        except TurnCancelled:
+            pass
+        # Stopped mid-reply rather than after all 100 tokens
+        assert time.monotonic() - start < 0.5
+        assert conversation.stored("D1:1.0") == []
+        assert metrics.counter("turns.cancelled") == 1
+
+        # The next turn starts from the store: the partial reply never reaches the model
+        assert agent.chat_with_memory("hello", thread_id="D1:1.0") == "Echo: hello"
+        assert [m.content for m in conversation.model.calls[-1]] == ["You are Leo.", "hello"]
+        assert conversation.stored("D1:1.0") == ["hello", "Echo: hello"]
+
+
+def test_turn_cancelled_before_start_never_calls_the_model():
+    with Conversation() as conversation:
+        cancel = threading.Event()
+        cancel.set()
+        try:
+            agent.chat_with_memory("hello", thread_id="D1:1.0", cancel=cancel)
+            assert False, "turn was not cancelled"
+        except TurnCancelled:
+            pass
+        assert conversation.model.call_count == 0
+        assert conversation.stored("D1:1.0") == []
+
+
+def test_cancelled_task_saves_nothing():
+    metrics.reset()
+    with Conversation() as conversation:
+        async def main():
+            task = asyncio.create_task(
+                agent.achat_with_memory("write something long", thread_id="D1:1.0", on_partial=lambda text: None)
+            )
+            # Cancel mid-reply, once the model is streaming
+            while conversation.model.call_count == 0:
+                await asyncio.sleep(0.005)
+            await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+                assert False, "turn was not cancelled"
+            except asyncio.CancelledError:
+                pass
+            return await agent.achat_with_memory("hello", thread_id="D1:1.0")
+
+        assert asyncio.run(main()) == "Echo: hello"
+        assert conversation.stored("D1:1.0") == ["hello", "Echo: hello"]
+        assert metrics.counter("turns.cancelled") == 1
+
+
+def test_streamer_cancel_marks_the_placeholder_superseded():
+    client = FakeSlackClient()
+    streamer = SlackStreamer(client, "D1", "1.0", min_interval=0).start()
+    streamer.update("partial")
+    streamer.cancel()
+    streamer.update("more")
+    assert client.updates[-1][1] == SUPERSEDED
+    assert not streamer.delivered
+
+
+def superseded_turn_seconds(cancel_turn):
+    """Seconds a turn keeps generating after a newer message arrives 0.1s in"""
+    with Conversation() as conversation:
+        # Build the graph first so only generation is timed
+        agent.chat_with_memory("hello", thread_id="warm-up")
+        cancel = threading.Event()
+        superseded_at = time.monotonic() + 0.1
+        if cancel_turn:
+            cancel_after(cancel, 0.1)
+        try:
+            agent.chat_with_memory("write something long", thread_id="D1:1.0", cancel=cancel)
+        except TurnCancelled:
+            pass
+        return time.monotonic() - superseded_at, len(conversation.stored("D1:1.0"))
+
+
+if __name__ == "__main__":
+    test_supersede_cancels_unfinished_turns_in_the_thread()
+    test_only_cancelled_turns_are_carried_over()
+    test_cancelled_turn_saves_nothing()
+    test_turn_cancelled_before_start_never_calls_the_model()
+    test_cancelled_task_saves_nothing()
+    test_streamer_cancel_marks_the_placeholder_superseded()
+    print("Cancellation tests passed\n")
+
+    for cancel_turn in (False, True):
+        wasted, stored = superseded_turn_seconds(cancel_turn)
+        label = "with cancellation" if cancel_turn else "without cancellation"
+        print(f"{label}: generated {wasted:.2f}s past the newer message, {stored} messages saved")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tests for per-thread agent checkpoints.
+
+A thread with a checkpoint only sends the new message each turn, and tool calls and
+tool results from earlier turns stay in the graph state.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+from src.checkpointer import PIPCheckpointSaver
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+
+@tool
+def employee_lookup(name: str) -> str:
+    """Look up an employee's role"""
+    return f"{name} is a QA Team Lead"
+
+
+def tool_then_echo(messages):
+    """Call the tool once for the first human message, otherwise echo"""
+    last = messages[-1]
+    if isinstance(last, HumanMessage) and last.content == "Who is Sam?":
+        return AIMessage(content="", tool_calls=[{"name": "employee_lookup", "args": {"name": "Sam"}, "id": "call-1"}])
+    if isinstance(last, ToolMessage):
+        return AIMessage(content=f"Found: {last.content}")
+    return AIMessage(content=f"Echo: {last.content}")
+
+
+class RecordingRuntime(AgentRuntime):
+    """Runtime that records the messages each turn sends into the graph"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+    def invoke(self, messages, thread_id="default", store_version=None, on_partial=None, cancel=None):
+        self.sent.append(list(messages))
+        return super().invoke(messages, thread_id=thread_id, store_version=store_version, on_partial=on_partial, cancel=cancel)
+
+
+def make_runtime(model, checkpointer_factory=MemorySaver):
+    return RecordingRuntime(
+        model_factory=lambda: model,
+        tools_factory=lambda: [employee_lookup],
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=checkpointer_factory
+    )
+
+
+def test_turns_send_only_the_new_message():
+    model = StubChatModel(responder=tool_then_echo)
+    runtime = set_agent_runtime(make_runtime(model))
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        assert agent.chat_with_memory("Who is Sam?", thread_id="t1") == "Found: Sam is a QA Team Lead"
+        assert agent.chat_with_memory("Thanks", thread_id="t1") == "Echo: Thanks"
+        assert agent.chat_with_memory("Next", thread_id="t1") == "Echo: Next"
+        set_conversation_store(None)
+
+    assert [len(sent) for sent in runtime.sent] == [1, 1, 1]
+    # The tool call and its result from the first turn are still in the model's context
+    last_call = model.calls[-1]
+    assert isinstance(last_call[0], SystemMessage)
+    assert any(isinstance(m, ToolMessage) for m in last_call)
+    assert [m.content for m in last_call if isinstance(m, HumanMessage)] == ["Who is Sam?", "Thanks", "Next"]
+    assert runtime.tools_called("t1") == ["employee_lookup"]
+    assert runtime.tools_called("unknown") == []
+    set_agent_runtime(None)
+
+
+def test_stale_checkpoint_is_reseeded_from_the_store():
+    """Turns written elsewhere (another replica) make the next turn resend the history"""
+    model = StubChatModel()
+    runtime = set_agent_runtime(make_runtime(model))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        agent.chat_with_memory("one", thread_id="t1")
+        store.append_messages("t1", [{"role": "human", "content": "two"}, {"role": "ai", "content": "Echo: two"}])
+        agent.chat_with_memory("three", thread_id="t1")
+        set_conversation_store(None)
+
+    assert [len(sent) for sent in runtime.sent] == [1, 5]
+    assert [m.content for m in model.calls[-1] if isinstance(m, HumanMessage)] == ["one", "two", "three"]
+    set_agent_runtime(None)
+
+
+def test_sqlite_checkpoints_survive_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        db = Path(tmp) / "checkpoints.db"
+        set_agent_runtime(make_runtime(StubChatModel(responder=tool_then_echo), lambda: PIPCheckpointSaver(db)))
+        agent.chat_with_memory("Who is Sam?", thread_id="t1")
+
+        # A new process: fresh runtime, same checkpoint database
+        model = StubChatModel(responder=tool_then_echo)
+        runtime = set_agent_runtime(make_runtime(model, lambda: PIPCheckpointSaver(db)))
+        agent.chat_with_memory("two", thread_id="t1")
+        assert [len(sent) for sent in runtime.sent] == [1]
+        assert any(isinstance(m, ToolMessage) for m in model.calls[-1])
+        assert store.load_thread("t1")["version"] == 2
+        set_conversation_store(None)
+        set_agent_runtime(None)
+
+
+def test_hot_turns_read_nothing_and_write_only_new_messages():
+    """After the first turn a thread's checkpoint is served from memory and saved as a delta"""
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        saver = PIPCheckpointSaver(Path(tmp) / "checkpoints.db")
+        set_agent_runtime(make_runtime(StubChatModel(), lambda: saver))
+        for i in range(5):
+            agent.chat_with_memory("x" * 1000 + str(i), thread_id="hot")
+        # Only the first turn looked on disk (and found nothing)
+        assert saver.disk_reads == 1
+        # Each turn adds a human and an AI message; each is serialised once
+        assert saver.messages_written == 10
+        set_conversation_store(None)
+        set_agent_runtime(None)
+
+
+def test_delete_and_clear():
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = PIPCheckpointSaver(Path(tmp) / "checkpoints.db")
+        runtime = make_runtime(StubChatModel(), lambda: saver)
+        for i in range(3):
+            runtime.invoke([HumanMessage(content=f"turn {i}")], thread_id="a")
+        runtime.invoke([HumanMessage(content="hi")], thread_id="b")
+
+        # Only the latest checkpoint is kept
+        count = lambda table, tid: saver._connect().execute(
+            f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (tid,)).fetchone()[0]
+        assert count("checkpoints", "a") == 1
+        assert count("checkpoint_messages", "a") == 6
+        reopened = PIPCheckpointSaver(Path(tmp) / "checkpoints.db")
+        state = reopened.get_tuple({"configurable": {"thread_id": "a"}})
+        assert [m.content for m in state.checkpoint["channel_values"]["messages"][::2]] == ["turn 0", "turn 1", "turn 2"]
+
+        saver.delete_thread("a")
+        assert not saver.has_thread("a") and saver.has_thread("b")
+        assert count("checkpoint_messages", "a") == 0
+        saver.clear()
+        assert not saver.has_thread("b")
+        assert not PIPCheckpointSaver(Path(tmp) / "checkpoints.db").has_thread("b")
+
+
+if __name__ == "__main__":
+    test_turns_send_only_the_new_message()
+    test_stale_checkpoint_is_reseeded_from_the_store()
+    test_sqlite_checkpoints_survive_restart()
+    test_hot_turns_read_nothing_and_write_only_new_messages()
+    test_delete_and_clear()
+    print("Checkpointer tests passed")
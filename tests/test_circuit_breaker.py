@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Tests for the model backend's circuit breaker.
+
+Talks to a local OpenAI-compatible stub server. Execute directly to see how long turns
+take to fail while the proxy is down, with and without the breaker.
+"""
+
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import openai
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.agent import chat_with_memory
+from src.circuit_breaker import (
+    CLOSED, DEGRADED_REPLY, HALF_OPEN, OPEN, CircuitBreaker, caused_by_open_circuit, set_circuit_breaker
+)
+from src.llm_client import get_chat_model, reset_llm_clients
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.metrics import metrics
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_llm_server import StubLLMServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def breaker(clock=None, **kwargs):
+    settings = dict(window_seconds=60, min_calls=4, error_rate=0.5, slow_seconds=5, slow_rate=0.8, open_seconds=30, probes=1)
+    settings.update(kwargs)
+    return CircuitBreaker(clock=clock or FakeClock(), **settings)
+
+
+def use_breaker(circuit, max_retries=0):
+    """Build fresh pooled clients around circuit"""
+    os.environ["LLM_MAX_RETRIES"] = str(max_retries)
+    set_circuit_breaker(circuit)
+    reset_llm_clients()
+    metrics.reset()
+    return circuit
+
+
+def teardown():
+    os.environ.pop("LLM_MAX_RETRIES", None)
+    set_circuit_breaker(None)
+    reset_llm_clients()
+
+
+def test_trips_on_error_rate():
+    circuit = breaker()
+    for failed in (False, True, False, True):
+        circuit.record(circuit.allow(), failed, 0.1)
+    assert circuit.state == OPEN
+    assert circuit.allow() is None and circuit.is_open()
+
+
+def test_trips_on_latency():
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record(circuit.allow(), False, 6.0)
+    assert circuit.state == OPEN
+
+
+def test_old_outcomes_leave_the_window():
+    clock = FakeClock()
+    circuit = breaker(clock)
+    for _ in range(3):
+        circuit.record(circuit.allow(), True, 0.1)
+    clock.now += 61
+    circuit.record(circuit.allow(), True, 0.1)
+    assert circuit.state == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    clock = FakeClock()
+    changes = []
+    circuit = breaker(clock)
+    circuit.add_listener(lambda old, new, reason: changes.append((old, new, reason)))
+    for _ in range(4):
+        circuit.record(circuit.allow(), True, 0.1)
+    clock.now += 30
+    assert not circuit.is_open()
+    probe = circuit.allow()
+    assert probe == HALF_OPEN
+    # Only one probe at a time
+    assert circuit.allow() is None
+    circuit.record(probe, True, 0.1)
+    assert circuit.state == OPEN
+    clock.now += 30
+    circuit.record(circuit.allow(), False, 0.1)
+    assert circuit.state == CLOSED
+    assert [(old, new) for old, new, _ in changes] == [
+        (CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)
+    ]
+    assert changes[0][2] == "error_rate"
+
+
+def test_abandoned_probe_frees_its_slot():
+    clock = FakeClock()
+    circuit = breaker(clock)
+    for _ in range(4):
+        circuit.record(circuit.allow(), True, 0.1)
+    clock.now += 30
+    circuit.abandon(circuit.allow())
+    assert circuit.allow() == HALF_OPEN
+
+
+def test_failing_proxy_trips_the_breaker_and_recovers():
+    circuit = use_breaker(breaker(clock=time.monotonic, open_seconds=0.2))
+    try:
+        with StubLLMServer() as server:
+            llm = get_chat_model(model="breaker-test", api_key="key", base_url=server.base_url)
+            server.script = [{"status": 503}] * 4
+            for _ in range(4):
+                try:
+                    llm.invoke([HumanMessage(content="hi")])
+                except openai.InternalServerError:
+                    pass
+            assert circuit.state == OPEN
+            try:
+                llm.invoke([HumanMessage(content="hi")])
+                assert False, "expected the breaker to refuse the call"
+            except openai.APIConnectionError as e:
+                assert caused_by_open_circuit(e)
+            # Refused without reaching the proxy
+            assert server.requests == 4
+            time.sleep(0.25)
+            assert llm.invoke([HumanMessage(content="hi")]).content == "Echo: hi"
+            assert circuit.state == CLOSED
+        assert metrics.counter("llm.breaker.rejected") == 1
+        assert metrics.counter("llm.breaker.open") == 1
+        assert metrics.gauge("llm.breaker.state") == 0
+    finally:
+        teardown()
+
+
+def test_turn_fails_fast_with_a_friendly_reply():
+    circuit = use_breaker(breaker(clock=time.monotonic, min_calls=1))
+    try:
+        with StubLLMServer() as server, tempfile.TemporaryDirectory() as tmp:
+            set_agent_runtime(AgentRuntime(
+                model_factory=lambda: get_chat_model(model="breaker-test", api_key="key", base_url=server.base_url),
+                system_message_factory=lambda reload=False: "You are Leo.",
+                checkpointer_factory=MemorySaver
+            ))
+            store = set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            server.script = [{"status": 503}]
+            # The failure that trips the breaker is reported as the backend's, not the user's
+            assert chat_with_memory("hello", thread_id="t1") == DEGRADED_REPLY
+            assert circuit.state == OPEN
+            start = time.monotonic()
+            assert chat_with_memory("hello again", thread_id="t1") == DEGRADED_REPLY
+            assert time.monotonic() - start < 0.1
+            assert server.requests == 1
+            # The fail-fast turn was never run, so the thread holds only the first attempt
+            assert len(store.load_thread("t1")["messages"]) == 2
+        assert metrics.counter("turns.degraded") == 2
+    finally:
+        set_conversation_store(None)
+        set_agent_runtime(None)
+        teardown()
+
+
+def benchmark_turns_against_a_down_proxy(turns=20, stall=0.5):
+    """Seconds per turn when every request to the proxy stalls then fails"""
+    for label, circuit in (("no breaker", breaker(clock=time.monotonic, min_calls=10**6)),
+                           ("breaker", breaker(clock=time.monotonic, min_calls=5))):
+        use_breaker(circuit)
+        with StubLLMServer() as server:
+            llm = get_chat_model(model="breaker-test", api_key="key", base_url=server.base_url)
+            server.script = [{"status": 503, "delay": stall}] * turns
+            start = time.perf_counter()
+            for _ in range(turns):
+                try:
+                    llm.invoke([HumanMessage(content="hi")])
+                except openai.APIError:
+                    pass
+            seconds = time.perf_counter() - start
+            print(f"{label:>10}: {seconds / turns * 1000:.0f}ms per failed call, {server.requests} requests reached the proxy")
+    teardown()
+
+
+if __name__ == "__main__":
+    test_trips_on_error_rate()
+    test_trips_on_latency()
+    test_old_outcomes_leave_the_window()
+    test_half_open_probe_closes_or_reopens()
+    test_abandoned_probe_frees_its_slot()
+    test_failing_proxy_trips_the_breaker_and_recovers()
+    test_turn_fails_fast_with_a_friendly_reply()
+    print("Circuit breaker tests passed\n")
+    benchmark_turns_against_a_down_proxy()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing rapid-fire messages into one agent turn.
+
+Execute directly to count agent runs for a burst of messages with and without
+coalescing.
+"""
+
+import sys
+import time
+import tempfile
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+from src.coalesce import MessageCoalescer
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.metrics import metrics
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.done = threading.Event()
+
+    def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+        self.done.set()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_burst_is_flushed_once_after_the_window():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window=0.1)
+    start = time.monotonic()
+    for part in ("Gap: missed deadlines", "on three releases", "since March"):
+        coalescer.add("D1:1.0", part)
+        time.sleep(0.03)
+    assert recorder.done.wait(5)
+    # The window restarts with each message
+    assert time.monotonic() - start >= 0.06 + 0.1
+    assert recorder.batches == [("D1:1.0", ["Gap: missed deadlines", "on three releases", "since March"])]
+
+
+def test_keys_are_coalesced_separately():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window=0.05)
+    coalescer.add("D1:1.0", "a1")
+    coalescer.add("D2:1.0", "b1")
+    coalescer.add("D1:1.0", "a2")
+    wait_for(lambda: len(recorder.batches) == 2)
+    assert sorted(recorder.batches) == [("D1:1.0", ["a1", "a2"]), ("D2:1.0", ["b1"])]
+
+
+def test_messages_after_the_window_start_a_new_turn():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window=0.05)
+    coalescer.add("D1:1.0", "first")
+    wait_for(lambda: len(recorder.batches) == 1)
+    coalescer.add("D1:1.0", "second")
+    wait_for(lambda: len(recorder.batches) == 2)
+    assert [items for _, items in recorder.batches] == [["first"], ["second"]]
+
+
+def test_max_wait_caps_a_long_burst():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window=0.05, max_wait=0.15)
+    start = time.monotonic()
+    # A message every 30 ms would keep a pure debounce open forever
+    while not recorder.batches:
+        coalescer.add("D1:1.0", "more")
+        time.sleep(0.03)
+    assert time.monotonic() - start < 0.3
+    coalescer.flush_all()
+
+
+def test_zero_window_disables_coalescing():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window=0)
+    coalescer.add("D1:1.0", "a")
+    coalescer.add("D1:1.0", "b")
+    assert [items for _, items in recorder.batches] == [["a"], ["b"]]
+    assert coalescer.pending == 0
+
+
+def test_metrics_count_saved_invocations():
+    metrics.reset()
+    coalescer = MessageCoalescer(Recorder(), window=0.05)
+    for i in range(3):
+        coalescer.add("D1:1.0", i)
+    coalescer.add("D2:1.0", 0)
+    coalescer.flush_all()
+    assert metrics.counter("coalesce.messages") == 4
+    assert metrics.counter("coalesce.invocations") == 2
+    assert metrics.counter("coalesce.saved_invocations") == 2
+
+
+def run_burst(window, parts=3, gap=0.02):
+    """Send a PIP gap summary as several messages; returns the model calls and stored turns"""
+    model = StubChatModel()
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver
+    ))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        turns = []
+
+        def on_flush(key, texts):
+            turns.append(agent.chat_with_memory("\n\n".join(texts), thread_id=key))
+
+        coalescer = MessageCoalescer(on_flush, window=window)
+        for i in range(parts):
+            coalescer.add("D1:1.0", f"part {i}")
+            time.sleep(gap)
+        wait_for(lambda: coalescer.pending == 0 and len(turns) >= (1 if window else parts))
+        stored = store.load_thread("D1:1.0")["messages"]
+        set_conversation_store(None)
+    set_agent_runtime(None)
+    return model.call_count, stored
+
+
+def test_burst_is_one_agent_turn():
+    calls, stored = run_burst(window=0.1)
+    assert calls == 1
+    assert [m["content"] for m in stored] == ["part 0\n\npart 1\n\npart 2", "Echo: part 0\n\npart 1\n\npart 2"]
+
+
+if __name__ == "__main__":
+    test_burst_is_flushed_once_after_the_window()
+    test_keys_are_coalesced_separately()
+    test_messages_after_the_window_start_a_new_turn()
+    test_max_wait_caps_a_long_burst()
+    test_zero_window_disables_coalescing()
+    test_metrics_count_saved_invocations()
+    test_burst_is_one_agent_turn()
+    print("Coalescing tests passed\n")
+
+    without, _ = run_burst(window=0)
+    with_window, _ = run_burst(window=0.1)
+    print(f"3-message burst: {without} agent runs without coalescing, {with_window} with a 0.1s window")
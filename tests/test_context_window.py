@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for token-budgeted context window management.
+
+Uses the longest recorded thread in memory/conversation_memory.json when it is present.
+"""
+
+import sys
+import json
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.context_window import ContextWindowManager, count_message_tokens, split_turns
+from src.memory_store import MEMORY_FILE, to_langchain_messages
+
+
+def recorded_thread():
+    """The longest recorded PIP conversation, or a synthetic one"""
+    if MEMORY_FILE.exists():
+        with open(MEMORY_FILE) as f:
+            threads = json.load(f)
+        longest = max(threads.values(), key=lambda t: len(t["messages"]))
+        return to_langchain_messages(longest["messages"])
+    messages = []
+    for i in range(40):
+        messages.append(HumanMessage(content=f"Answer {i}: " + "details " * 80))
+        messages.append(AIMessage(content="Feedback " * 120 + f"What is question {i + 1}?"))
+    return messages
+
+
+def test_short_history_is_untouched():
+    history = [HumanMessage(content="hi"), AIMessage(content="Hello! How can I help?")]
+    messages, stats = ContextWindowManager(token_budget=1000, keep_recent_turns=2).fit(history, "system")
+    assert messages == [SystemMessage(content="system")] + history
+    assert stats["tokens_saved"] == 0
+
+
+def test_long_history_fits_budget():
+    """Older turns are summarised, recent turns are verbatim and the budget holds"""
+    history = recorded_thread() + [HumanMessage(content="Yes, let's move on")]
+    manager = ContextWindowManager(token_budget=3000, keep_recent_turns=3)
+    messages, stats = manager.fit(history, "You are Leo.")
+
+    assert stats["tokens_after"] <= 3000
+    assert stats["tokens_saved"] > 0
+    assert stats["tokens_before"] - stats["tokens_after"] == stats["tokens_saved"]
+    # One leading system message carrying the prompt and then the summary
+    assert isinstance(messages[0], SystemMessage)
+    assert messages[0].content.startswith("You are Leo.\n\nSummary of earlier conversation")
+    assert not any(isinstance(m, SystemMessage) for m in messages[1:])
+    # The newest turns are passed through unchanged
+    recent = [m for turn in split_turns(history)[-3:] for m in turn]
+    assert messages[-len(recent):] == recent
+    print(f"Recorded thread: {stats}")
+
+
+def test_summary_keeps_manager_answers():
+    history = [
+        HumanMessage(content="I need a PIP"),
+        AIMessage(content="Sure. What is the employee's job title/role?"),
+        HumanMessage(content="QA Team Lead"),
+        AIMessage(content="Thanks! " + "Feedback. " * 300 + "What is the employee's team/department?"),
+        HumanMessage(content="Quality Assurance"),
+        AIMessage(content="What is the performance gap title?"),
+    ]
+    messages, stats = ContextWindowManager(token_budget=60, keep_recent_turns=1).fit(history)
+    summary = messages[0].content
+    assert "Q: What is the employee's job title/role?" in summary
+    assert "A: QA Team Lead" in summary
+    assert "Last question asked before the recent turns: What is the employee's team/department?" in summary
+    assert "Feedback. Feedback." not in summary
+    assert stats["summarized_turns"] == 2
+
+
+def test_tool_messages_stay_with_their_turn():
+    """Tool calls and results are never separated from the turn that made them"""
+    history = [
+        HumanMessage(content="old " * 200),
+        AIMessage(content="reply " * 200),
+        HumanMessage(content="Software Engineer"),
+        AIMessage(content="", tool_calls=[{"name": "employee_info_extractor", "args": {"input_text": "x"}, "id": "1"}]),
+        ToolMessage(content="What is the team?", tool_call_id="1"),
+        AIMessage(content="What is the team?"),
+    ]
+    messages, _ = ContextWindowManager(token_budget=100, keep_recent_turns=1).fit(history)
+    assert messages[1:] == history[2:]
+    assert sum(count_message_tokens(m) for m in messages) < sum(count_message_tokens(m) for m in history)
+
+
+if __name__ == "__main__":
+    test_short_history_is_untouched()
+    test_long_history_fits_budget()
+    test_summary_keeps_manager_answers()
+    test_tool_messages_stay_with_their_turn()
+    print("Context window tests passed")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for Slack event deduplication.
+
+Execute directly to time claims against each backend.
+"""
+
+import sys
+import time
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.dedup import EventDeduplicator, MemoryDedupStore, RedisDedupStore, SQLiteDedupStore
+from src.metrics import metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for SET NX EX"""
+
+    def __init__(self):
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def set(self, name, value, nx=False, ex=None):
+        with self._lock:
+            if nx and name in self.keys:
+                return None
+            self.keys[name] = (value, ex)
+            return True
+
+
+def test_memory_store_claims_once():
+    store = MemoryDedupStore(ttl=60, max_entries=100)
+    assert store.claim("C1:1.0")
+    assert not store.claim("C1:1.0")
+    assert store.claim("C1:2.0")
+
+
+def test_memory_store_expires_and_is_bounded():
+    clock = FakeClock()
+    store = MemoryDedupStore(ttl=60, max_entries=3, clock=clock)
+    for ts in ("1", "2", "3", "4"):
+        assert store.claim(ts)
+    # The oldest entry was evicted to stay within max_entries
+    assert len(store) == 3
+    assert store.claim("1")
+
+    clock.now += 61
+    # Everything has expired: redeliveries after the TTL are treated as new
+    assert store.claim("2")
+    assert len(store) == 1
+
+
+def test_memory_store_stays_small_under_load():
+    store = MemoryDedupStore(ttl=3600, max_entries=1000)
+    for i in range(50000):
+        store.claim(f"C1:{i}")
+    assert len(store) == 1000
+
+
+def test_sqlite_store_survives_restart_and_expires():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "events.db"
+        assert SQLiteDedupStore(path, ttl=60).claim("C1:1.0")
+        # A new process (e.g. after a deploy) still knows the event
+        restarted = SQLiteDedupStore(path, ttl=60)
+        assert not restarted.claim("C1:1.0")
+        assert restarted.claim("C1:2.0")
+
+        expired = SQLiteDedupStore(path, ttl=0)
+        assert expired.claim("C1:1.0")
+
+
+def test_sqlite_store_prunes_to_max_entries():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteDedupStore(Path(tmp) / "events.db", ttl=3600, max_entries=50, prune_every=100)
+        for i in range(250):
+            store.claim(f"C1:{i}")
+        assert len(store) <= 100
+        store.prune()
+        assert len(store) == 50
+        # The newest events are the ones kept
+        assert not store.claim("C1:249")
+
+
+def _claim_all(path, ids, results):
+    store = SQLiteDedupStore(path, ttl=3600)
+    results.put([event_id for event_id in ids if store.claim(event_id)])
+
+
+def test_sqlite_store_is_shared_between_processes():
+    """Two replicas receiving the same redeliveries answer each event exactly once"""
+    ids = [f"C1:{i}" for i in range(200)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "events.db"
+        SQLiteDedupStore(path)
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_claim_all, args=(path, ids, results)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        claimed = [event_id for _ in workers for event_id in results.get(timeout=60)]
+        for worker in workers:
+            worker.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_redis_store_uses_set_nx_with_expiry():
+    client = FakeRedis()
+    replica_a = EventDeduplicator(RedisDedupStore(client=client, ttl=90))
+    replica_b = EventDeduplicator(RedisDedupStore(client=client, ttl=90))
+    assert replica_a.claim("C1:1.0")
+    assert not replica_b.claim("C1:1.0")
+    assert client.keys == {"pip-agent:slack-event:C1:1.0": (1, 90)}
+
+
+def test_local_hits_skip_the_backend():
+    client = FakeRedis()
+    calls = []
+    original = client.set
+    client.set = lambda *args, **kwargs: calls.append(args) or original(*args, **kwargs)
+    deduplicator = EventDeduplicator(RedisDedupStore(client=client))
+    assert deduplicator.claim("C1:1.0")
+    assert not deduplicator.claim("C1:1.0")
+    assert len(calls) == 1
+
+
+def test_backend_failure_fails_open():
+    class Broken:
+        def claim(self, event_id):
+            raise OSError("disk full")
+
+    metrics.reset()
+    deduplicator = EventDeduplicator(Broken())
+    assert deduplicator.claim("C1:1.0")
+    assert not deduplicator.claim("C1:1.0")
+    assert metrics.counter("dedup.backend_errors") == 1
+    assert metrics.counter("dedup.duplicates") == 1
+
+
+def benchmark_claims(events=20000):
+    """Claim cost per backend: new events, then redeliveries of the same events"""
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": EventDeduplicator(),
+            "sqlite": EventDeduplicator(SQLiteDedupStore(Path(tmp) / "events.db")),
+        }
+        for name, deduplicator in backends.items():
+            ids = [f"C1:{i}" for i in range(events)]
+            start = time.perf_counter()
+            for event_id in ids:
+                deduplicator.claim(event_id)
+            new = (time.perf_counter() - start) / events
+            start = time.perf_counter()
+            for event_id in ids[-1000:]:
+                deduplicator.claim(event_id)
+            repeat = (time.perf_counter() - start) / 1000
+            print(f"{name:>6}: {new * 1e6:.1f} us per new event, {repeat * 1e6:.1f} us per redelivery")
+
+
+if __name__ == "__main__":
+    test_memory_store_claims_once()
+    test_memory_store_expires_and_is_bounded()
+    test_memory_store_stays_small_under_load()
+    test_sqlite_store_survives_restart_and_expires()
+    test_sqlite_store_prunes_to_max_entries()
+    test_sqlite_store_is_shared_between_processes()
+    test_redis_store_uses_set_nx_with_expiry()
+    test_local_hits_skip_the_backend()
+    test_backend_failure_fails_open()
+    print("Dedup tests passed\n")
+    benchmark_claims()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded, per-thread ordered event dispatcher.
+
+Execute directly to compare how long Slack listeners are held with inline handling
+versus handing the turn to the dispatcher.
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.dispatch import BULK, INTERACTIVE, EventDispatcher, bulk_work
+from src.lanes import choose_lane
+from src.metrics import metrics
+from src.pip_phases import PhaseTracker
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+
+def test_jobs_for_a_key_run_in_order():
+    dispatcher = EventDispatcher(workers=8, max_queue=1000)
+    seen = {key: [] for key in range(10)}
+
+    def job(key, i):
+        # Later jobs finish faster, so only the dispatcher keeps them in order
+        time.sleep(0.001 * (5 - i % 5))
+        seen[key].append(i)
+
+    futures = [dispatcher.submit(key, job, key, i) for i in range(20) for key in range(10)]
+    for future in futures:
+        future.result(timeout=10)
+    dispatcher.shutdown()
+    assert all(order == list(range(20)) for order in seen.values())
+
+
+def test_keys_run_in_parallel_up_to_the_pool_size():
+    dispatcher = EventDispatcher(workers=4, max_queue=100)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    start = time.perf_counter()
+    for future in [dispatcher.submit(f"thread-{i}", job) for i in range(8)]:
+        future.result(timeout=10)
+    elapsed = time.perf_counter() - start
+    dispatcher.shutdown()
+    assert running[1] == 4
+    assert elapsed < 0.3, elapsed
+
+
+def test_same_key_never_runs_concurrently():
+    dispatcher = EventDispatcher(workers=4, max_queue=100)
+    active = []
+
+    def job():
+        active.append(1)
+        assert len(active) == 1
+        time.sleep(0.005)
+        active.pop()
+
+    for future in [dispatcher.submit("one-thread", job) for _ in range(10)]:
+        future.result(timeout=10)
+    dispatcher.shutdown()
+
+
+def test_full_queue_applies_backpressure():
+    metrics.reset()
+    release = threading.Event()
+    dispatcher = EventDispatcher(workers=1, max_queue=2, queue_wait=0.05)
+    running = dispatcher.submit("a", release.wait)
+    # Wait for the worker to take the first job off the queue
+    while dispatcher.depth:
+        time.sleep(0.001)
+    queued = [dispatcher.submit(key, lambda: "done") for key in ("b", "c")]
+    assert dispatcher.depth == 2
+
+    start = time.perf_counter()
+    assert dispatcher.submit("d", lambda: "done") is None
+    assert time.perf_counter() - start >= 0.05
+    assert metrics.counter("dispatch.rejected") == 1
+    assert metrics.gauge("dispatch.queue_depth") == 2
+
+    # A waiting submit gets in as soon as a job starts
+    def free_a_slot():
+        time.sleep(0.05)
+        release.set()
+    threading.Thread(target=free_a_slot).start()
+    late = dispatcher.submit("e", lambda: "late", timeout=5)
+    assert late is not None and late.result(timeout=5) == "late"
+    assert running.result(timeout=5) and [f.result(timeout=5) for f in queued] == ["done", "done"]
+    dispatcher.shutdown()
+    assert metrics.gauge("dispatch.queue_depth") == 0
+    assert metrics.snapshot()["summaries"]["dispatch.wait_seconds"]["count"] == 4
+
+
+def test_failed_job_does_not_stop_its_thread():
+    dispatcher = EventDispatcher(workers=1, max_queue=10)
+
+    def fail():
+        raise ValueError("boom")
+
+    failed = dispatcher.submit("a", fail)
+    after = dispatcher.submit("a", lambda: "next")
+    assert isinstance(failed.exception(timeout=5), ValueError)
+    assert after.result(timeout=5) == "next"
+    dispatcher.shutdown()
+
+
+def test_generation_burst_does_not_hold_short_turns():
+    dispatcher = EventDispatcher(workers=2, bulk_workers=1, max_queue=100)
+    for i in range(4):
+        dispatcher.submit(f"pip-{i}", time.sleep, 0.3, lane=BULK)
+    start = time.perf_counter()
+    for future in [dispatcher.submit(f"qa-{i}", time.sleep, 0.01) for i in range(10)]:
+        future.result(timeout=10)
+    # Ten 10 ms turns on two workers, while four 300 ms generations queue in their own lane
+    assert time.perf_counter() - start < 0.2
+    dispatcher.shutdown()
+
+
+def test_key_order_is_kept_across_lanes():
+    dispatcher = EventDispatcher(workers=2, bulk_workers=1, max_queue=10)
+    seen = []
+    dispatcher.submit("a", lambda: (time.sleep(0.05), seen.append("generate")), lane=BULK)
+    dispatcher.submit("a", seen.append, "follow-up").result(timeout=5)
+    assert seen == ["generate", "follow-up"]
+    dispatcher.shutdown()
+
+
+def test_bulk_work_lends_the_interactive_lane_a_worker():
+    metrics.reset()
+    dispatcher = EventDispatcher(workers=1, bulk_workers=1, max_queue=10)
+    lock = threading.Lock()
+    generating = [0, 0]
+
+    def generate():
+        with bulk_work():
+            with lock:
+                generating[0] += 1
+                generating[1] = max(generating[1], generating[0])
+            time.sleep(0.15)
+            with lock:
+                generating[0] -= 1
+
+    # Turns that only turn out to be generations once they are running
+    first = dispatcher.submit("pip-1", generate)
+    time.sleep(0.02)
+    start = time.perf_counter()
+    assert dispatcher.submit("qa", lambda: "answer").result(timeout=5) == "answer"
+    assert time.perf_counter() - start < 0.1
+    second = dispatcher.submit("pip-2", generate)
+    first.result(timeout=5)
+    second.result(timeout=5)
+    # Generations still share the bulk lane's single slot
+    assert generating[1] == 1
+    assert metrics.counter("dispatch.bulk_escalations") == 2
+    dispatcher.shutdown()
+
+
+class PhaseRuntime:
+    def __init__(self, *replies):
+        # The thread as of the last reply; the user is satisfied with every refinement
+        messages = [HumanMessage(content="Start a PIP")]
+        for reply in replies:
+            messages.append(AIMessage(content=reply))
+            messages.append(HumanMessage(content="satisfied" if "refine" in reply else "answer"))
+        self.messages = messages[:-1]
+        self.tracker = PhaseTracker.replay(self.messages)
+
+    def pip_phase(self, thread_id):
+        return self.tracker
+
+
+GAP = ("What is the performance gap title?", "What is the expected performance?")
+PLAN = ("What is the goal for improvement?", "Would you like to refine these action steps, or are you satisfied?")
+SUPPORT = "What support and resources are available to help?"
+SUPPORT_REFINE = "Would you like to refine these support resources, or are you satisfied?"
+
+
+def test_lane_follows_the_pip_phase():
+    try:
+        set_agent_runtime(PhaseRuntime("What is the employee's job title or role?"))
+        assert choose_lane("slack-D1-1.0", "Their role is senior engineer") == INTERACTIVE
+        assert choose_lane("slack-D1-1.0", "Please generate the PIP document now") == BULK
+        # Two gaps: confirming the first gap's support, and answering the second's, are question turns
+        set_agent_runtime(PhaseRuntime(*GAP * 2, *PLAN * 2, SUPPORT, SUPPORT_REFINE))
+        assert choose_lane("slack-D1-1.0", "Yes, looks good") == INTERACTIVE
+        set_agent_runtime(PhaseRuntime(*GAP * 2, *PLAN * 2, SUPPORT, SUPPORT_REFINE, SUPPORT))
+        assert choose_lane("slack-D1-1.0", "Weekly mentoring with the team lead") == INTERACTIVE
+        set_agent_runtime(PhaseRuntime(*GAP * 2, *PLAN * 2, SUPPORT, SUPPORT_REFINE, SUPPORT, SUPPORT_REFINE))
+        assert choose_lane("slack-D1-1.0", "Yes, looks good") == BULK
+        set_agent_runtime(PhaseRuntime(*GAP, *PLAN, SUPPORT, SUPPORT_REFINE))
+        assert choose_lane("slack-D1-1.0", "Yes, looks good") == BULK
+    finally:
+        set_agent_runtime(None)
+
+
+def test_lane_is_chosen_without_reading_the_checkpointer():
+    reads = []
+
+    class CountingSaver(MemorySaver):
+        def get_tuple(self, config):
+            reads.append(config)
+            return super().get_tuple(config)
+
+    model = StubChatModel(responder=lambda messages: SUPPORT_REFINE)
+    runtime = AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=CountingSaver,
+        phase_routing=False
+    )
+    try:
+        set_agent_runtime(runtime)
+        assert choose_lane("slack-D1-1.0", "Hi") == INTERACTIVE
+        messages = PhaseRuntime(*GAP, *PLAN, SUPPORT).messages
+        runtime.invoke(messages + [HumanMessage(content="Mentoring")], thread_id="slack-D1-1.0")
+        reads.clear()
+        assert choose_lane("slack-D1-1.0", "Yes, looks good") == BULK
+        assert reads == []
+    finally:
+        set_agent_runtime(None)
+
+
+def p95(values):
+    return sorted(values)[int(len(values) * 0.95) - 1]
+
+
+def benchmark_short_turn_latency(two_lanes, generations=6, turns=40):
+    """p95 seconds from submit to done for quick turns during a burst of PIP generations"""
+    dispatcher = EventDispatcher(workers=4, bulk_workers=2, max_queue=200)
+    for i in range(generations):
+        dispatcher.submit(f"pip-{i}", time.sleep, 0.5, lane=BULK if two_lanes else INTERACTIVE)
+    latencies = []
+
+    def short_turn(submitted):
+        time.sleep(0.02)
+        latencies.append(time.perf_counter() - submitted)
+
+    futures = []
+    for i in range(turns):
+        futures.append(dispatcher.submit(f"qa-{i}", short_turn, time.perf_counter()))
+        time.sleep(0.01)
+    for future in futures:
+        future.result()
+    dispatcher.shutdown()
+    return p95(latencies)
+
+
+def benchmark_listener_time(messages=20, turn_seconds=0.2):
+    """How long a burst of messages holds the listener, inline versus dispatched"""
+    start = time.perf_counter()
+    for _ in range(messages):
+        time.sleep(turn_seconds)
+    inline = time.perf_counter() - start
+
+    dispatcher = EventDispatcher(workers=8, max_queue=100)
+    start = time.perf_counter()
+    futures = [dispatcher.submit(f"thread-{i}", time.sleep, turn_seconds) for i in range(messages)]
+    listener = time.perf_counter() - start
+    for future in futures:
+        future.result()
+    done = time.perf_counter() - start
+    dispatcher.shutdown()
+    print(f"Inline:     listener busy {inline:.2f}s for {messages} messages")
+    print(f"Dispatched: listener busy {listener * 1000:.2f}ms, all replies done in {done:.2f}s")
+
+
+if __name__ == "__main__":
+    test_jobs_for_a_key_run_in_order()
+    test_keys_run_in_parallel_up_to_the_pool_size()
+    test_same_key_never_runs_concurrently()
+    test_full_queue_applies_backpressure()
+    test_failed_job_does_not_stop_its_thread()
+    test_generation_burst_does_not_hold_short_turns()
+    test_key_order_is_kept_across_lanes()
+    test_bulk_work_lends_the_interactive_lane_a_worker()
+    test_lane_follows_the_pip_phase()
+    test_lane_is_chosen_without_reading_the_checkpointer()
+    print("Dispatch tests passed\n")
+    benchmark_listener_time()
+    single = benchmark_short_turn_latency(two_lanes=False)
+    split = benchmark_short_turn_latency(two_lanes=True)
+    print(f"Short-turn p95 during a generation burst: {single * 1000:.0f}ms one lane, {split * 1000:.0f}ms two lanes")
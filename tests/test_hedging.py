@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for per-tool deadlines and hedged model calls.
+
+Talks to a local OpenAI-compatible stub server that can be told to answer slowly.
+Execute directly to compare tail latency against a proxy with occasional stalls, with
+and without hedging.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import HumanMessage
+
+from src.hedging import DeadlineExceeded, GuardedModel, deadline_for, hedge_delay
+from src.llm_client import get_chat_model, reset_llm_clients
+from src.metrics import metrics
+from tests.stub_llm_server import StubLLMServer
+
+TOOL = "performance_gap_analyzer"
+
+
+def guarded(server, **kwargs):
+    model = get_chat_model(model="hedge-test", api_key="key", base_url=server.base_url)
+    return GuardedModel(model, TOOL, **kwargs)
+
+
+def prime(seconds, samples=20):
+    """Record enough past latencies for the tool to be hedged"""
+    for _ in range(samples):
+        metrics.observe(f"llm.latency_seconds.{TOOL}", seconds)
+
+
+def setup():
+    reset_llm_clients()
+    metrics.reset()
+
+
+def test_slow_call_misses_its_deadline():
+    setup()
+    with StubLLMServer() as server:
+        server.script = [{"delay": 3.0}]
+        start = time.monotonic()
+        try:
+            guarded(server, deadline=0.2).invoke([HumanMessage(content="hi")])
+            assert False, "expected the deadline to pass"
+        except DeadlineExceeded:
+            pass
+        # Gave up at the deadline rather than waiting for the reply
+        assert time.monotonic() - start < 1.5
+    assert metrics.counter(f"llm.deadline_exceeded.{TOOL}") == 1
+
+
+def test_hedge_answers_for_a_stalled_call():
+    setup()
+    prime(0.02)
+    with StubLLMServer() as server:
+        # The first request stalls; the duplicate sent after the p95 answers
+        server.script = [{"delay": 2.0}]
+        start = time.monotonic()
+        reply = guarded(server).invoke([HumanMessage(content="hi")])
+        assert reply.content == "Echo: hi"
+        assert time.monotonic() - start < 1.0
+        assert server.requests == 2
+    assert metrics.counter(f"llm.hedge.sent.{TOOL}") == 1
+    assert metrics.counter(f"llm.hedge.won.{TOOL}") == 1
+    assert metrics.counter(f"llm.hedge.cancelled.{TOOL}") == 1
+
+
+def test_no_hedge_until_latencies_are_known():
+    setup()
+    prime(0.02, samples=5)
+    assert hedge_delay(TOOL) is None
+    with StubLLMServer() as server:
+        server.script = [{"delay": 0.2}]
+        assert guarded(server).invoke([HumanMessage(content="hi")]).content == "Echo: hi"
+        assert server.requests == 1
+    prime(0.02)
+    assert hedge_delay(TOOL) is not None
+
+
+def test_document_generation_is_not_hedged():
+    setup()
+    for _ in range(20):
+        metrics.observe("llm.latency_seconds.comprehensive_pip_generator", 1.0)
+    assert hedge_delay("comprehensive_pip_generator") is None
+    assert deadline_for("comprehensive_pip_generator") > deadline_for(TOOL)
+    os.environ["LLM_DEADLINE_SECONDS_PERFORMANCE_GAP_ANALYZER"] = "5"
+    try:
+        assert deadline_for(TOOL) == 5.0
+    finally:
+        os.environ.pop("LLM_DEADLINE_SECONDS_PERFORMANCE_GAP_ANALYZER")
+
+
+def test_async_losers_are_cancelled():
+    setup()
+    prime(0.02)
+    with StubLLMServer() as server:
+        server.script = [{"delay": 2.0}]
+        model = guarded(server)
+
+        async def main():
+            start = time.monotonic()
+            reply = await model.ainvoke([HumanMessage(content="hi")])
+            return reply.content, time.monotonic() - start
+
+        content, seconds = asyncio.run(main())
+        assert content == "Echo: hi" and seconds < 1.0
+        assert server.requests == 2
+    assert metrics.counter(f"llm.hedge.cancelled.{TOOL}") == 1
+
+
+def test_failed_first_attempt_waits_for_the_hedge():
+    setup()
+    prime(0.02)
+    with StubLLMServer() as server:
+        os.environ["LLM_MAX_RETRIES"] = "0"
+        reset_llm_clients()
+        try:
+            server.script = [{"status": 400, "delay": 0.1}, {"delay": 0.2}]
+            assert guarded(server).invoke([HumanMessage(content="hi")]).content == "Echo: hi"
+        finally:
+            os.environ.pop("LLM_MAX_RETRIES")
+            reset_llm_clients()
+
+
+def benchmark_tail_latency(calls=200, stall_rate=0.05, stall=1.0):
+    """p50/p99 of calls against a proxy that stalls on a few requests, with and without hedging"""
+    for label, hedge in (("no hedging", "0"), ("hedging", "1")):
+        setup()
+        os.environ["LLM_HEDGE"] = hedge
+        rng = random.Random(7)
+        with StubLLMServer(delay=0.01) as server:
+            model = guarded(server)
+            for i in range(calls):
+                if rng.random() < stall_rate:
+                    server.script = [{"delay": stall}]
+                start = time.perf_counter()
+                model.invoke([HumanMessage(content=str(i))])
+                metrics.observe("bench.seconds", time.perf_counter() - start)
+            sent = metrics.counter(f"llm.hedge.sent.{TOOL}")
+            print(
+                f"{label:>10}: p50 {metrics.percentile('bench.seconds', 50) * 1000:.0f}ms, "
+                f"p99 {metrics.percentile('bench.seconds', 99) * 1000:.0f}ms, "
+                f"{server.requests} requests ({sent} hedges)"
+            )
+    os.environ.pop("LLM_HEDGE")
+
+
+if __name__ == "__main__":
+    test_slow_call_misses_its_deadline()
+    test_hedge_answers_for_a_stalled_call()
+    test_no_hedge_until_latencies_are_known()
+    test_document_generation_is_not_hedged()
+    test_async_losers_are_cancelled()
+    test_failed_first_attempt_waits_for_the_hedge()
+    print("Hedging tests passed\n")
+    benchmark_tail_latency()
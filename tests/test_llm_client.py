@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared, connection-pooled LLM client.
+
+Talks to a local OpenAI-compatible stub server. Execute directly to compare a fresh
+ChatOpenAI per call with the shared pooled client:
+
+    python tests/test_llm_client.py
+"""
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from src.llm_client import connection_stats, get_chat_model, reset_llm_clients
+from tests.stub_llm_server import StubLLMServer
+
+
+def test_calls_reuse_one_connection():
+    reset_llm_clients()
+    connection_stats.reset()
+    with StubLLMServer() as server:
+        llm = get_chat_model(model="pool-test", api_key="key", base_url=server.base_url)
+        for i in range(5):
+            assert llm.invoke([HumanMessage(content=f"hi {i}")]).content == f"Echo: hi {i}"
+        # Tools asking for the same configuration get the same client
+        assert get_chat_model(model="pool-test", api_key="key", base_url=server.base_url) is llm
+        assert server.connections == 1
+
+    stats = connection_stats.snapshot()["pool-test"]
+    assert stats == {"requests": 5, "new_connections": 1, "reused_connections": 4, "reuse_rate": 0.8}
+    reset_llm_clients()
+
+
+def test_async_calls_share_the_pool():
+    reset_llm_clients()
+    connection_stats.reset()
+    with StubLLMServer(delay=0.05) as server:
+        llm = get_chat_model(model="async-pool", api_key="key", base_url=server.base_url)
+
+        async def main():
+            # Ten concurrent calls open ten connections, which the next ten reuse
+            for _ in range(2):
+                await asyncio.gather(*(llm.ainvoke([HumanMessage(content="hi")]) for _ in range(10)))
+
+        asyncio.run(main())
+        assert server.connections == 10
+    stats = connection_stats.snapshot()["async-pool"]
+    assert stats["requests"] == 20 and stats["reused_connections"] == 10
+    reset_llm_clients()
+
+
+def benchmark_client_reuse(calls=50):
+    """Per-call latency with a new ChatOpenAI each call versus the shared pooled client"""
+    reset_llm_clients()
+    with StubLLMServer() as server:
+        messages = [HumanMessage(content="hi")]
+        start = time.perf_counter()
+        for _ in range(calls):
+            ChatOpenAI(model="bench", api_key="key", base_url=server.base_url).invoke(messages)
+        before = (time.perf_counter() - start) / calls
+        fresh_connections = server.connections
+
+        llm = get_chat_model(model="bench", api_key="key", base_url=server.base_url)
+        start = time.perf_counter()
+        for _ in range(calls):
+            llm.invoke(messages)
+        after = (time.perf_counter() - start) / calls
+        pooled_connections = server.connections - fresh_connections
+
+    print(f"New client per call:  {before * 1000:.2f} ms/call, {fresh_connections} connections")
+    print(f"Shared pooled client: {after * 1000:.2f} ms/call, {pooled_connections} connections")
+    reset_llm_clients()
+    return before, after
+
+
+if __name__ == "__main__":
+    test_calls_reuse_one_connection()
+    test_async_calls_share_the_pool()
+    print("LLM client tests passed\n")
+    benchmark_client_reuse()
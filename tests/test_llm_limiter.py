@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for the outbound LLM limiter and 429-aware retries.
+
+Talks to a local OpenAI-compatible stub server. Execute directly to compare a burst of
+calls against a rate-limited proxy with and without the limiter.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import email.utils
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(str(Path(__file__).parent.parent))
+
+import httpx
+import openai
+from langchain_core.messages import HumanMessage
+
+from src.llm_client import get_chat_model, reset_llm_clients
+from src.llm_limiter import OutboundLimiter, RetryPolicy, retry_after_seconds, set_outbound_limiter
+from src.metrics import metrics
+from tests.stub_llm_server import StubLLMServer
+
+
+def use_limiter(max_in_flight=16, max_retries=4, retry_base=0.01, max_wait=60):
+    """Build fresh pooled clients around a limiter with these settings"""
+    os.environ["LLM_MAX_RETRIES"] = str(max_retries)
+    os.environ["LLM_RETRY_BASE_SECONDS"] = str(retry_base)
+    reset_llm_clients()
+    metrics.reset()
+    return set_outbound_limiter(OutboundLimiter(max_in_flight, max_wait=max_wait))
+
+
+def teardown():
+    os.environ.pop("LLM_MAX_RETRIES", None)
+    os.environ.pop("LLM_RETRY_BASE_SECONDS", None)
+    set_outbound_limiter(None)
+    reset_llm_clients()
+
+
+def ask(server, model="limit-test", text="hi"):
+    llm = get_chat_model(model=model, api_key="key", base_url=server.base_url)
+    return llm.invoke([HumanMessage(content=text)]).content
+
+
+def test_retry_after_is_honoured():
+    use_limiter()
+    try:
+        with StubLLMServer() as server:
+            server.script = [{"status": 429, "headers": {"Retry-After": "0.2"}}]
+            start = time.monotonic()
+            assert ask(server) == "Echo: hi"
+            assert time.monotonic() - start >= 0.2
+            assert server.requests == 2
+        assert metrics.counter("llm.throttled.limit-test") == 1
+        assert metrics.counter("llm.retries.limit-test") == 1
+    finally:
+        teardown()
+
+
+def test_server_errors_back_off_then_give_up():
+    use_limiter(max_retries=2)
+    try:
+        with StubLLMServer() as server:
+            server.script = [{"status": 503}] * 3
+            try:
+                ask(server)
+                assert False, "expected the error to surface"
+            except openai.InternalServerError:
+                pass
+            # One try plus two retries, and the OpenAI client did not retry on top
+            assert server.requests == 3
+        assert metrics.counter("llm.gave_up.limit-test") == 1
+    finally:
+        teardown()
+
+
+def test_in_flight_requests_are_capped():
+    limiter = use_limiter(max_in_flight=2)
+    try:
+        with StubLLMServer(delay=0.05) as server:
+            with ThreadPoolExecutor(8) as pool:
+                replies = list(pool.map(lambda i: ask(server, text=str(i)), range(8)))
+            assert replies == [f"Echo: {i}" for i in range(8)]
+            assert server.max_in_flight == 2
+        # Every slot was given back once its response had been read
+        assert limiter.in_flight == 0
+        assert metrics.snapshot()["summaries"]["llm.limiter_wait_seconds"]["count"] > 0
+    finally:
+        teardown()
+
+
+def test_async_calls_share_the_cap():
+    limiter = use_limiter(max_in_flight=3)
+    try:
+        with StubLLMServer(delay=0.05) as server:
+            llm = get_chat_model(model="limit-test", api_key="key", base_url=server.base_url)
+
+            async def main():
+                return await asyncio.gather(*(llm.ainvoke([HumanMessage(content=str(i))]) for i in range(9)))
+
+            assert [r.content for r in asyncio.run(main())] == [f"Echo: {i}" for i in range(9)]
+            assert server.max_in_flight == 3
+        assert limiter.in_flight == 0
+    finally:
+        teardown()
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = OutboundLimiter(1)
+
+    async def main():
+        assert await limiter.aacquire()
+        waiter = asyncio.create_task(limiter.aacquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        limiter.release()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.01)
+        return limiter.in_flight
+
+    assert asyncio.run(main()) == 0
+
+
+def test_full_limiter_times_out():
+    limiter = OutboundLimiter(1, max_wait=0.05)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+    limiter.release()
+    assert limiter.acquire()
+
+
+def test_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_retries=5, base=1.0, cap=4.0)
+    delays = [policy.delay(attempt) for attempt in range(5) for _ in range(20)]
+    assert all(0 < delay <= 4.0 for delay in delays)
+    assert len(set(delays)) > 50
+    assert 2.0 <= policy.delay(1, retry_after=2.0) <= 2.25
+
+
+def test_retry_after_header_forms():
+    def response(**headers):
+        return httpx.Response(429, headers=headers)
+
+    assert retry_after_seconds(response(**{"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(response(**{"retry-after-ms": "250"})) == 0.25
+    in_five = email.utils.formatdate(time.time() + 5, usegmt=True)
+    assert 3.0 < retry_after_seconds(response(**{"retry-after": in_five})) <= 5.0
+    assert retry_after_seconds(response()) is None
+
+
+def benchmark_burst_against_rate_limited_proxy(calls=40, capacity=4):
+    """Failed calls and total time for a burst against a proxy that 429s above capacity"""
+    results = {}
+    for label, max_in_flight, retries in (
+        ("no limiter, no retries", 100, 0), ("retries only", 100, 4), ("limiter and retries", capacity, 4)
+    ):
+        use_limiter(max_in_flight=max_in_flight, max_retries=retries, retry_base=0.05)
+        with StubLLMServer(delay=0.05, capacity=capacity, retry_after=0.05) as server:
+            def call(i):
+                try:
+                    ask(server, text=str(i))
+                    return True
+                except openai.APIError:
+                    return False
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(calls) as pool:
+                ok = sum(pool.map(call, range(calls)))
+            results[label] = (calls - ok, time.perf_counter() - start, server.throttled)
+    teardown()
+    for label, (failed, seconds, throttled) in results.items():
+        print(f"{label:>24}: {failed}/{calls} failed, {throttled} 429s from the proxy, {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    test_retry_after_is_honoured()
+    test_server_errors_back_off_then_give_up()
+    test_in_flight_requests_are_capped()
+    test_async_calls_share_the_cap()
+    test_cancelled_waiter_does_not_leak_a_slot()
+    test_full_limiter_times_out()
+    test_backoff_is_jittered_and_capped()
+    test_retry_after_header_forms()
+    print("LLM limiter tests passed\n")
+    benchmark_burst_against_rate_limited_proxy()
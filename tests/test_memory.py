@@ -1,27 +1,25 @@
 import sys
 from pathlib import Path
-import os
 import json
-import shutil
+import tempfile
 
 # Add the parent directory to the path so we can import from src
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.agent import chat_with_memory, MEMORY_DIR, MEMORY_FILE
-
-def clear_memory():
-    """Clear any existing memory files"""
-    if MEMORY_FILE.exists():
-        os.remove(MEMORY_FILE)
-    if MEMORY_DIR.exists() and not os.listdir(MEMORY_DIR):
-        shutil.rmtree(MEMORY_DIR)
-        MEMORY_DIR.mkdir(exist_ok=True)
+from src.agent import chat_with_memory, load_conversation_memory
+from src.memory_store import SQLiteConversationStore, set_conversation_store
 
 def test_conversation_memory():
     """Test that conversation memory persists between function calls"""
-    # Clear any existing memory
-    clear_memory()
-    
+    # Use a fresh store so the recorded conversations in ./memory are left alone
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        try:
+            return _run_conversation()
+        finally:
+            set_conversation_store(None)
+
+def _run_conversation():
     # First interaction
     print("First interaction:")
     response1 = chat_with_memory("Hello, my name is John.")
@@ -49,12 +47,9 @@ def test_conversation_memory():
     print(f"\nName remembered: {name_remembered}")
     print(f"Correct previous question remembered: {correct_question_remembered}")
     
-    # Print the memory file contents for debugging
-    if MEMORY_FILE.exists():
-        with open(MEMORY_FILE, 'r') as f:
-            memory_content = json.load(f)
-            print("\nMemory file contents:")
-            print(json.dumps(memory_content, indent=2))
+    # Print the stored conversation for debugging
+    print("\nStored conversation:")
+    print(json.dumps(load_conversation_memory("default"), indent=2))
     
     return name_remembered and correct_question_remembered
 
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Stress tests for concurrent access to the conversation store.
+
+Runs hundreds of concurrent chat_with_memory calls against a stubbed model, and several
+processes appending to the same store, then checks that no turn was lost or interleaved.
+"""
+
+import sys
+import random
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+from src.memory_store import (
+    ConcurrentUpdateError, JsonConversationStore, JournalConversationStore, SQLiteConversationStore,
+    set_conversation_store
+)
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+THREADS = 12
+TURNS = 300
+WORKERS = 48
+
+
+def make_store(backend, tmp):
+    if backend == "sqlite":
+        return SQLiteConversationStore(Path(tmp) / "memory.db")
+    if backend == "journal":
+        return JournalConversationStore(
+            Path(tmp) / "snapshot.json", Path(tmp) / "memory.journal", compact_every=50, fsync=False
+        )
+    return JsonConversationStore(Path(tmp) / "memory.json")
+
+
+def assert_threads_intact(store, expected):
+    """Every human message is stored once and immediately followed by its reply"""
+    for thread_id, inputs in expected.items():
+        messages = store.load_thread(thread_id)["messages"]
+        assert len(messages) == 2 * len(inputs), f"{thread_id}: {len(messages)} messages"
+        humans = messages[0::2]
+        for human, ai in zip(humans, messages[1::2]):
+            assert human["role"] == "human" and ai["role"] == "ai"
+            assert ai["content"] == f"Echo: {human['content']}"
+        assert sorted(m["content"] for m in humans) == sorted(inputs)
+
+
+def run_concurrent_turns(backend, turns=TURNS):
+    model = StubChatModel(delay=0.002)
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver
+    ))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = set_conversation_store(make_store(backend, tmp))
+        jobs = [(f"thread-{i % THREADS}", f"message {i}") for i in range(turns)]
+        random.shuffle(jobs)
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            list(pool.map(lambda job: agent.chat_with_memory(job[1], thread_id=job[0]), jobs))
+
+        expected = {}
+        for thread_id, text in jobs:
+            expected.setdefault(thread_id, []).append(text)
+        assert_threads_intact(store, expected)
+        assert model.call_count == turns
+
+        # Each turn saw the full history of the turns before it on its thread
+        for call in model.calls:
+            history = [m for m in call if m.type in ("human", "ai")]
+            assert len(history) % 2 == 1
+    set_conversation_store(None)
+    set_agent_runtime(None)
+
+
+def test_concurrent_chat_sqlite():
+    run_concurrent_turns("sqlite")
+
+
+def test_concurrent_chat_journal():
+    run_concurrent_turns("journal")
+
+
+def test_concurrent_chat_json():
+    # The legacy backend rewrites the whole file per turn, so keep this one smaller
+    run_concurrent_turns("json", turns=100)
+
+
+def test_stale_version_is_rejected():
+    """An append based on an old read fails instead of silently overwriting"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("sqlite", "journal", "json"):
+            store = make_store(backend, Path(tmp))
+            version = store.load_thread(f"t-{backend}")["version"]
+            store.append_messages(f"t-{backend}", [{"role": "human", "content": "first"}], expected_version=version)
+            try:
+                store.append_messages(f"t-{backend}", [{"role": "human", "content": "stale"}], expected_version=version)
+                assert False, "stale append should fail"
+            except ConcurrentUpdateError:
+                pass
+            assert len(store.load_thread(f"t-{backend}")["messages"]) == 1
+
+
+def append_from_process(backend, tmp, worker, turns):
+    """Worker process: run locked, versioned read-append cycles on shared threads"""
+    store = make_store(backend, tmp)
+    for i in range(turns):
+        thread_id = f"shared-{i % 3}"
+        with store.thread_lock(thread_id):
+            version = store.load_thread(thread_id)["version"]
+            text = f"worker {worker} turn {i}"
+            store.append_messages(
+                thread_id,
+                [{"role": "human", "content": text}, {"role": "ai", "content": f"Echo: {text}"}],
+                expected_version=version
+            )
+
+
+def run_multi_process(backend, processes=4, turns=30):
+    with tempfile.TemporaryDirectory() as tmp:
+        make_store(backend, tmp)
+        ctx = multiprocessing.get_context("spawn")
+        workers = [ctx.Process(target=append_from_process, args=(backend, tmp, w, turns)) for w in range(processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+            assert p.exitcode == 0
+
+        expected = {}
+        for w in range(processes):
+            for i in range(turns):
+                expected.setdefault(f"shared-{i % 3}", []).append(f"worker {w} turn {i}")
+        assert_threads_intact(make_store(backend, tmp), expected)
+
+
+def test_multi_process_sqlite():
+    run_multi_process("sqlite")
+
+
+def test_multi_process_journal():
+    run_multi_process("journal")
+
+
+def test_multi_process_json():
+    run_multi_process("json")
+
+
+if __name__ == "__main__":
+    for backend in ("sqlite", "journal", "json"):
+        run_concurrent_turns(backend)
+        run_multi_process(backend)
+        print(f"{backend}: {TURNS} concurrent turns and multi-process appends intact")
+    test_stale_version_is_rejected()
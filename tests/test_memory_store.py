@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for the conversation store backends and the JSON to SQLite migration.
+"""
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.memory_store import (
+    JsonConversationStore, JournalConversationStore, SQLiteConversationStore, ThreadLockManager,
+    migrate_json_memory
+)
+
+
+def test_sqlite_store_appends_per_thread():
+    """Appends land on the right thread and list_threads reports indexed counts"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(Path(tmp) / "memory.db")
+        store.append_messages("a", [{"role": "human", "content": "hi"}, {"role": "ai", "content": "hello"}])
+        store.append_messages("b", [{"role": "human", "content": "other"}])
+        store.append_messages("a", [{"role": "human", "content": "again"}])
+
+        assert [m["content"] for m in store.load_thread("a")["messages"]] == ["hi", "hello", "again"]
+        assert store.load_thread("missing") == {"messages": [], "version": 0}
+        assert dict(store.list_threads()) == {"a": 3, "b": 1}
+
+        assert store.delete_thread("b")
+        assert not store.delete_thread("b")
+        store.save_thread("a", {"messages": [{"role": "human", "content": "replaced"}]})
+        assert store.load_thread("a")["messages"] == [{"role": "human", "content": "replaced"}]
+        assert store.load_thread("a")["version"] == 3
+        assert dict(store.list_threads()) == {"a": 1}
+
+
+def test_json_store_matches_sqlite_store():
+    """The legacy JSON backend implements the same interface"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonConversationStore(Path(tmp) / "memory.json")
+        store.append_messages("a", [{"role": "human", "content": "hi"}])
+        store.append_messages("a", [{"role": "ai", "content": "hello"}])
+        assert dict(store.list_threads()) == {"a": 2}
+        store.clear()
+        assert store.list_threads() == []
+
+
+def test_migration_runs_once():
+    """The legacy JSON file is imported once and then ignored"""
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "conversation_memory.json"
+        legacy = {
+            "default": {"messages": [{"role": "human", "content": "hi"}, {"role": "ai", "content": "hello"}]},
+            "slack-C1-1.0": {"messages": [{"role": "human", "content": "pip please"}]},
+        }
+        json_path.write_text(json.dumps(legacy))
+
+        store = SQLiteConversationStore(Path(tmp) / "memory.db")
+        assert migrate_json_memory(store, json_path) == 2
+        assert store.load_thread("default")["messages"] == legacy["default"]["messages"]
+
+        store.append_messages("default", [{"role": "human", "content": "new"}])
+        assert migrate_json_memory(store, json_path) == 0
+        assert len(store.load_thread("default")["messages"]) == 3
+
+
+def make_journal_store(tmp, compact_every=1000):
+    return JournalConversationStore(
+        Path(tmp) / "snapshot.json", Path(tmp) / "memory.journal", compact_every=compact_every, fsync=False
+    )
+
+
+def test_journal_appends_only_new_messages():
+    """Each append adds one journal line regardless of how much history exists"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_journal_store(tmp)
+        journal = Path(tmp) / "memory.journal"
+        pair = [{"role": "human", "content": "x" * 100}, {"role": "ai", "content": "y" * 100}]
+
+        store.append_messages("a", pair)
+        first_append = journal.stat().st_size
+        for _ in range(200):
+            store.append_messages("a", pair)
+        before = journal.stat().st_size
+        store.append_messages("a", pair)
+        last_append = journal.stat().st_size - before
+
+        # Only the sequence number's width changes between records
+        assert last_append - first_append <= 2
+        assert not (Path(tmp) / "snapshot.json").exists()
+        assert len(store.load_thread("a")["messages"]) == 404
+
+
+def test_journal_replays_and_compacts():
+    """State survives a restart, compaction and a torn final record"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_journal_store(tmp, compact_every=3)
+        store.append_messages("a", [{"role": "human", "content": "1"}])
+        store.append_messages("b", [{"role": "human", "content": "2"}])
+        store.append_messages("a", [{"role": "ai", "content": "3"}])  # triggers compaction
+        store.append_messages("a", [{"role": "human", "content": "4"}])
+        store.delete_thread("b")
+        store.close()
+
+        journal = Path(tmp) / "memory.journal"
+        assert (Path(tmp) / "snapshot.json").exists()
+        assert len(journal.read_text().splitlines()) == 2
+
+        # Simulate a crash mid-write
+        with open(journal, "a") as f:
+            f.write('{"op":"append","thread_id":"a","messa')
+
+        restored = make_journal_store(tmp, compact_every=3)
+        assert [m["content"] for m in restored.load_thread("a")["messages"]] == ["1", "3", "4"]
+        assert dict(restored.list_threads()) == {"a": 3}
+        restored.append_messages("a", [{"role": "ai", "content": "5"}])
+        restored.close()
+
+        again = make_journal_store(tmp)
+        assert [m["content"] for m in again.load_thread("a")["messages"]] == ["1", "3", "4", "5"]
+
+
+def test_journal_skips_records_already_in_snapshot():
+    """A crash between writing the snapshot and truncating the journal doesn't duplicate messages"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_journal_store(tmp)
+        store.append_messages("a", [{"role": "human", "content": "1"}])
+        journal = Path(tmp) / "memory.journal"
+        stale_journal = journal.read_text()
+        store.compact()
+        store.close()
+
+        journal.write_text(stale_journal)
+        restored = make_journal_store(tmp)
+        assert len(restored.load_thread("a")["messages"]) == 1
+
+
+def test_json_write_failure_is_not_committed():
+    """A failed write raises instead of returning a version that was never saved"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JsonConversationStore(Path(tmp) / "memory.json")
+        store.append_messages("a", [{"role": "human", "content": "hi"}])
+        (Path(tmp) / "memory.json.tmp").mkdir()
+        try:
+            store.append_messages("a", [{"role": "human", "content": "lost"}], expected_version=1)
+            assert False, "write should fail"
+        except OSError:
+            pass
+        assert store.load_thread("a") == {"messages": [{"role": "human", "content": "hi"}], "version": 1}
+
+
+def test_lock_files_are_bounded():
+    """Thread locks share a fixed number of stripe files"""
+    with tempfile.TemporaryDirectory() as tmp:
+        locks = ThreadLockManager(Path(tmp) / "locks", stripes=8)
+        for i in range(200):
+            with locks.lock(f"thread-{i}"):
+                pass
+        assert len(list((Path(tmp) / "locks").iterdir())) <= 8
+        assert locks.lock("same") is locks.lock("same")
+
+
+if __name__ == "__main__":
+    test_sqlite_store_appends_per_thread()
+    test_json_store_matches_sqlite_store()
+    test_migration_runs_once()
+    test_journal_appends_only_new_messages()
+    test_journal_replays_and_compacts()
+    test_journal_skips_records_already_in_snapshot()
+    test_json_write_failure_is_not_committed()
+    test_lock_files_are_bounded()
+    print("Memory store tests passed")
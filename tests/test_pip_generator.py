@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Tests and benchmark for the comprehensive PIP generator.
+
+Runs offline against stubbed chat models and a throwaway conversation store. Execute
+directly to time the document turn of concurrent Slack threads and count the
+conversation store reads it makes, and to compare drafting a PIP's gaps one section at
+a time, in parallel, against the whole document in one completion:
+
+    python tests/test_pip_generator.py
+"""
+
+import re
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+import tools.comprehensive_pip_generator
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.metrics import metrics
+from src.pip_document import PLACEHOLDER, assemble_document, letter_date, parse_letter_details, parse_section
+from src.pip_phases import PhaseTracker
+from src.pip_record import GapRecord, PIPRecord
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+ROLES = ("QA lead", "Designer", "Data engineer", "Support agent")
+TITLES = ("Late Task Updates", "Missed Deadlines", "Code Review Quality", "Meeting Attendance", "Test Coverage")
+
+
+class CountingStore(SQLiteConversationStore):
+    """SQLite store that counts thread reads"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def load_thread(self, thread_id):
+        self.reads.append(thread_id)
+        return super().load_thread(thread_id)
+
+
+def call_generator(messages):
+    """Agent responder: generate the PIP, then pass the document on"""
+    if messages[-1].type == "tool":
+        return messages[-1].content
+    return AIMessage(content="", tool_calls=[
+        {"name": "comprehensive_pip_generator", "args": {"input_text": "Generate the PIP"}, "id": "call-1"}
+    ])
+
+
+def draft_for(messages):
+    """Tool responder: a "document" naming every role the prompt mentions"""
+    prompt = messages[0].content
+    return "PIP for " + ", ".join(role for role in ROLES if f"HUMAN: {role}" in prompt)
+
+
+def seed(thread_id, role):
+    agent.save_conversation_memory(thread_id, {"messages": [
+        {"role": "human", "content": "Start a PIP"},
+        {"role": "ai", "content": "What is the employee's job title or role?"},
+        {"role": "human", "content": role},
+        {"role": "ai", "content": "Anything else before I generate the PIP?"},
+    ]})
+
+
+def setup(tmp, delay=0.0):
+    """A runtime whose agent and generator are stubs, over a fresh counting store"""
+    model = StubChatModel(responder=call_generator)
+    tool_llm = StubChatModel(responder=draft_for, delay=delay)
+    tools.comprehensive_pip_generator.create_tool_llm = lambda tool_name=None: tool_llm
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver
+    ))
+    store = CountingStore(Path(tmp) / "memory.db")
+    set_conversation_store(store)
+    # The thread the generator used to read, whatever thread it was asked from
+    seed("default", "Support agent")
+    return store, tool_llm
+
+
+def teardown(original):
+    tools.comprehensive_pip_generator.create_tool_llm = original
+    set_conversation_store(None)
+    set_agent_runtime(None)
+
+
+def test_concurrent_threads_get_their_own_pip():
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store, tool_llm = setup(tmp)
+            threads = {f"slack-C1-{i}.0": role for i, role in enumerate(ROLES[:3])}
+            for thread_id, role in threads.items():
+                seed(thread_id, role)
+            store.reads.clear()
+            with ThreadPoolExecutor(max_workers=len(threads)) as pool:
+                replies = dict(zip(threads, pool.map(
+                    lambda thread_id: agent.chat_with_memory("Generate it", thread_id=thread_id), threads
+                )))
+            assert replies == {thread_id: f"PIP for {role}" for thread_id, role in threads.items()}
+            # One read per turn, by the turn itself; none by the generator
+            assert sorted(store.reads) == sorted(threads)
+            assert tool_llm.call_count == len(threads)
+    finally:
+        teardown(original)
+
+
+def test_async_threads_get_their_own_pip():
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store, tool_llm = setup(tmp)
+            seed("slack-C1-1.0", "QA lead")
+            seed("slack-C2-1.0", "Designer")
+            store.reads.clear()
+
+            async def main():
+                return await asyncio.gather(
+                    agent.achat_with_memory("Generate it", thread_id="slack-C1-1.0"),
+                    agent.achat_with_memory("Generate it", thread_id="slack-C2-1.0"),
+                )
+
+            assert asyncio.run(main()) == ["PIP for QA lead", "PIP for Designer"]
+            assert "default" not in store.reads and len(store.reads) == 2
+            # The question asked this turn is part of the history too
+            assert "AI: Anything else before I generate the PIP?" in tool_llm.calls[0][0].content
+    finally:
+        teardown(original)
+
+
+def pip_state(gaps=3):
+    """Graph state for a thread whose record holds gaps performance gaps"""
+    record = PIPRecord(role="QA lead", team="Platform", gaps=[
+        GapRecord(title=title, goal=f"Fix {title.lower()}") for title in TITLES[:gaps]
+    ])
+    return {"messages": [], "pip_phase": PhaseTracker(gaps=gaps, record=record).as_dict()}
+
+
+LETTER = (
+    "Employee name: Marvin Chin\nAddress: 1 Jalan Ampang; Kuala Lumpur\nIdentification number: unknown\n"
+    "Signatory name: Sarah Lee\nSignatory designation: Engineering Manager"
+)
+
+
+def draft_section(messages):
+    """Tool responder: a section for the gap the prompt asks about, or the letter's details"""
+    if "LETTER DETAILS" in messages[0].content:
+        return LETTER
+    match = re.search(r"Performance gap (\d+) of \d+: (.+)", messages[0].content)
+    number, title = int(match.group(1)), match.group(2).strip()
+    return (
+        f"**Performance gap:** {title}\n"
+        f"Current performance:\n{title} fell short.\n"
+        f"Examples:\nOn January {number}, 2025 concerns were raised.\n"
+        f"Expected performance\nAs a QA lead for the Platform team, you were expected to handle {title.lower()}.\n"
+        f"Goal: Fix {title.lower()} within 30 days\n"
+        f"Action Plans:\n1. Step one for {title}\n2. Step two for {title}\n"
+        f"Support & Resources:\n- Weekly check-ins with your manager\n- Training for {title}\n"
+    )
+
+
+def test_section_is_parsed():
+    section = parse_section("Here is the section.\n\n" + draft_section(
+        [type("Message", (), {"content": "Performance gap 2 of 3: Missed Deadlines"})]
+    ))
+    assert section.title == "Missed Deadlines" and section.goal == "Fix missed deadlines within 30 days"
+    assert section.action_plans == ["Step one for Missed Deadlines", "Step two for Missed Deadlines"]
+    assert section.resources[0] == "Weekly check-ins with your manager" and section.is_complete()
+    assert not parse_section("Sorry, I can't help with that.", title="Missed Deadlines").is_complete()
+
+
+def test_gaps_are_drafted_in_parallel_and_assembled_in_order():
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    tool_llm = StubChatModel(responder=draft_section, delay=0.3)
+    tools.comprehensive_pip_generator.create_tool_llm = lambda tool_name=None: tool_llm
+    generator = tools.comprehensive_pip_generator.ComprehensivePIPGeneratorTool()
+    metrics.reset()
+    try:
+        for run in (generator._run, lambda text, state: asyncio.run(generator._arun(text, state=state))):
+            start = time.perf_counter()
+            document = run("Generate the PIP", state=pip_state(3))
+            # Drafted side by side: about as long as one section, not three
+            assert time.perf_counter() - start < 0.6
+            positions = [document.index(f"{n}. {title}") for n, title in enumerate(TITLES[:3], 1)]
+            assert positions == sorted(positions)
+            steps = document.index("Next steps on expected improvements:")
+            assert [document.index(f"Goal: Fix {t.lower()}", steps) for t in TITLES[:3]] == sorted(
+                document.index(f"Goal: Fix {t.lower()}", steps) for t in TITLES[:3]
+            )
+            assert "Re: QA lead, Performance Improvement Plan" in document
+            assert "Marvin Chin\n1 Jalan Ampang\nKuala Lumpur\n\nDear Marvin Chin," in document
+            assert "Sarah Lee\nEngineering Manager" in document and "Passport No.: _______________" in document
+            assert document.count("- Weekly check-ins with your manager") == 1
+            assert not PLACEHOLDER.search(document)
+        # Three sections and the letter's details each time
+        assert tool_llm.call_count == 8 and metrics.counter("pip_generator.by_gap") == 2
+    finally:
+        tools.comprehensive_pip_generator.create_tool_llm = original
+
+
+def test_no_placeholders_are_left():
+    section = parse_section(draft_section([type("Message", (), {"content": "Performance gap 1 of 1: Late Updates"})]))
+    section.expected_performance = "As a [employee job title] for the [Employee team/sub-team] team, you were expected to"
+    details = parse_letter_details("Employee name: unknown\nAddress: Not provided\nSignatory name: N/A", "QA lead", "")
+    document = assemble_document([section], details)
+    assert not PLACEHOLDER.search(document)
+    assert "As a QA lead for the _______________ team" in document
+    # No address lines when there is no address; blanks for the rest
+    assert document.startswith(f"{letter_date()}\n\n_______________\n\nDear _______________,")
+    assert "Sincerely,\n\n\n\n\n_______________\n_______________" in document
+    assert not PLACEHOLDER.search(assemble_document([section]))
+
+
+def test_unusable_draft_falls_back_to_one_completion():
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    tool_llm = StubChatModel(responder=lambda messages: "Dear ..." if "Performance gap 1" not in messages[0].content
+                             else "I need more information.")
+    tools.comprehensive_pip_generator.create_tool_llm = lambda tool_name=None: tool_llm
+    generator = tools.comprehensive_pip_generator.ComprehensivePIPGeneratorTool()
+    metrics.reset()
+    try:
+        assert generator._run("Generate the PIP", state=pip_state(1)) == "Dear ..."
+        assert tool_llm.call_count == 3 and metrics.counter("pip_generator.incomplete_sections") == 1
+        # Gaps the record missed, or the pipeline switched off: straight to one completion
+        state = pip_state(2)
+        state["pip_phase"]["gaps"] = 3
+        assert generator._run("Generate the PIP", state=state) == "Dear ..."
+        os.environ["PIP_PARALLEL_SECTIONS"] = "0"
+        try:
+            assert generator._run("Generate the PIP", state=pip_state(2)) == "Dear ..."
+        finally:
+            os.environ.pop("PIP_PARALLEL_SECTIONS")
+        assert tool_llm.call_count == 5
+    finally:
+        tools.comprehensive_pip_generator.create_tool_llm = original
+
+
+def benchmark_gap_sections(section_seconds=0.5, gap_counts=(1, 3, 5)):
+    """
+    Seconds to generate a PIP with each number of gaps, in one completion or by gap.
+
+    The stub takes section_seconds per gap it writes, as generation time grows with the
+    tokens written: one completion takes that times the gaps, a section draft takes it once.
+    """
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    section_concurrency = tools.comprehensive_pip_generator.section_concurrency
+
+    def responder(messages):
+        if "SECTION WRITER" in messages[0].content:
+            time.sleep(section_seconds)
+            return draft_section(messages)
+        if "LETTER DETAILS" in messages[0].content:
+            # A few short lines
+            time.sleep(section_seconds / 5)
+            return LETTER
+        time.sleep(section_seconds * gaps)
+        return "Dear ..."
+
+    generator = tools.comprehensive_pip_generator.ComprehensivePIPGeneratorTool()
+    tools.comprehensive_pip_generator.create_tool_llm = lambda tool_name=None: StubChatModel(responder=responder)
+    try:
+        for gaps in gap_counts:
+            timings = []
+            for parallel in ("0", "1"):
+                os.environ["PIP_PARALLEL_SECTIONS"] = parallel
+                start = time.perf_counter()
+                generator._run("Generate the PIP", state=pip_state(gaps))
+                timings.append(time.perf_counter() - start)
+            print(f"{gaps} gaps: one completion {timings[0]:.2f}s, "
+                  f"by gap {timings[1]:.2f}s ({section_concurrency()} at once)")
+    finally:
+        os.environ.pop("PIP_PARALLEL_SECTIONS", None)
+        tools.comprehensive_pip_generator.create_tool_llm = original
+
+
+def benchmark_document_turn(threads=20, delay=0.2):
+    """Seconds for a document turn on each of several Slack threads at once, and store reads made"""
+    original = tools.comprehensive_pip_generator.create_tool_llm
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            store, tool_llm = setup(tmp, delay=delay)
+            thread_ids = [f"slack-C1-{i}.0" for i in range(threads)]
+            for i, thread_id in enumerate(thread_ids):
+                seed(thread_id, ROLES[i % len(ROLES)])
+            store.reads.clear()
+
+            async def main():
+                await asyncio.gather(*(agent.achat_with_memory("Generate it", thread_id=t) for t in thread_ids))
+
+            start = time.perf_counter()
+            asyncio.run(main())
+            seconds = time.perf_counter() - start
+            print(f"{threads} threads: {seconds:.2f}s, {len(store.reads) / threads:.0f} store read per turn")
+    finally:
+        teardown(original)
+
+
+if __name__ == "__main__":
+    test_concurrent_threads_get_their_own_pip()
+    test_async_threads_get_their_own_pip()
+    test_section_is_parsed()
+    test_gaps_are_drafted_in_parallel_and_assembled_in_order()
+    test_no_placeholders_are_left()
+    test_unusable_draft_falls_back_to_one_completion()
+    print("PIP generator tests passed\n")
+    benchmark_document_turn()
+    print()
+    benchmark_gap_sections()
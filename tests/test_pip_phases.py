@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Tests and benchmark for routing turns with the PIP phase tracker.
+
+Runs offline against stubbed chat models. Execute directly to measure how often the
+tracker routes the turns of the recorded threads in memory/conversation_memory.json and
+how often it picks the tool that actually answered, and the latency of a routed turn
+against one the agent plans:
+
+    python tests/test_pip_phases.py
+"""
+
+import sys
+import json
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import src.agent as agent
+import tools.employee_info_extractor
+import tools.performance_gap_analyzer
+from src.memory_store import SQLiteConversationStore, set_conversation_store, to_langchain_messages
+from src.metrics import metrics
+from src.pip_phases import DONE, GAPS, IMPROVEMENT, PHASE_TOOLS, SUPPORT, PhaseTracker, classify
+from src.runtime import AgentRuntime, set_agent_runtime
+from tests.stub_model import StubChatModel
+
+RECORDED_THREADS = Path(__file__).parent.parent / "memory" / "conversation_memory.json"
+
+
+def tracker_after(*replies):
+    """A tracker that has seen replies, each answered with "answer" """
+    messages = []
+    for reply in replies:
+        messages += [HumanMessage(content="answer"), AIMessage(content=reply)]
+    return PhaseTracker.replay(messages)
+
+
+def test_replies_are_placed():
+    assert classify("Thanks. What is the employee's job title or role?") == ("employee_info", "role", "answer")
+    assert classify("What is the performance gap title?") == (GAPS, "title", "answer")
+    assert classify("Score: 75%. Would you like to refine this summary, or are you satisfied with it?") == (
+        GAPS, "current_performance", "confirm"
+    )
+    assert classify("Are there any other performance gaps you'd like to discuss?") == (GAPS, "more_gaps", "answer")
+    assert classify('What are the actionable steps to achieve this goal?') == (IMPROVEMENT, "action_steps", "answer")
+    assert classify("What support and resources are available to help?") == (SUPPORT, "resources", "answer")
+    assert classify("The performance gap information collection is complete.")[::2] == (GAPS, "complete")
+    assert classify("How can I help you today?") is None
+
+
+def test_tracker_follows_the_flow():
+    tracker = tracker_after("What is the employee's job title or role?")
+    assert tracker.route("QA lead") == PHASE_TOOLS["employee_info"]
+    tracker = tracker_after("What is the employee's job title or role?", "Would you like to refine this role?")
+    assert tracker.route("Senior QA lead") == PHASE_TOOLS["employee_info"]
+    tracker = tracker_after("What is the performance gap title?", "What is the Current Performance Summary?")
+    assert tracker.route("Updates only come when asked") == PHASE_TOOLS[GAPS]
+    tracker = tracker_after("What is the performance gap title?", "What is the goal for improvement?")
+    assert tracker.route("Weekly updates") == PHASE_TOOLS[IMPROVEMENT]
+
+    # Two gaps: the plan moves on to support only after the second
+    gaps = ("What is the performance gap title?", "What is the expected performance?") * 2
+    refine = "Would you like to refine these action steps, or are you satisfied with them?"
+    tracker = tracker_after(*gaps, "What is the goal for improvement?", refine)
+    assert (tracker.gaps, tracker.round) == (2, 1)
+    tracker = tracker_after(*gaps, "What is the goal for improvement?", refine, "What is the goal for improvement?", refine)
+    assert (tracker.phase, tracker.round) == (IMPROVEMENT, 2)
+    assert [gap.title for gap in tracker.record.gaps] == ["answer", "answer"]
+
+    # The document is left to the agent, which gathers what the generator needs
+    support = "Would you like to refine these support resources, or are you satisfied?"
+    tracker = tracker_after(*gaps[:2], "What is the goal for improvement?", refine, support)
+    assert tracker.route("looks good") is None
+    document = ToolMessage(content="Dear ...", name="comprehensive_pip_generator", tool_call_id="1")
+    tracker.observe([HumanMessage(content="x")] * tracker.seen + [document])
+    assert tracker.phase == DONE and tracker.route("thanks, one more change") is None
+
+
+def test_last_question_of_each_phase_goes_to_the_agent():
+    """Answers that can move the flow to another gap or phase are the agent's to place"""
+    last_questions = (
+        ("What team or department does the employee work in?", "Platform"),
+        ("Would you like to refine this team, or are you satisfied?", "satisfied"),
+        ("What is the expected performance?", "Weekly updates without being asked"),
+        ("Would you like to refine the expected performance, or are you satisfied?", "satisfied"),
+        ("Are there any more performance gaps to discuss?", "yes"),
+        ("Are there any more performance gaps to discuss?", "no"),
+        ("The performance gap information collection is complete.", "ok"),
+        ("What are the actionable steps to achieve this goal?", "Send a weekly summary"),
+        ("Would you like to refine these action steps, or are you satisfied with them?", "satisfied"),
+        ("What support and resources are available to help?", "nope"),
+        ("Would you like to refine these support resources, or are you satisfied?", "looks good"),
+    )
+    for question, answer in last_questions:
+        tracker = tracker_after("What is the performance gap title?", question)
+        assert tracker.slot is not None or tracker.mode == "complete", question
+        assert tracker.route(answer) is None, question
+    # Older variants' extra questions aren't routed either
+    assert tracker_after("What is the name of the employee's manager?").route("sarah") is None
+
+
+def test_free_form_input_goes_to_the_agent():
+    tracker = tracker_after("What is the performance gap title?")
+    assert tracker.route("Missed deadlines") == PHASE_TOOLS[GAPS]
+    for text in ("What does a good title look like?", "can you explain", "Go back to the role", "hi"):
+        assert tracker.route(text) is None
+    assert tracker_after("How can I help you today?").route("Missed deadlines") is None
+    assert PhaseTracker().route("Missed deadlines") is None
+
+
+def use_tools(responder):
+    """Point the employee info and gap tools at one stub model; returns it and a restore function"""
+    tool_llm = StubChatModel(responder=responder)
+    modules = (tools.employee_info_extractor, tools.performance_gap_analyzer)
+    originals = [module.create_tool_llm for module in modules]
+    for module in modules:
+        module.create_tool_llm = lambda tool_name=None: tool_llm
+
+    def restore():
+        for module, original in zip(modules, originals):
+            module.create_tool_llm = original
+    return tool_llm, restore
+
+
+def call_employee_tool(messages):
+    """Agent responder: hand every turn to the employee info extractor"""
+    return AIMessage(content="", tool_calls=[
+        {"name": "employee_info_extractor", "args": {"input_text": messages[-1].content}, "id": f"call-{len(messages)}"}
+    ])
+
+
+def test_routed_turn_skips_the_agent():
+    metrics.reset()
+    model = StubChatModel(responder=call_employee_tool)
+    questions = iter([
+        "What is the employee's job title or role?", "Would you like to refine this role, or are you satisfied?",
+        "How can I help?", "x"
+    ])
+    tool_llm, restore = use_tools(lambda messages: next(questions))
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver,
+        phase_routing=True
+    ))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            assert agent.chat_with_memory("Start a PIP", thread_id="t1") == "What is the employee's job title or role?"
+            assert model.call_count == 1
+            assert agent.chat_with_memory("QA lead", thread_id="t1") == (
+                "Would you like to refine this role, or are you satisfied?"
+            )
+            # Straight to the tool, which is told what it asked and what the answer was
+            assert model.call_count == 1 and tool_llm.call_count == 2
+            tool_input = tool_llm.calls[1][-1].content
+            assert "job title or role?" in tool_input and tool_input.endswith("QA lead")
+            # A lost checkpoint is rebuilt from the stored transcript
+            agent.get_agent_runtime().forget_thread("t1")
+            assert agent.chat_with_memory("Senior QA lead", thread_id="t1") == "How can I help?"
+            assert model.call_count == 1
+            # The tool asked something the tracker can't place: back to the agent
+            agent.chat_with_memory("Something else", thread_id="t1")
+            assert model.call_count == 2
+            set_conversation_store(None)
+    finally:
+        restore()
+        set_agent_runtime(None)
+    assert metrics.counter("routing.routed") == 2
+    assert metrics.counter("routing.fallback") == 2
+
+
+def test_async_routed_turn():
+    model = StubChatModel(responder=call_employee_tool)
+    tool_llm, restore = use_tools(lambda messages: "What team or department?")
+    runtime = AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver,
+        phase_routing=True
+    )
+    history = [HumanMessage(content="Start"), AIMessage(content="What is the employee's job title or role?"),
+               HumanMessage(content="QA lead")]
+    partials = []
+    try:
+        state = asyncio.run(runtime.ainvoke(history, thread_id="t1", on_partial=partials.append))
+    finally:
+        restore()
+    assert state["messages"][-1].content == "What team or department?"
+    assert model.call_count == 0 and partials
+    assert state["pip_phase"]["slot"] == "role"
+
+
+def recorded_turns(path=RECORDED_THREADS):
+    """(history, user text, next reply) for every answered turn of the recorded threads"""
+    with open(path) as f:
+        threads = json.load(f)
+    for thread in threads.values():
+        messages = to_langchain_messages(thread.get("messages", []))
+        for i, message in enumerate(messages[:-1]):
+            if message.type == "human" and messages[i + 1].type == "ai":
+                yield messages[:i], message.content, messages[:i + 2]
+
+
+def benchmark_routing_accuracy(path=RECORDED_THREADS):
+    """
+    How often the tracker routes a recorded turn, and how often to the tool that answered.
+
+    The answering tool is the phase the recorded reply put the thread in; the tracker
+    only sees the messages before the turn.
+    """
+    if not Path(path).exists():
+        print(f"No recorded threads at {path}")
+        return
+    turns = routed = correct = 0
+    for history, user_text, answered in recorded_turns(path):
+        turns += 1
+        tool = PhaseTracker.replay(history).route(user_text)
+        if tool is None:
+            continue
+        routed += 1
+        after = PhaseTracker.replay(answered)
+        expected = PHASE_TOOLS["document"] if after.phase == DONE else PHASE_TOOLS.get(after.phase)
+        correct += tool == expected and (after.slot is not None or after.mode is not None or after.phase == DONE)
+    print(f"Recorded turns: {turns}; routed {routed} ({routed / turns:.0%}), "
+          f"to the tool that answered {correct} ({correct / routed:.0%} of routed)")
+
+
+def benchmark_turn_latency(turns=10, delay=0.3):
+    """Seconds per answering turn when each model call takes delay, planned by the agent or routed"""
+    for label, routing in (("agent plans", False), ("routed", True)):
+        model = StubChatModel(responder=call_employee_tool, delay=delay)
+        tool_llm, restore = use_tools(lambda messages: "What team or department?")
+        tool_llm.delay = delay
+        runtime = AgentRuntime(
+            model_factory=lambda: model,
+            system_message_factory=lambda reload=False: "You are Leo.",
+            checkpointer_factory=MemorySaver,
+            phase_routing=routing
+        )
+        history = [HumanMessage(content="Start"), AIMessage(content="What is the employee's job title or role?")]
+        start = time.perf_counter()
+        try:
+            for i in range(turns):
+                runtime.invoke(history + [HumanMessage(content="QA lead")], thread_id=f"bench-{i}")
+        finally:
+            restore()
+        seconds = (time.perf_counter() - start) / turns
+        calls = (model.call_count + tool_llm.call_count) / turns
+        print(f"{label:>11}: {calls:.0f} model calls, {seconds * 1000:.0f} ms per turn")
+
+
+if __name__ == "__main__":
+    test_replies_are_placed()
+    test_tracker_follows_the_flow()
+    test_last_question_of_each_phase_goes_to_the_agent()
+    test_free_form_input_goes_to_the_agent()
+    test_routed_turn_skips_the_agent()
+    test_async_routed_turn()
+    print("Phase routing tests passed\n")
+    benchmark_routing_accuracy()
+    print()
+    benchmark_turn_latency()
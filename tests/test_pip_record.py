@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests and benchmark for the per-thread PIP record the question-asking tools are given.
+
+Runs offline against stubbed chat models. Execute directly to compare the input tokens
+of each tool call on the recorded threads in memory/conversation_memory.json: the
+transcript the tools used to be asked to analyze, against the record brief plus the
+last question and answer:
+
+    python tests/test_pip_record.py
+"""
+
+import sys
+import json
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+import tools.performance_gap_analyzer
+from src.context_window import count_tokens
+from src.memory_store import to_langchain_messages
+from src.pip_phases import PHASE_TOOLS, TOOL_PHASES, PhaseTracker, suggested_revision
+from src.pip_record import GapRecord, PIPRecord
+from src.runtime import AgentRuntime
+from tests.stub_model import StubChatModel
+
+RECORDED_THREADS = Path(__file__).parent.parent / "memory" / "conversation_memory.json"
+
+REFINE_TITLE = (
+    "This title is at 70% match with our guidelines. It is too long.\n\n"
+    "I suggest a more concise version: \"Late Task Updates\"\n\n"
+    "Would you like to refine this title, or are you satisfied with it and ready to move to the next question?"
+)
+
+
+def conversation(*turns):
+    """Messages for (reply, answer) pairs"""
+    messages = []
+    for reply, answer in turns:
+        messages += [AIMessage(content=reply), HumanMessage(content=answer)]
+    return messages
+
+
+def test_answers_are_recorded_when_confirmed():
+    messages = conversation(
+        ("What is the employee's job title or role?", "QA lead"),
+        ("Would you like to refine this role, or are you satisfied with it?", "satisfied"),
+        ("What team or department does the employee work in?", "Platform"),
+        ("What is the performance gap title?", "The employee does not update anyone about tasks"),
+    )
+    tracker = PhaseTracker.replay(messages)
+    # The role was accepted, the team kept when the tool moved on; the title waits for confirmation
+    assert (tracker.record.role, tracker.record.team) == ("QA lead", "Platform")
+    assert tracker.record.gaps == [] and tracker.pending["slot"] == "title"
+    messages += [AIMessage(content=REFINE_TITLE)]
+    tracker.observe(messages)
+    assert tracker.pending["suggestion"] == "Late Task Updates"
+    messages += [HumanMessage(content="use the suggested version")]
+    tracker.observe(messages)
+    assert tracker.record.gaps == [GapRecord(title="Late Task Updates")]
+    # A refined answer replaces the pending one
+    messages += conversation(
+        ("What is the Current Performance Summary?", "Slow"),
+        ("Would you like to refine this summary, or are you satisfied with it?", "Updates only come when asked"),
+        ("What are the examples of performance gaps?", "On January 15, 2025 ..."),
+    )
+    tracker.observe(messages)
+    assert tracker.record.gaps[0].current_performance == "Updates only come when asked"
+    assert PhaseTracker.from_dict(tracker.as_dict()).as_dict() == tracker.as_dict()
+
+
+def test_each_tool_sees_its_slice():
+    record = PIPRecord(role="QA lead", team="Platform", gaps=[
+        GapRecord(title="Late Task Updates", examples="On January 15 ...", goal="Weekly updates"),
+        GapRecord(title="Missed Deadlines", expected_performance="Deliver on time", goal="Ship by the due date"),
+    ])
+    plan = record.brief("improvement_plan_analyzer", gap=1)
+    assert "Late Task Updates" in plan and "Ship by the due date" in plan and "Deliver on time" in plan
+    assert "Weekly updates" not in plan and "January 15" not in plan
+    gaps = record.brief("performance_gap_analyzer", gap=0)
+    assert "January 15" in gaps and "Weekly updates" not in gaps
+    assert record.brief("employee_info_extractor") == "- Employee role: QA lead\n- Team: Platform"
+    assert PIPRecord().brief("performance_gap_analyzer") == ""
+    assert suggested_revision("No suggestion here. Would you like to refine it?") is None
+
+
+def test_tools_are_given_the_record():
+    """The record reaches the tool whether the turn is routed or planned by the agent"""
+    for routing in (True, False):
+        tool_llm = StubChatModel(responder=lambda messages: "What is the Current Performance Summary?")
+        original = tools.performance_gap_analyzer.create_tool_llm
+        tools.performance_gap_analyzer.create_tool_llm = lambda tool_name=None: tool_llm
+        model = StubChatModel(responder=lambda messages: AIMessage(content="", tool_calls=[
+            {"name": "performance_gap_analyzer", "args": {"input_text": messages[-1].content}, "id": "call-1"}
+        ]))
+        runtime = AgentRuntime(
+            model_factory=lambda: model,
+            system_message_factory=lambda reload=False: "You are Leo.",
+            checkpointer_factory=MemorySaver,
+            phase_routing=routing
+        )
+        history = conversation(
+            ("What is the employee's job title or role?", "QA lead"),
+            ("What team or department does the employee work in?", "Platform"),
+        ) + [AIMessage(content="What is the performance gap title?"), HumanMessage(content="Late Task Updates")]
+        try:
+            runtime.invoke(history, thread_id="t1")
+        finally:
+            tools.performance_gap_analyzer.create_tool_llm = original
+        tool_input = tool_llm.calls[0][-1].content
+        assert tool_input.startswith("PIP record so far:\n- Employee role: QA lead\n- Team: Platform")
+        assert "Last question: title (asked)" in tool_input
+        assert model.call_count == (0 if routing else 1)
+
+
+def benchmark_tool_input_tokens(path=RECORDED_THREADS):
+    """Input tokens per tool call on the recorded threads: the transcript so far, or the brief"""
+    if not Path(path).exists():
+        print(f"No recorded threads at {path}")
+        return
+    with open(path) as f:
+        threads = json.load(f)
+    sizes = {tool: ([], []) for tool in PHASE_TOOLS.values() if TOOL_PHASES[tool] != "document"}
+    for thread in threads.values():
+        messages = to_langchain_messages(thread.get("messages", []))
+        tracker = PhaseTracker()
+        for i, message in enumerate(messages):
+            tracker.observe(messages[:i])
+            if message.type != "human" or tracker.phase not in TOOL_PHASES.values() or tracker.slot is None:
+                continue
+            tool = PHASE_TOOLS[tracker.phase]
+            if tool not in sizes:
+                continue
+            last_reply = next((m.content for m in reversed(messages[:i]) if m.type == "ai"), None)
+            transcript = "\n\n".join(f"{m.type}: {m.content}" for m in messages[:i + 1])
+            brief = tracker.brief(tool)
+            sizes[tool][0].append(count_tokens(transcript))
+            sizes[tool][1].append(count_tokens(f"{brief}\n\n{tracker.tool_input(message.content, last_reply)}"))
+    total_before = total_after = 0
+    for tool, (before, after) in sizes.items():
+        if before:
+            total_before += sum(before)
+            total_after += sum(after)
+            print(f"{tool:>30}: {len(before):3d} calls, {sum(before) / len(before):6.0f} -> "
+                  f"{sum(after) / len(after):4.0f} input tokens per call")
+    print(f"{'all tools':>30}: {total_before / max(total_after, 1):.1f}x fewer input tokens")
+
+
+if __name__ == "__main__":
+    test_answers_are_recorded_when_confirmed()
+    test_each_tool_sees_its_slice()
+    test_tools_are_given_the_record()
+    print("PIP record tests passed\n")
+    benchmark_tool_input_tokens()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for per-user and global admission control.
+
+Execute directly to see how long a second user waits behind one user pasting a burst of
+messages, with and without per-user limits.
+"""
+
+import sys
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.metrics import metrics
+from src.rate_limit import AdmissionController, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_queues_at_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 1.0, 2.0]
+    clock.now += 10
+    # Refilled, but never beyond the burst
+    assert bucket.tokens == 2
+
+
+def test_over_limit_turns_are_queued_in_order():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate=60, user_burst=2, global_rate=0, clock=clock)
+    assert [controller.reserve_user("U1") for _ in range(4)] == [0.0, 0.0, 1.0, 2.0]
+
+
+def test_users_have_separate_buckets():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate=6, user_burst=1, global_rate=600, global_burst=100, clock=clock)
+    assert controller.reserve_user("U1") == 0.0
+    assert controller.reserve_user("U1") == 10.0
+    assert controller.reserve_user("U2") == 0.0
+
+
+def test_global_limit_applies_across_users():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate=0, global_rate=60, global_burst=2, clock=clock)
+    assert [controller.reserve_user(f"U{i}") for i in range(3)] == [0.0, 0.0, 0.0]
+    assert [controller.reserve_global() for _ in range(3)] == [0.0, 0.0, 1.0]
+
+
+def test_turn_waiting_too_long_is_rejected_and_refunded():
+    metrics.reset()
+    clock = FakeClock()
+    controller = AdmissionController(user_rate=60, user_burst=1, global_rate=0, max_queue_seconds=1.5, clock=clock)
+    assert controller.reserve_user("U1") == 0.0
+    assert controller.reserve_user("U1") == 1.0
+    assert controller.reserve_user("U1") is None
+    assert controller.admit("U1", lambda: None) is None
+    assert metrics.counter("ratelimit.rejected") == 2
+    # The rejected turns gave their tokens back, so the queue did not grow
+    clock.now += 1
+    assert controller.reserve_user("U1") == 1.0
+
+
+def test_admit_starts_queued_turns_in_order():
+    metrics.reset()
+    controller = AdmissionController(user_rate=600, user_burst=2, global_rate=0)
+    started = []
+    done = threading.Event()
+
+    def start(i):
+        started.append(i)
+        if len(started) == 5:
+            done.set()
+
+    delays = [controller.admit("U1", lambda i=i: start(i)) for i in range(5)]
+    # Two start at once; the rest queue instead of failing, 0.1s apart
+    assert delays[:2] == [0.0, 0.0] and started[:2] == [0, 1]
+    assert all(delay > 0 for delay in delays[2:])
+    assert done.wait(5)
+    assert started == [0, 1, 2, 3, 4]
+    assert metrics.counter("ratelimit.queued") == 3
+    assert metrics.counter("ratelimit.admitted") == 5
+    assert metrics.gauge("ratelimit.waiting") == 0
+    assert metrics.snapshot()["summaries"]["ratelimit.queue_seconds"]["count"] == 3
+
+
+def test_idle_users_are_forgotten_first():
+    controller = AdmissionController(user_rate=60, user_burst=1, global_rate=0, max_users=2, clock=FakeClock())
+    for user in ("U1", "U2", "U1", "U3"):
+        controller.reserve_user(user)
+    assert list(controller._users) == ["U1", "U3"]
+
+
+def other_user_wait(user_rate, flood=30):
+    """Seconds before U2's one message may start after U1 pastes flood messages at once"""
+    controller = AdmissionController(
+        user_rate=user_rate, user_burst=3, global_rate=60, global_burst=10,
+        max_queue_seconds=3600, clock=FakeClock()
+    )
+    for _ in range(flood):
+        # U1's turns over the user limit wait for their user token before taking a global one
+        if controller.reserve_user("U1") == 0:
+            controller.reserve_global()
+    return controller.reserve_user("U2") + controller.reserve_global()
+
+
+if __name__ == "__main__":
+    test_bucket_allows_a_burst_then_queues_at_the_rate()
+    test_over_limit_turns_are_queued_in_order()
+    test_users_have_separate_buckets()
+    test_global_limit_applies_across_users()
+    test_turn_waiting_too_long_is_rejected_and_refunded()
+    test_admit_starts_queued_turns_in_order()
+    test_idle_users_are_forgotten_first()
+    print("Rate limit tests passed\n")
+
+    print(f"U2 waits {other_user_wait(user_rate=0):.0f}s behind a 30-message paste with only a global limit")
+    print(f"U2 waits {other_user_wait(user_rate=6):.0f}s with per-user limits as well")
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Tests for the idempotent response cache used for redelivered Slack events.
+"""
+
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.dedup import EventDeduplicator
+from src.dispatch import EventDispatcher
+from src.metrics import metrics
+from src.response_cache import ResponseCache, areplay, replay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Bot:
+    """The listener flow from main.py: dedup, then either replay or dispatch a turn"""
+
+    def __init__(self, turn_seconds=0.05, fail_first_post=False):
+        self.cache = ResponseCache(ttl=60, max_entries=100)
+        self.deduplicator = EventDeduplicator()
+        self.dispatcher = EventDispatcher(workers=2, max_queue=10)
+        self.turn_seconds = turn_seconds
+        self.fail_first_post = fail_first_post
+        self.model_calls = 0
+        self.posts = []
+
+    def post(self, text):
+        if self.fail_first_post:
+            self.fail_first_post = False
+            raise ConnectionError("Slack unavailable")
+        self.posts.append(text)
+
+    def respond(self, event_id, entry):
+        self.model_calls += 1
+        time.sleep(self.turn_seconds)
+        response = f"Answer to {event_id}"
+        try:
+            self.post(response)
+            entry.mark_delivered()
+        finally:
+            entry.complete(response)
+
+    def on_event(self, event_id):
+        if not self.deduplicator.claim(event_id):
+            entry = self.cache.get(event_id)
+            if entry is not None:
+                replay(entry, self.post)
+            return
+        entry = self.cache.start(event_id)
+        self.dispatcher.submit(event_id, self.respond, event_id, entry)
+
+
+def test_cache_is_bounded_and_expires():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=60, max_entries=2, clock=clock)
+    first = cache.start("C1:1")
+    assert cache.start("C1:1") is first
+    cache.start("C1:2")
+    cache.start("C1:3")
+    assert cache.get("C1:1") is None and len(cache) == 2
+    clock.now += 61
+    assert cache.get("C1:3") is None and len(cache) == 0
+
+
+def test_retry_in_flight_attaches_to_the_running_turn():
+    metrics.reset()
+    bot = Bot(turn_seconds=0.1)
+    bot.on_event("C1:1")
+    time.sleep(0.02)
+    bot.on_event("C1:1")
+    bot.on_event("C1:1")
+    bot.dispatcher.shutdown()
+    assert bot.model_calls == 1
+    # The first attempt delivered the reply, so the retries posted nothing
+    assert bot.posts == ["Answer to C1:1"]
+    assert metrics.counter("responses.redelivered_in_flight") == 2
+
+
+def test_retry_after_completion_reposts_only_undelivered_replies():
+    metrics.reset()
+    bot = Bot(turn_seconds=0, fail_first_post=True)
+    bot.on_event("C1:1")
+    bot.dispatcher.shutdown()
+    assert bot.posts == []
+
+    # Slack retries because the reply never arrived: re-post it without the model
+    bot.on_event("C1:1")
+    bot.on_event("C1:1")
+    assert bot.model_calls == 1
+    assert bot.posts == ["Answer to C1:1"]
+    assert metrics.counter("responses.reposted") == 1
+    assert metrics.counter("responses.redelivered_after_completion") == 2
+
+
+def test_failed_repost_can_be_retried():
+    cache = ResponseCache()
+    entry = cache.start("C1:1")
+    entry.complete("reply")
+    posts = []
+
+    def flaky(text):
+        if not posts:
+            posts.append(None)
+            raise ConnectionError("Slack unavailable")
+        posts.append(text)
+
+    try:
+        replay(entry, flaky)
+    except ConnectionError:
+        pass
+    replay(entry, flaky)
+    replay(entry, flaky)
+    assert posts == [None, "reply"]
+
+
+def test_concurrent_retries_post_once():
+    cache = ResponseCache()
+    entry = cache.start("C1:1")
+    posts = []
+    lock = threading.Lock()
+
+    def post(text):
+        with lock:
+            posts.append(text)
+
+    for _ in range(20):
+        replay(entry, post)
+    threads = [threading.Thread(target=replay, args=(entry, post)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    entry.complete("reply")
+    for thread in threads:
+        thread.join()
+    assert posts == ["reply"]
+
+
+def test_failed_turn_releases_waiting_retries():
+    cache = ResponseCache()
+    entry = cache.start("C1:1")
+    posts = []
+    replay(entry, posts.append)
+    entry.fail(RuntimeError("worker died"))
+    assert posts == []
+
+
+def test_async_retry_awaits_the_running_turn():
+    cache = ResponseCache()
+
+    async def main():
+        entry = cache.start("C1:1")
+        posts = []
+
+        async def post(text):
+            posts.append(text)
+
+        async def turn():
+            await asyncio.sleep(0.05)
+            # The first attempt's post failed, so the waiting retry delivers it
+            entry.complete("reply")
+
+        await asyncio.gather(turn(), areplay(entry, post), areplay(entry, post))
+        await areplay(entry, post)
+        return posts
+
+    assert asyncio.run(main()) == ["reply"]
+
+
+if __name__ == "__main__":
+    test_cache_is_bounded_and_expires()
+    test_retry_in_flight_attaches_to_the_running_turn()
+    test_retry_after_completion_reposts_only_undelivered_replies()
+    test_failed_repost_can_be_retried()
+    test_concurrent_retries_post_once()
+    test_failed_turn_releases_waiting_retries()
+    test_async_retry_awaits_the_running_turn()
+    print("Response cache tests passed")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming replies into Slack with throttled chat.update edits.
+
+Runs offline against the stub chat model and a fake Slack client. Execute directly to
+compare time to first visible token with time to the full reply.
+"""
+
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from slack_sdk.errors import SlackApiError
+
+import src.agent as agent
+import tools.employee_info_extractor
+from src.memory_store import SQLiteConversationStore, set_conversation_store
+from src.metrics import metrics
+from src.runtime import AgentRuntime, set_agent_runtime
+from src.slack_streaming import CURSOR, PLACEHOLDER, AsyncSlackStreamer, SlackStreamer
+from tests.stub_model import StubChatModel
+
+REPLY = " ".join(f"word{i}" for i in range(40))
+
+
+def rate_limited(retry_after):
+    return SlackApiError("ratelimited", SimpleNamespace(status_code=429, headers={"Retry-After": str(retry_after)}))
+
+
+class FakeSlackClient:
+    """Records chat.postMessage / chat.update calls; can fail the first few updates"""
+
+    def __init__(self, fail_updates=(), fail_post=False):
+        self.calls = []
+        self.fail_updates = list(fail_updates)
+        self.fail_post = fail_post
+
+    def chat_postMessage(self, channel, thread_ts, text):
+        if self.fail_post:
+            raise SlackApiError("not_in_channel", SimpleNamespace(status_code=200, headers={}))
+        self.calls.append(("post", time.monotonic(), text))
+        return {"ts": "1000.0001"}
+
+    def chat_update(self, channel, ts, text):
+        if self.fail_updates:
+            raise self.fail_updates.pop(0)
+        self.calls.append(("update", time.monotonic(), text))
+        return {"ok": True}
+
+    @property
+    def updates(self):
+        return [(at, text) for kind, at, text in self.calls if kind == "update"]
+
+
+class AsyncFakeSlackClient(FakeSlackClient):
+    async def chat_postMessage(self, channel, thread_ts, text):
+        return FakeSlackClient.chat_postMessage(self, channel, thread_ts, text)
+
+    async def chat_update(self, channel, ts, text):
+        return FakeSlackClient.chat_update(self, channel, ts, text)
+
+
+def use_runtime(model, direct_tools=None):
+    set_agent_runtime(AgentRuntime(
+        model_factory=lambda: model,
+        system_message_factory=lambda reload=False: "You are Leo.",
+        checkpointer_factory=MemorySaver,
+        direct_tools=direct_tools
+    ))
+
+
+def stream_turn(client, reply=REPLY, token_delay=0.01, min_interval=0.05):
+    """Run one streamed turn; returns the streamer, the reply and the seconds to the full reply"""
+    use_runtime(StubChatModel(responder=lambda messages: reply, token_delay=token_delay))
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        streamer = SlackStreamer(client, "D1", "1000.0000", min_interval=min_interval).start()
+        response = agent.chat_with_memory("Draft the PIP", thread_id="t1", on_partial=streamer.update)
+        total = streamer.finish(response)
+        set_conversation_store(None)
+    set_agent_runtime(None)
+    return streamer, response, total
+
+
+def test_placeholder_is_edited_as_tokens_arrive():
+    client = FakeSlackClient()
+    streamer, response, _ = stream_turn(client)
+    assert response == REPLY
+    assert client.calls[0][0] == "post" and client.calls[0][2] == PLACEHOLDER
+
+    updates = client.updates
+    # Partial edits show a growing prefix of the reply; the last edit is the whole reply
+    assert updates[-1][1] == REPLY
+    partials = [text for _, text in updates[:-1]]
+    assert partials and all(text.endswith(CURSOR) and REPLY.startswith(text[:-len(CURSOR)]) for text in partials)
+    assert [len(text) for text in partials] == sorted(len(text) for text in partials)
+    # The first token became visible well before the reply was complete
+    assert streamer.ttft < updates[-1][0] - streamer.started_at
+
+
+def test_updates_are_throttled():
+    client = FakeSlackClient()
+    stream_turn(client, token_delay=0.01, min_interval=0.1)
+    times = [at for at, _ in client.updates]
+    # 40 tokens 10 ms apart, but no two edits closer than the interval
+    assert len(times) < 10
+    assert all(later - earlier >= 0.095 for earlier, later in zip(times, times[1:]))
+
+
+def test_rate_limit_pauses_updates():
+    metrics.reset()
+    client = FakeSlackClient(fail_updates=[rate_limited(0.2)])
+    stream_turn(client, min_interval=0.01)
+    assert metrics.counter("slack.stream.rate_limited") == 1
+    assert client.updates[-1][1] == REPLY
+    # Nothing was sent during the Retry-After pause
+    first_update = client.updates[0][0]
+    assert first_update - client.calls[0][1] >= 0.2
+
+
+def test_reply_is_posted_without_a_placeholder():
+    client = FakeSlackClient(fail_post=True)
+    streamer = SlackStreamer(client, "D1", "1000.0000", min_interval=0.01).start()
+    streamer.update("partial")
+    client.fail_post = False
+    streamer.finish("full reply")
+    assert [(kind, text) for kind, _, text in client.calls] == [("post", "full reply")]
+
+
+def test_tool_llm_tokens_are_not_streamed():
+    """Only the agent's own reply reaches Slack, not the text generated inside tools"""
+    def responder(messages):
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content="Here is the summary")
+        return AIMessage(content="", tool_calls=[
+            {"name": "employee_info_extractor", "args": {"input_text": last.content}, "id": "call-1"}
+        ])
+
+    original = tools.employee_info_extractor.create_tool_llm
+    tool_llm = StubChatModel(responder=lambda messages: "internal tool analysis")
+    tools.employee_info_extractor.create_tool_llm = lambda tool_name=None: tool_llm
+    client = FakeSlackClient()
+    try:
+        # The agent restates the tool's output itself
+        use_runtime(StubChatModel(responder=responder), direct_tools=())
+        with tempfile.TemporaryDirectory() as tmp:
+            set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            streamer = SlackStreamer(client, "D1", "1000.0000", min_interval=0.01).start()
+            response = agent.chat_with_memory("The role is QA lead", thread_id="t1", on_partial=streamer.update)
+            streamer.finish(response)
+            set_conversation_store(None)
+    finally:
+        tools.employee_info_extractor.create_tool_llm = original
+        set_agent_runtime(None)
+    assert tool_llm.call_count == 1
+    assert response == "Here is the summary"
+    assert all("internal" not in text for _, text in client.updates)
+
+
+def test_direct_tool_reply_is_streamed():
+    """A question-asking tool's own reply is what streams into Slack"""
+    model = StubChatModel(responder=lambda messages: AIMessage(content="", tool_calls=[
+        {"name": "employee_info_extractor", "args": {"input_text": messages[-1].content}, "id": "call-1"}
+    ]))
+    original = tools.employee_info_extractor.create_tool_llm
+    tool_llm = StubChatModel(responder=lambda messages: REPLY, token_delay=0.005)
+    tools.employee_info_extractor.create_tool_llm = lambda tool_name=None: tool_llm
+    client = FakeSlackClient()
+    try:
+        use_runtime(model)
+        with tempfile.TemporaryDirectory() as tmp:
+            set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+            streamer = SlackStreamer(client, "D1", "1000.0000", min_interval=0.01).start()
+            response = agent.chat_with_memory("Hi", thread_id="t1", on_partial=streamer.update)
+            streamer.finish(response)
+            set_conversation_store(None)
+    finally:
+        tools.employee_info_extractor.create_tool_llm = original
+        set_agent_runtime(None)
+    assert response == REPLY
+    assert model.call_count == 1
+    # Partial replies were shown before the tool finished
+    assert len(client.updates) > 2
+    assert client.updates[0][1].startswith("word0")
+
+
+def test_async_streaming():
+    client = AsyncFakeSlackClient()
+    use_runtime(StubChatModel(responder=lambda messages: REPLY, token_delay=0.01))
+
+    async def main():
+        streamer = await AsyncSlackStreamer(client, "D1", "1000.0000", min_interval=0.05).start()
+        response = await agent.achat_with_memory("Draft the PIP", thread_id="t1", on_partial=streamer.update)
+        await streamer.finish(response)
+        return streamer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        set_conversation_store(SQLiteConversationStore(Path(tmp) / "memory.db"))
+        streamer = asyncio.run(main())
+        set_conversation_store(None)
+    set_agent_runtime(None)
+    updates = client.updates
+    assert len(updates) > 1 and updates[-1][1] == REPLY
+    assert streamer.ttft < updates[-1][0] - streamer.started_at
+
+
+if __name__ == "__main__":
+    test_placeholder_is_edited_as_tokens_arrive()
+    test_updates_are_throttled()
+    test_rate_limit_pauses_updates()
+    test_reply_is_posted_without_a_placeholder()
+    test_tool_llm_tokens_are_not_streamed()
+    test_direct_tool_reply_is_streamed()
+    test_async_streaming()
+    print("Slack streaming tests passed\n")
+
+    # 200 tokens at 20 ms each, roughly a long PIP section
+    reply = " ".join(f"word{i}" for i in range(200))
+    streamer, _, total = stream_turn(FakeSlackClient(), reply=reply, token_delay=0.02, min_interval=1.0)
+    print(f"Time to first visible token: {streamer.ttft:.2f}s")
+    print(f"Time to full reply:          {total:.2f}s ({streamer.updates} Slack edits)")
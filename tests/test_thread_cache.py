@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for the write-through hot-thread history cache.
+"""
+
+import sys
+import time
+import tempfile
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import src.agent as agent
+from src.checkpointer import PIPCheckpointSaver
+from src.memory_store import ConcurrentUpdateError, SQLiteConversationStore, set_conversation_store
+from src.runtime import AgentRuntime, set_agent_runtime
+from src.thread_cache import CachedConversationStore
+from tests.stub_model import StubChatModel
+
+
+class CountingStore(SQLiteConversationStore):
+    """SQLite store that counts reads"""
+    reads = 0
+
+    def load_thread(self, thread_id):
+        self.reads += 1
+        return super().load_thread(thread_id)
+
+
+def pair(text):
+    return [{"role": "human", "content": text}, {"role": "ai", "content": f"Echo: {text}"}]
+
+
+def test_hot_thread_turns_do_not_read_the_store():
+    """After the first turn a thread's history and graph checkpoint are served from memory"""
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = PIPCheckpointSaver(Path(tmp) / "checkpoints.db")
+        set_agent_runtime(AgentRuntime(
+            model_factory=StubChatModel,
+            system_message_factory=lambda reload=False: "You are Leo.",
+            checkpointer_factory=lambda: saver
+        ))
+        backing = CountingStore(Path(tmp) / "memory.db")
+        cache = set_conversation_store(CachedConversationStore(backing, max_threads=10))
+        for i in range(5):
+            agent.chat_with_memory(f"turn {i}", thread_id="hot")
+        assert backing.reads == 1
+        assert saver.disk_reads == 1
+        assert cache.stats()["hits"] == 4
+
+        history, version = cache.load_history("hot")
+        assert all(isinstance(m, (HumanMessage, AIMessage)) for m in history)
+        assert len(history) == 10
+        # Written through to the backing store
+        assert backing.load_thread("hot")["version"] == version == 5
+        set_conversation_store(None)
+        set_agent_runtime(None)
+
+
+def test_lru_and_size_limits():
+    """Least recently used threads go first when either limit is exceeded"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CachedConversationStore(SQLiteConversationStore(Path(tmp) / "memory.db"), max_threads=2, max_chars=1500)
+        for thread_id in ("a", "b", "c"):
+            cache.append_messages(thread_id, pair(thread_id))
+            cache.load_history(thread_id)
+        assert cache.stats()["threads"] == 2
+        assert cache.stats()["evictions"] == 1
+
+        cache.load_history("b")
+        cache.append_messages("big", pair("x" * 600))
+        cache.load_history("big")
+        # "c" was least recently used
+        assert list(cache._entries) == ["b", "big"]
+
+        cache.append_messages("big2", pair("y" * 600))
+        cache.load_history("big2")
+        # Two large threads don't fit in max_chars together
+        assert list(cache._entries) == ["big2"]
+        assert cache.stats()["chars"] <= 1500
+
+
+def test_ttl_expiry():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CachedConversationStore(SQLiteConversationStore(Path(tmp) / "memory.db"), ttl_seconds=0.05)
+        cache.append_messages("a", pair("hi"))
+        cache.load_history("a")
+        time.sleep(0.1)
+        cache.load_history("a")
+        assert cache.stats()["misses"] == 2
+
+
+def test_conflict_invalidates_entry():
+    """A write from another process drops the stale cached history"""
+    with tempfile.TemporaryDirectory() as tmp:
+        backing = SQLiteConversationStore(Path(tmp) / "memory.db")
+        cache = CachedConversationStore(backing)
+        cache.append_messages("a", pair("one"))
+        _, version = cache.load_history("a")
+
+        # Another replica appends directly to the shared database
+        SQLiteConversationStore(Path(tmp) / "memory.db").append_messages("a", pair("two"))
+        try:
+            cache.append_messages("a", pair("three"), expected_version=version)
+            assert False, "stale append should fail"
+        except ConcurrentUpdateError:
+            pass
+        history, version = cache.load_history("a")
+        assert [m.content for m in history[::2]] == ["one", "two"]
+        assert version == 2
+
+
+def test_hit_reloads_thread_written_by_another_replica():
+    """A cached history is only served while it matches the store's version"""
+    with tempfile.TemporaryDirectory() as tmp:
+        backing = CountingStore(Path(tmp) / "memory.db")
+        cache = CachedConversationStore(backing)
+        cache.append_messages("a", pair("one"))
+        cache.load_history("a")
+
+        SQLiteConversationStore(Path(tmp) / "memory.db").append_messages("a", pair("two"))
+        history, version = cache.load_history("a")
+        assert [m.content for m in history[::2]] == ["one", "two"]
+        assert version == 2
+        assert cache.stats()["stale_hits"] == 1
+
+        # Trusting the cache without checking serves the stale copy
+        trusting = CachedConversationStore(backing, verify_versions=False)
+        trusting.load_history("a")
+        SQLiteConversationStore(Path(tmp) / "memory.db").append_messages("a", pair("three"))
+        reads = backing.reads
+        assert trusting.load_history("a")[1] == 2
+        assert backing.reads == reads
+
+
+if __name__ == "__main__":
+    test_hot_thread_turns_do_not_read_the_store()
+    test_lru_and_size_limits()
+    test_ttl_expiry()
+    test_conflict_invalidates_entry()
+    test_hit_reloads_thread_written_by_another_replica()
+    print("Thread cache tests passed")
@@ -3,20 +3,64 @@ Comprehensive PIP Generator Tool
 
 This tool generates a comprehensive Performance Improvement Plan (PIP) document based on all the information
 collected from previous tools, following a structured format.
+
+When the thread's PIP record holds its performance gaps, each gap's section is drafted in its own
+completion, several at once (PIP_SECTION_CONCURRENCY), alongside a short one reading the letter's
+details (names, address, signatory). The sections are assembled into the output format in gap order,
+so generation takes about as long as one section rather than one per gap.
 """
 
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import asyncio
+import contextvars
 import os
-from typing import Optional, Type, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Optional, Type, Dict, Any, List
 from pydantic import BaseModel, Field
+from langgraph.prebuilt import InjectedState
+
+from tools.llm import create_tool_llm
 
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 from prompts.output_format import pip_output_format
+from src.dispatch import bulk_work
+from src.metrics import metrics
+from src.pip_document import assemble_document, parse_letter_details, parse_section
+from src.pip_phases import DOCUMENT, TOOL_PHASES, PhaseTracker
+
+def parallel_sections_enabled():
+    """Whether a PIP with recorded gaps is drafted one gap at a time (PIP_PARALLEL_SECTIONS)"""
+    return os.environ.get("PIP_PARALLEL_SECTIONS", "1") != "0"
+
+
+def section_concurrency():
+    """How many gaps' sections are drafted at once (PIP_SECTION_CONCURRENCY)"""
+    return max(1, int(os.environ.get("PIP_SECTION_CONCURRENCY", "4")))
+
+
+def format_conversation_history(messages) -> str:
+    """
+    The thread's conversation as "HUMAN: ..." / "AI: ..." paragraphs.
+
+    The question tools' replies reach the user as tool messages, so they count as the
+    AI's turns; tool calls and earlier documents don't.
+    """
+    conversation_history = ""
+    for message in messages:
+        if message.type == "human":
+            role = "human"
+        elif message.type == "ai" or (message.type == "tool" and TOOL_PHASES.get(message.name, DOCUMENT) != DOCUMENT):
+            role = "ai"
+        else:
+            continue
+        if message.content:
+            conversation_history += f"{role.upper()}: {message.content}\n\n"
+    return conversation_history
+
 
 class ComprehensivePIPGeneratorTool(BaseTool):
     """Tool that generates a comprehensive PIP document based on collected information."""
@@ -32,25 +76,90 @@ class ComprehensivePIPGeneratorTool(BaseTool):
     - Construct a professional PIP document
     """
     
-    def _run(self, input_text: str = "") -> str:
+    def _run(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
         """Run the comprehensive PIP generation process."""
-        # Initialize the LLM
-        llm = ChatOpenAI(
-            model=os.environ.get("ANTHROPIC_MODEL"),
-            api_key=os.environ.get("API_KEY"),
-            base_url=os.environ.get("BASE_URL")
-        )
-        
-        # Import here to avoid circular import
-        from src.agent import load_conversation_memory
-        conversation_memory = load_conversation_memory("default")
-        conversation_history = ""
-        
-        # Convert conversation memory to a string
-        for message in conversation_memory.get("messages", []):
-            role = message.get("role", "")
-            content = message.get("content", "")
-            conversation_history += f"{role.upper()}: {content}\n\n"
+        # A long generation: keep it off the workers quick turns need
+        with bulk_work():
+            section_messages = self._section_messages(input_text, state)
+            if section_messages:
+                llm = create_tool_llm(self.name)
+                # Each draft runs in the caller's context, so it is traced under this tool call
+                contexts = [contextvars.copy_context() for _ in section_messages]
+                with ThreadPoolExecutor(max_workers=min(section_concurrency(), len(section_messages))) as pool:
+                    replies = list(pool.map(
+                        lambda context, messages: context.run(llm.invoke, messages), contexts, section_messages
+                    ))
+                document = self._assemble(replies, state)
+                if document:
+                    return document
+            response = create_tool_llm(self.name).invoke(self._build_messages(input_text, state))
+        return response.content
+    
+    async def _arun(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
+        """Run the comprehensive PIP generation process asynchronously."""
+        section_messages = self._section_messages(input_text, state)
+        if section_messages:
+            llm = create_tool_llm(self.name)
+            slots = asyncio.Semaphore(section_concurrency())
+
+            async def draft(messages):
+                async with slots:
+                    return await llm.ainvoke(messages)
+
+            replies = await asyncio.gather(*(draft(messages) for messages in section_messages))
+            document = self._assemble(replies, state)
+            if document:
+                return document
+        response = await create_tool_llm(self.name).ainvoke(self._build_messages(input_text, state))
+        return response.content
+    
+    def _section_messages(self, input_text: str = "", state: Optional[dict] = None) -> List:
+        """
+        The messages drafting each recorded gap's section, in gap order, then those
+        reading the letter's details (the employee's name and address, the signatory...).
+
+        Empty when the thread has no recorded gaps, its gaps aren't all recorded or
+        PIP_PARALLEL_SECTIONS is off; the whole document is then generated in one
+        completion.
+        """
+        data = (state or {}).get("pip_phase")
+        if not parallel_sections_enabled() or not data:
+            return []
+        tracker = PhaseTracker.from_dict(data)
+        gaps = len(tracker.record.gaps)
+        if not gaps or gaps != tracker.gaps:
+            # No gaps yet, or one was started but never recorded: leave it to the single completion
+            return []
+        conversation_history = format_conversation_history(state.get("messages", []))
+        return [
+            [
+                SystemMessage(content=SECTION_SYSTEM_MESSAGE
+                              .replace("{conversation_history}", conversation_history)
+                              .replace("{pip_record}", tracker.record.brief(self.name, gap))
+                              .replace("{gap_number}", f"{gap + 1} of {gaps}")
+                              .replace("{gap_title}", tracker.record.gaps[gap].title or "(untitled)")),
+                HumanMessage(content=input_text)
+            ]
+            for gap in range(gaps)
+        ] + [[
+            SystemMessage(content=LETTER_SYSTEM_MESSAGE.replace("{conversation_history}", conversation_history)),
+            HumanMessage(content=input_text)
+        ]]
+    
+    def _assemble(self, replies, state: dict) -> Optional[str]:
+        """The document from each gap's drafted section and the letter's details, or None if a draft is unusable"""
+        record = PhaseTracker.from_dict(state["pip_phase"]).record
+        sections = [parse_section(reply.content, gap.title) for reply, gap in zip(replies[:-1], record.gaps)]
+        if not all(section.is_complete() for section in sections):
+            # Fall back to generating the whole document at once
+            metrics.incr("pip_generator.incomplete_sections")
+            return None
+        metrics.incr("pip_generator.by_gap")
+        return assemble_document(sections, parse_letter_details(replies[-1].content, record.role, record.team))
+    
+    def _build_messages(self, input_text: str = "", state: Optional[dict] = None) -> List:
+        """Build the messages sent to the LLM from the active thread's graph state."""
+        conversation_history = format_conversation_history((state or {}).get("messages", []))
         
         # Create a system message that instructs the LLM how to generate a comprehensive PIP document
         system_message = """
@@ -243,10 +352,82 @@ class ComprehensivePIPGeneratorTool(BaseTool):
             HumanMessage(content=input_text)
         ]
         
-        # Get the response from the LLM
-        response = llm.invoke(messages)
-        
-        return response.content
-    
-    def _arun(self, input_text: str = "") -> str:
-        """Run the comprehensive PIP generation process asynchronously."""
+        return messages
+
+
+# Instructions for drafting one performance gap's part of the PIP; the document around
+# the sections is assembled by src.pip_document in the pip_output_format layout
+SECTION_SYSTEM_MESSAGE = """
+        # PERFORMANCE IMPROVEMENT PLAN (PIP) SECTION WRITER
+
+        ## ROLE AND OBJECTIVE
+        You are an expert Human Resource Business Partner drafting ONE performance gap's part of a formal Performance Improvement Plan (PIP). The other gaps are drafted separately and the letter around them is assembled for you, so write ONLY the section for the gap below. Your writing must be:
+        - Professional and empathetic in tone
+        - Legally sound and objective
+        - Clear, specific, and actionable
+        - Focused on performance improvement rather than punishment
+
+        ## THE GAP TO DRAFT
+        Performance gap {gap_number}: {gap_title}
+
+        ## INSTRUCTIONS
+        - Performance gap: generalize the gap into a broader category that names the core behavior or skill rather than the specific context (e.g. instead of "Lack of Progress and Proactive Action on the Visual Automation Tool Evaluation", use "Progress on Assigned Tasks and Timely Communication")
+        - Current performance: a concise 1-2 sentence summary of the core issue, in expectation-focused language (e.g. "Regular progress updates were expected but not consistently provided" rather than "You have not been providing regular updates")
+        - Examples: one chronological narrative combining the specific examples with how the concerns were raised, in the passive voice ("concerns were raised", not "I raised concerns"), with the dates and details given; do not repeat the current performance summary
+        - Expected performance: start with "As a [employee job title] for the [employee team/sub-team] team, you were expected to …"
+        - Goal: a SMART goal of 1-2 lines that starts with an action verb (e.g. "Utilize", "Achieve", "Maintain") and includes its timeline (e.g. "within 30 days")
+        - Action Plans: ONLY the steps given in the conversation, rephrased in grammatically correct sentences without changing their meaning; do not add timelines that weren't given
+        - Support & Resources: ONLY the support and resources given in the conversation for this gap, each with how it helps the employee; do not repeat the action plans
+
+        CRITICAL: Use only facts from the PIP record and the conversation history. Do not invent details, resources or steps, and mention each shortcoming only once.
+
+        ## INPUT
+        PIP RECORD:
+        {pip_record}
+
+        CONVERSATION HISTORY:
+        {conversation_history}
+
+        ## OUTPUT FORMAT
+        Reply with exactly these headings, in this order, and nothing else:
+
+        Performance gap: [generalized title]
+        Current performance:
+        [summary]
+        Examples:
+        [narrative]
+        Expected performance
+        As a [employee job title] for the [employee team/sub-team] team, you were expected to …
+        Goal: [SMART goal including timeline]
+        Action Plans:
+        1. [step]
+        2. [step]
+        Support & Resources:
+        - [resource]
+        """
+
+
+# Instructions for reading the details the letter around the sections needs
+LETTER_SYSTEM_MESSAGE = """
+        # PERFORMANCE IMPROVEMENT PLAN (PIP) LETTER DETAILS
+
+        From the conversation history below, find the details the PIP letter is addressed and signed with:
+        - The employee's full name
+        - The employee's postal address
+        - The employee's identification number (I.D., I.C. or passport number)
+        - The name of the person signing the letter (usually the manager providing the feedback)
+        - The signatory's job title
+
+        CRITICAL: Use only details stated in the conversation. Do not guess or invent any detail; write "unknown" for anything not given.
+
+        CONVERSATION HISTORY:
+        {conversation_history}
+
+        Reply with exactly these lines and nothing else (separate address lines with ";"):
+
+        Employee name: [name or unknown]
+        Address: [address or unknown]
+        Identification number: [number or unknown]
+        Signatory name: [name or unknown]
+        Signatory designation: [job title or unknown]
+        """
@@ -5,12 +5,14 @@ This tool uses the LLM to dynamically gather basic employee information through
 """
 
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-import os
-from typing import Optional, Type, Dict, Any, List
+from typing import Annotated, Optional, Type, Dict, Any, List
 from pydantic import BaseModel, Field
+from langgraph.prebuilt import InjectedState
+
+from tools.llm import create_tool_llm
+from src.pip_phases import tool_brief
 
 class EmployeeInfoExtractorTool(BaseTool):
     """Tool that dynamically gathers basic employee information through conversation."""
@@ -22,22 +24,25 @@ class EmployeeInfoExtractorTool(BaseTool):
     - Employee's team/department
     """
     
-    def _run(self, input_text: str = "") -> str:
+    def _run(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
         """Run the employee info gathering process."""
-        # Initialize the LLM
-        llm = ChatOpenAI(
-            model=os.environ.get("ANTHROPIC_MODEL"),
-            api_key=os.environ.get("API_KEY"),
-            base_url=os.environ.get("BASE_URL")
-        )
-        
+        response = create_tool_llm(self.name).invoke(self._build_messages(input_text, state))
+        return response.content
+    
+    async def _arun(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
+        """Run the employee info gathering process asynchronously."""
+        response = await create_tool_llm(self.name).ainvoke(self._build_messages(input_text, state))
+        return response.content
+    
+    def _build_messages(self, input_text: str = "", state: Optional[dict] = None) -> List:
+        """Build the messages sent to the LLM: the instructions, then the thread's PIP record and the input."""
         # Create a system message that instructs the LLM how to gather employee information
         system_message = """
             You are Leo, an HR assistant specialized in gathering employee information.
             
             CRITICAL INSTRUCTION: You must ask ONLY ONE QUESTION at a time. This is the most important rule.
             
-            Your task is to analyze the conversation history and determine what basic employee information you still need to collect.
+            Your task is to analyze the PIP record (when there is one) and the conversation and determine what basic employee information you still need to collect.
 
             You need to collect:
             1. Employee's job title/role
@@ -55,11 +60,11 @@ class EmployeeInfoExtractorTool(BaseTool):
             - Do not apologize for errors in this case. Instead, acknowledge the information provided and politely ask for the
               additional details needed in a conversational manner
 
-            IMPORTANT: You must carefully analyze the conversation history to determine:
+            IMPORTANT: Use the PIP record at the top of the input (when there is one) and the conversation after it to determine:
             1. What employee information has already been collected
             2. What information still needs to be gathered
             
-            DO NOT ask for information that has already been provided. Use the conversation history to maintain context.
+            DO NOT ask for information that has already been provided. The PIP record holds the answers confirmed so far; use the conversation to maintain context.
             
             The conversation MUST follow this exact flow:
             1. First question: "What is the employee's job title or role?"
@@ -76,17 +81,13 @@ class EmployeeInfoExtractorTool(BaseTool):
             Be conversational and professional. Focus ONLY on gathering the basic employee information listed above, not performance details or improvement plans.
         """
         
-        # Create messages for the LLM
+        # Create messages for the LLM, with the employee details recorded so far
+        record = tool_brief(state, self.name)
+        if record:
+            input_text = f"{record}\n\n{input_text}"
         messages = [
             SystemMessage(content=system_message),
             HumanMessage(content=f"Based on this conversation, what employee information should I ask for next?\n\n{input_text}")
         ]
         
-        # Get the next question or summary from the LLM
-        response = llm.invoke(messages)
-        
-        return response.content
-    
-    def _arun(self, input_text: str = "") -> str:
-        """Run the employee info gathering process asynchronously."""
-        raise NotImplementedError("Async version not implemented")
+        return messages
@@ -0,0 +1,21 @@
+"""
+Tool LLM
+
+Returns the chat model the PIP tools call, so every tool talks to the LiteLLM proxy
+the same way and over the same pooled connections as the agent. Given the tool's name,
+the model keeps to that tool's deadline and hedges slow calls (see src.hedging).
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.hedging import GuardedModel
+from src.llm_client import get_chat_model
+
+
+def create_tool_llm(tool_name=None):
+    """Return the chat model used inside the tools (shared, connection-pooled)"""
+    if tool_name is None:
+        return get_chat_model()
+    return GuardedModel(get_chat_model(), tool_name)
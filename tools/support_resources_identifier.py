@@ -7,12 +7,14 @@ and offers users the opportunity to refine their inputs based on the feedback pr
 """
 
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-import os
-from typing import Optional, Type, Dict, Any, List
+from typing import Annotated, Optional, Type, Dict, Any, List
 from pydantic import BaseModel, Field
+from langgraph.prebuilt import InjectedState
+
+from tools.llm import create_tool_llm
+from src.pip_phases import tool_brief
 
 class SupportResourcesIdentifierTool(BaseTool):
     """Tool that interactively gathers and analyzes support resources one question at a time."""
@@ -30,15 +32,18 @@ class SupportResourcesIdentifierTool(BaseTool):
     - Guide the user through the refinement process if they choose to update their inputs
     """
     
-    def _run(self, input_text: str = "") -> str:
+    def _run(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
         """Run the support resources identification process."""
-        # Initialize the LLM
-        llm = ChatOpenAI(
-            model=os.environ.get("ANTHROPIC_MODEL"),
-            api_key=os.environ.get("API_KEY"),
-            base_url=os.environ.get("BASE_URL")
-        )
-        
+        response = create_tool_llm(self.name).invoke(self._build_messages(input_text, state))
+        return response.content
+    
+    async def _arun(self, input_text: str = "", state: Annotated[Optional[dict], InjectedState] = None) -> str:
+        """Run the support resources identification process asynchronously."""
+        response = await create_tool_llm(self.name).ainvoke(self._build_messages(input_text, state))
+        return response.content
+    
+    def _build_messages(self, input_text: str = "", state: Optional[dict] = None) -> List:
+        """Build the messages sent to the LLM: the instructions, then the thread's PIP record and the input."""
         # Create a system message that instructs the LLM how to gather and analyze support resources
         system_message = """
             You are Leo, an HR assistant specialized in identifying support resources for Performance Improvement Plans (PIPs).
@@ -111,14 +116,14 @@ class SupportResourcesIdentifierTool(BaseTool):
             
             Remember to be conversational and professional. Focus on gathering detailed, actionable information.
             
-            IMPORTANT: You must carefully analyze the conversation history to determine:
+            IMPORTANT: Use the PIP record at the top of the input (when there is one) and the conversation after it to determine:
             1. Which performance gap you're currently on
             2. What information has already been collected
             3. What information still needs to be gathered
             
-            DO NOT ask for information that has already been provided. Use the conversation history to maintain context.
+            DO NOT ask for information that has already been provided. The PIP record holds the answers confirmed so far; use the conversation to maintain context.
             
-            IMPORTANT: You must carefully analyze the conversation history to identify all the performance gaps that were discussed with the performance_gap_analyzer tool. For each of these performance gaps, you need to collect support resources information.
+            IMPORTANT: The PIP record lists all the performance gaps that were discussed with the performance_gap_analyzer tool (if there is no record, identify them from the conversation). For each of these performance gaps, you need to collect support resources information.
             
             The conversation MUST follow this EXACT flow, asking ONE question at a time:
             1. For the first performance gap:
@@ -140,17 +145,11 @@ class SupportResourcesIdentifierTool(BaseTool):
             NEVER deviate from the exact questions listed above.
         """
         
-        # Create messages for the LLM
+        # Create messages for the LLM, with only the part of the PIP record this tool needs
+        record = tool_brief(state, self.name)
         messages = [
             SystemMessage(content=system_message),
-            HumanMessage(content=input_text)
+            HumanMessage(content=f"{record}\n\n{input_text}" if record else input_text)
         ]
         
-        # Get the response from the LLM
-        response = llm.invoke(messages)
-        
-        return response.content
-    
-    def _arun(self, input_text: str = "") -> str:
-        """Run the support resources identification process asynchronously."""
-        raise NotImplementedError("Async version not implemented")
+        return messages